@@ -15,6 +15,7 @@ from models.repo import Repository
 from models.user import User
 from models.resolved_code import Resolved_code
 from models.taskLog import Task
+from models.dashboard_rollup import DashboardRollup
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 
@@ -0,0 +1,68 @@
+"""pr details jsonb
+
+Revision ID: 3d9b7e41c2a8
+Revises: 7a3e9d2b6f14
+Create Date: 2026-10-18 16:22:09.518304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9b7e41c2a8'
+down_revision: Union[str, Sequence[str], None] = '7a3e9d2b6f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PROMOTED_COLUMNS = ['head_ref', 'base_ref', 'head_sha', 'author_login']
+# PR rows are updated on every push, leave room on each page so the new
+# version fits next to the old one (HOT update) instead of on another page
+PR_FILLFACTOR = 90
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for column in PROMOTED_COLUMNS:
+        op.add_column('pr', sa.Column(column, sa.String(), nullable=True))
+
+    # Backfill while details is still text, the type change below rewrites
+    # the table anyway and leaves no dead rows behind
+    op.execute("""
+        UPDATE pr SET
+            head_ref = details::jsonb #>> '{pull_request,head,ref}',
+            base_ref = details::jsonb #>> '{pull_request,base,ref}',
+            head_sha = details::jsonb #>> '{pull_request,head,sha}',
+            author_login = details::jsonb #>> '{pull_request,user,login}'
+        WHERE details IS NOT NULL
+    """)
+
+    op.execute(f"ALTER TABLE pr SET (fillfactor = {PR_FILLFACTOR})")
+    # lz4 compresses and decompresses webhook payloads much faster than the
+    # default pglz, available from Postgres 14. Set in the same statement, after
+    # the type change, so the rewrite stores every converted payload with lz4
+    bind = op.get_bind()
+    lz4 = bind.dialect.server_version_info >= (14,)
+    alter_details = "ALTER TABLE pr ALTER COLUMN details TYPE JSONB USING details::jsonb"
+    if lz4:
+        alter_details += ", ALTER COLUMN details SET COMPRESSION lz4"
+    op.execute(alter_details)
+    if lz4:
+        compression = bind.execute(sa.text(
+            "SELECT attcompression FROM pg_attribute WHERE attrelid = 'pr'::regclass AND attname = 'details'"
+        )).scalar()
+        if compression != 'l':
+            raise RuntimeError(f"pr.details compression is {compression!r} instead of lz4")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    alter_details = "ALTER TABLE pr ALTER COLUMN details TYPE VARCHAR USING details::text"
+    if op.get_bind().dialect.server_version_info >= (14,):
+        alter_details += ", ALTER COLUMN details SET COMPRESSION default"
+    op.execute(alter_details)
+    op.execute("ALTER TABLE pr RESET (fillfactor)")
+    for column in reversed(PROMOTED_COLUMNS):
+        op.drop_column('pr', column)
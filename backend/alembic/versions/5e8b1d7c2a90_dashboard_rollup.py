@@ -0,0 +1,37 @@
+"""dashboard rollup
+
+Revision ID: 5e8b1d7c2a90
+Revises: 9c2f4e1a7b3d
+Create Date: 2026-10-18 11:02:47.190355
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8b1d7c2a90'
+down_revision: Union[str, Sequence[str], None] = '9c2f4e1a7b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rows are built lazily per user by /dashboard and kept up to date by
+    # the refresh_pr_rollup task
+    op.create_table('dashboard_rollup',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('metric', sa.String(), nullable=False),
+    sa.Column('bucket', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'metric', 'bucket')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('dashboard_rollup')
@@ -0,0 +1,28 @@
+"""resolved code routing
+
+Revision ID: 7a3e9d2b6f14
+Revises: c41a6f83d2e5
+Create Date: 2026-10-18 13:05:41.207319
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3e9d2b6f14'
+down_revision: Union[str, Sequence[str], None] = 'c41a6f83d2e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('resolved_code', sa.Column('routing', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('resolved_code', 'routing')
@@ -0,0 +1,30 @@
+"""resolution cache columns
+
+Revision ID: 9c2f4e1a7b3d
+Revises: 467e0d709e51
+Create Date: 2026-10-18 10:12:04.518231
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2f4e1a7b3d'
+down_revision: Union[str, Sequence[str], None] = '467e0d709e51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('resolved_code', sa.Column('cache_hit', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('resolved_code', sa.Column('cached_token_usage', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('resolved_code', 'cached_token_usage')
+    op.drop_column('resolved_code', 'cache_hit')
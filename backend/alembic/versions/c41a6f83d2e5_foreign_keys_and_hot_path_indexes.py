@@ -0,0 +1,71 @@
+"""foreign keys and hot path indexes
+
+Revision ID: c41a6f83d2e5
+Revises: 5e8b1d7c2a90
+Create Date: 2026-10-18 11:48:13.402716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41a6f83d2e5'
+down_revision: Union[str, Sequence[str], None] = '5e8b1d7c2a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (constraint name, table, column, referenced table)
+FOREIGN_KEYS = [
+    ('repositories_user_id_fkey', 'repositories', 'user_id', 'user'),
+    ('pr_repo_id_fkey', 'pr', 'repo_id', 'repositories'),
+    ('merge_conflicts_pr_id_fkey', 'merge_conflicts', 'pr_id', 'pr'),
+    ('resolved_code_merge_conflict_id_fkey', 'resolved_code', 'merge_conflict_id', 'merge_conflicts'),
+    ('task_pr_id_fkey', 'task', 'pr_id', 'pr'),
+    ('task_merge_id_fkey', 'task', 'merge_id', 'merge_conflicts'),
+]
+
+# (index name, table, columns, partial index predicate)
+INDEXES = [
+    ('ix_repositories_user_id', 'repositories', ['user_id'], None),
+    ('ix_pr_repo_id', 'pr', ['repo_id'], None),
+    ('ix_merge_conflicts_pr_id_status_created_at', 'merge_conflicts', ['pr_id', 'status', 'created_at'], None),
+    ('ix_merge_conflicts_open_created_at', 'merge_conflicts', ['created_at'], "status = 'open'"),
+    ('ix_resolved_code_merge_conflict_id', 'resolved_code', ['merge_conflict_id'], None),
+    ('ix_task_celery_task_id', 'task', ['celery_task_id'], None),
+    ('ix_task_merge_id', 'task', ['merge_id'], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Build the indexes without blocking writes to the tables
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None
+            )
+
+    # Added NOT VALID so only new writes are checked while the constraint is
+    # created, then validated separately under a lighter lock. Validation
+    # fails if orphaned rows exist; delete them and re-run the migration.
+    for name, table, column, referenced in FOREIGN_KEYS:
+        op.execute(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT {name} '
+            f'FOREIGN KEY ({column}) REFERENCES "{referenced}" (id) NOT VALID'
+        )
+    for name, table, _, _ in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT {name}')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _, _ in reversed(FOREIGN_KEYS):
+        op.drop_constraint(name, table, type_='foreignkey')
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -1,9 +1,42 @@
+import os
 from dotenv import load_dotenv
 load_dotenv()
 from config import celery_app
 
 from utils.repository_db_actions import handle_add_repositories, handle_remove_repositories
 from utils.pr_db_actions import handle_new_pr
-from db import get_db
+from db import dispose_engine
 from utils.merge_conflict_tools import resolve_conflict
 from utils.setup_workflow_files import setup_workflow_files
+from utils.dashboard_rollup import refresh_pr_rollup
+from utils.live_counters import reconcile_live_counters
+
+from celery.signals import task_prerun, worker_init, worker_process_init, worker_process_shutdown
+from redis_setup import init_sync_redis, close_sync_redis
+from utils.github_client import close_github_client
+from utils.metrics import CELERY_METRICS_PORT, mark_process_dead, record_queue_wait, start_metrics_server
+
+
+@worker_init.connect
+def init_worker(**kwargs):
+    # Serves the samples of all pool processes from the parent
+    start_metrics_server(CELERY_METRICS_PORT)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # Pools are created after the fork so no sockets are shared between children
+    init_sync_redis()
+    dispose_engine()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    close_sync_redis()
+    close_github_client()
+    mark_process_dead(os.getpid())
+
+
+@task_prerun.connect
+def observe_queue_wait(task=None, **kwargs):
+    record_queue_wait(task, task.request)
@@ -1,5 +1,7 @@
 import os
+import time
 from celery import Celery
+from celery.signals import before_task_publish
 
 
 celery_app = Celery(
@@ -8,10 +10,49 @@ celery_app = Celery(
     backend=f"redis://{os.getenv("REDIS_HOST")}:{os.getenv("REDIS_PORT")}/0"
 )
 
+# Each queue has its own worker pool (see docker-compose), so cheap event
+# handling never waits behind LLM runs or onboarding. Unlisted tasks go to ingest.
+CELERY_QUEUES = ["ingest", "github-io", "llm", "onboarding"]
+TASK_ROUTES = {
+    "utils.pr_db_actions.handle_new_pr": {"queue": "ingest"},
+    "utils.repository_db_actions.handle_add_repositories": {"queue": "ingest"},
+    "utils.repository_db_actions.handle_remove_repositories": {"queue": "ingest"},
+    "utils.dashboard_rollup.refresh_pr_rollup": {"queue": "ingest"},
+    "utils.live_counters.reconcile_live_counters": {"queue": "ingest"},
+    "resolve_merge": {"queue": "ingest"},
+    "finalize_merge_resolution": {"queue": "ingest"},
+    "merge_resolution_failed": {"queue": "ingest"},
+    "utils.pr_db_actions.check_pr_mergeability": {"queue": "github-io"},
+    "utils.pr_db_actions.resolve_merge_conflicts": {"queue": "github-io"},
+    "resolve_conflict": {"queue": "llm"},
+    "resolve_merge_file": {"queue": "llm"},
+    "utils.setup_workflow_files.setup_workflow_files": {"queue": "onboarding"},
+}
+
+# Seconds between rebuilds of the dashboard's live counters from Postgres
+LIVE_COUNTER_RECONCILE_INTERVAL = int(os.getenv("LIVE_COUNTER_RECONCILE_INTERVAL", 600))
+
 celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
     result_serializer="json",
     timezone="Asia/Kolkata",  # or UTC
     enable_utc=True,
+    task_default_queue="ingest",
+    task_routes=TASK_ROUTES,
+    # Workers take one task at a time so a long task never holds others
+    # prefetched behind it
+    worker_prefetch_multiplier=1,
+    beat_schedule={
+        "reconcile-live-counters": {
+            "task": "utils.live_counters.reconcile_live_counters",
+            "schedule": LIVE_COUNTER_RECONCILE_INTERVAL,
+        },
+    },
 )
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    # Read by the workers to measure how long tasks wait in the queue
+    headers["published_at"] = time.time()
@@ -1,17 +1,78 @@
 import os
+import uuid
+from contextlib import contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool
 import dotenv
 
 dotenv.load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL").replace("%%", "%")
 
+# Connections per process. Celery runs one pool per prefork child, so size
+# these so that processes * (size + overflow) stays below max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Connections older than this are replaced, before a proxy or firewall drops them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Behind pgbouncer in transaction mode pgbouncer does the pooling: the app
+# keeps no connections of its own and does not reuse prepared statements,
+# which may land on a different server connection
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+
+def pool_options() -> dict:
+    if DB_PGBOUNCER:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        # Checks connections on checkout, so a restarted Postgres costs a
+        # reconnect instead of a failed task
+        "pool_pre_ping": True,
+    }
+
+
 engine = create_engine(
-    DATABASE_URL
+    DATABASE_URL,
+    **(pool_options() if make_url(DATABASE_URL).get_backend_name() == "postgresql" else {})
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_database_url(url: str):
+    """The asyncpg flavour of a Postgres URL, other URLs are used as they are"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        return parsed.set(drivername="postgresql+asyncpg")
+    return parsed
+
+
+def async_engine_options(url) -> dict:
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    options = pool_options()
+    if DB_PGBOUNCER:
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            # Unique names so statements never clash on a shared server connection
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return options
+
+# The FastAPI routers query through asyncpg so a slow query does not block the
+# event loop; Celery tasks and scripts keep the sync engine above
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -21,5 +82,33 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def session_scope():
+    """
+    Session for a unit of work outside a request, e.g. a Celery task. Commits
+    when the block finishes, rolls back if it raises, and always closes, so
+    no connection is left idle in transaction.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+
+def dispose_engine():
+    """
+    Drops the pooled connections inherited from the parent process. Called in
+    each Celery child after the fork, the parent keeps using its own.
+    """
+    engine.dispose(close=False)
@@ -0,0 +1,82 @@
+import hashlib
+import hmac
+import json
+import time
+
+# Synthetic users and repositories use ids far above anything real
+LOADTEST_ID_BASE = 3_000_000_000
+LOADTEST_OWNER = "loadtest-org"
+LOADTEST_INSTALLATION_ID = LOADTEST_ID_BASE
+
+
+def head_sha(full_name: str, number: int) -> str:
+    """Head commit of a synthetic PR, derived the same way by the generator and the fake GitHub"""
+    return hashlib.sha1(f"{full_name}#{number}".encode()).hexdigest()
+
+
+def repo_payload(index: int) -> dict:
+    github_id = LOADTEST_ID_BASE + index
+    return {
+        "id": github_id,
+        "node_id": f"loadtest-repo-{index}",
+        "name": f"repo-{index}",
+        "full_name": f"{LOADTEST_OWNER}/repo-{index}",
+        "private": False,
+        "owner": {"login": LOADTEST_OWNER},
+    }
+
+
+def pull_request_payload(repo_index: int, number: int, run_id: str, action: str = "opened") -> dict:
+    """A pull_request webhook body, with mergeable still being computed as GitHub sends it"""
+    repo = repo_payload(repo_index)
+    pr_github_id = LOADTEST_ID_BASE + repo_index * 10_000_000_000 + number
+    return {
+        "action": action,
+        "number": number,
+        "pull_request": {
+            "id": pr_github_id,
+            "node_id": f"loadtest-pr-{repo_index}-{number}",
+            "url": f"https://api.github.com/repos/{repo['full_name']}/pulls/{number}",
+            "state": "open",
+            "title": f"Load test PR {number}",
+            "closed_at": None,
+            "merged_at": None,
+            "mergeable": None,
+            "commits": 1,
+            "user": {"login": LOADTEST_OWNER},
+            # The run id travels through the workflow dispatch so the fake
+            # runner can report which PR a resolution belongs to
+            "head": {"ref": f"loadtest/{run_id}/{repo_index}/{number}", "sha": head_sha(repo["full_name"], number)},
+            "base": {"ref": "main"},
+        },
+        "repository": repo,
+        "installation": {"id": LOADTEST_INSTALLATION_ID},
+        "sender": {"login": LOADTEST_OWNER},
+        "sent_at": time.time(),
+    }
+
+
+def first_pr_number() -> int:
+    """
+    Start of a run's PR numbers, so repeated runs never reuse a PR (numbers
+    fit a 32 bit column, with room for 1000 PRs per repository and run)
+    """
+    return int(time.time()) % 2_000_000 * 1000
+
+
+def sign(body: bytes, secret: str) -> str:
+    return "sha256=" + hmac.new(secret.encode(), msg=body, digestmod=hashlib.sha256).hexdigest()
+
+
+def encode(payload: dict) -> bytes:
+    return json.dumps(payload).encode()
+
+
+def percentiles(values, points=(50, 90, 99)) -> dict:
+    if not values:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(values)
+    return {
+        f"p{p}": round(ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)], 4)
+        for p in points
+    }
@@ -0,0 +1,193 @@
+"""
+Local stand-in for the GitHub API, for load tests.
+
+Serves the endpoints the backend calls: installation tokens, PR details with
+a mergeable flag that takes a while to compute, workflow dispatch and the git
+data endpoints used to install workflows. A dispatched workflow is played by
+a fake runner that submits a conflicted file to the backend's /resolve_merge
+and waits for the result, like the real CLI does.
+
+Point the backend at it with GITHUB_API_URL=http://<host>:9100.
+
+Usage (from backend/):
+    uvicorn loadtest.fake_github:app --port 9100
+"""
+import asyncio
+import hashlib
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+from loadtest.common import head_sha
+
+# Seconds until a PR's mergeability is computed after it is first requested
+FAKE_GITHUB_MERGEABLE_DELAY = float(os.getenv("FAKE_GITHUB_MERGEABLE_DELAY", 5))
+# Share of PRs that come out with merge conflicts
+FAKE_GITHUB_CONFLICT_RATE = float(os.getenv("FAKE_GITHUB_CONFLICT_RATE", 0.5))
+FAKE_GITHUB_LATENCY_MS = float(os.getenv("FAKE_GITHUB_LATENCY_MS", 50))
+FAKE_GITHUB_RATE_LIMIT = int(os.getenv("FAKE_GITHUB_RATE_LIMIT", 5000))
+# The fake runner submits dispatched workflows to this backend
+FAKE_RUNNER_BACKEND_URL = os.getenv("FAKE_RUNNER_BACKEND_URL", "http://localhost:8001")
+FAKE_RUNNER_ENABLED = os.getenv("FAKE_RUNNER_ENABLED", "true").lower() == "true"
+FAKE_RUNNER_HUNKS = int(os.getenv("FAKE_RUNNER_HUNKS", 3))
+FAKE_RUNNER_TIMEOUT = float(os.getenv("FAKE_RUNNER_TIMEOUT", 600))
+
+app = FastAPI()
+
+first_seen = {}
+requests_by_installation = {}
+runs = {}
+counters = {"requests": 0, "dispatches": 0, "token_mints": 0, "commits": 0}
+
+
+async def simulate_latency():
+    await asyncio.sleep(random.uniform(0.5, 1.5) * FAKE_GITHUB_LATENCY_MS / 1000)
+
+
+def rate_limit_headers(installation: str) -> dict:
+    # Counted in one hour windows, like GitHub's primary rate limit
+    window = int(time.time() // 3600)
+    key = (installation, window)
+    requests_by_installation[key] = requests_by_installation.get(key, 0) + 1
+    return {
+        "x-ratelimit-limit": str(FAKE_GITHUB_RATE_LIMIT),
+        "x-ratelimit-remaining": str(max(FAKE_GITHUB_RATE_LIMIT - requests_by_installation[key], 0)),
+        "x-ratelimit-reset": str((window + 1) * 3600),
+    }
+
+
+@app.middleware("http")
+async def github_behaviour(request: Request, call_next):
+    if request.url.path.startswith("/_loadtest"):
+        return await call_next(request)
+    counters["requests"] += 1
+    await simulate_latency()
+    response = await call_next(request)
+    installation = request.headers.get("authorization", "anonymous")[-12:]
+    response.headers.update(rate_limit_headers(installation))
+    return response
+
+
+def has_conflict(full_name: str, number: int) -> bool:
+    digest = hashlib.sha1(f"conflict:{full_name}#{number}".encode()).digest()
+    return digest[0] / 256 < FAKE_GITHUB_CONFLICT_RATE
+
+
+@app.post("/app/installations/{installation_id}/access_tokens", status_code=201)
+async def create_installation_token(installation_id: int):
+    counters["token_mints"] += 1
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    return {"token": f"ghs_fake{uuid.uuid4().hex}", "expires_at": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+
+@app.get("/repos/{owner}/{repo}/pulls/{number}")
+async def get_pull_request(owner: str, repo: str, number: int):
+    full_name = f"{owner}/{repo}"
+    seen = first_seen.setdefault((full_name, number), time.time())
+    mergeable = None
+    if time.time() - seen >= FAKE_GITHUB_MERGEABLE_DELAY:
+        mergeable = not has_conflict(full_name, number)
+    return {
+        "number": number,
+        "state": "open",
+        "mergeable": mergeable,
+        "head": {"sha": head_sha(full_name, number)},
+    }
+
+
+def conflicted_file(hunks: int) -> str:
+    parts = []
+    for i in range(hunks):
+        parts.append(
+            f"def handler_{i}(event):\n"
+            "<<<<<<< HEAD\n"
+            f"    return process(event, retries={i + 1})\n"
+            "=======\n"
+            f"    return process_checked(event, timeout={i + 10})\n"
+            ">>>>>>> feature\n\n"
+        )
+    return "".join(parts)
+
+
+async def run_workflow(head_ref: str, merge_id: str):
+    """Plays the GitHub Actions runner: submits the conflict and waits for its resolution"""
+    run = runs[head_ref]
+    task_id = str(uuid.uuid4())
+    try:
+        async with httpx.AsyncClient(base_url=FAKE_RUNNER_BACKEND_URL, timeout=30) as client:
+            response = await client.post("/resolve_merge", json={
+                "files": [{"file": conflicted_file(FAKE_RUNNER_HUNKS), "file_path": "handlers.py"}],
+                "task_id": task_id,
+                "merge_id": int(merge_id),
+            })
+            response.raise_for_status()
+            run["submitted_at"] = time.time()
+            deadline = time.time() + FAKE_RUNNER_TIMEOUT
+            while time.time() < deadline:
+                result = (await client.get(f"/get-task/{task_id}")).json()
+                if result:
+                    run["resolved_at"] = time.time()
+                    run["status"] = "resolved"
+                    return
+                await asyncio.sleep(0.5)
+            run["status"] = "timeout"
+    except Exception as e:
+        run["status"] = f"error: {e}"
+
+
+@app.post("/repos/{owner}/{repo}/actions/workflows/{workflow}/dispatches", status_code=204)
+async def dispatch_workflow(owner: str, repo: str, workflow: str, request: Request):
+    counters["dispatches"] += 1
+    inputs = (await request.json()).get("inputs", {})
+    head_ref = inputs.get("head_ref", "")
+    runs[head_ref] = {"dispatched_at": time.time(), "status": "dispatched"}
+    if FAKE_RUNNER_ENABLED:
+        asyncio.create_task(run_workflow(head_ref, inputs.get("merge_id")))
+    return Response(status_code=204)
+
+
+@app.get("/repos/{owner}/{repo}")
+async def get_repository(owner: str, repo: str):
+    return {"full_name": f"{owner}/{repo}", "default_branch": "main"}
+
+
+@app.get("/repos/{owner}/{repo}/branches/{branch}")
+async def get_branch(owner: str, repo: str, branch: str):
+    sha = hashlib.sha1(f"{owner}/{repo}@{branch}".encode()).hexdigest()
+    return {"name": branch, "commit": {"sha": sha, "commit": {"tree": {"sha": sha[::-1]}}}}
+
+
+@app.get("/repos/{owner}/{repo}/contents/{path:path}")
+async def get_contents(owner: str, repo: str, path: str):
+    # Every repository starts without workflows
+    return Response(status_code=404)
+
+
+@app.post("/repos/{owner}/{repo}/git/trees", status_code=201)
+async def create_tree(owner: str, repo: str):
+    return {"sha": uuid.uuid4().hex + "00000000"}
+
+
+@app.post("/repos/{owner}/{repo}/git/commits", status_code=201)
+async def create_commit(owner: str, repo: str):
+    counters["commits"] += 1
+    return {"sha": uuid.uuid4().hex + "00000000"}
+
+
+@app.patch("/repos/{owner}/{repo}/git/refs/heads/{branch:path}")
+async def update_ref(owner: str, repo: str, branch: str):
+    return {"ref": f"refs/heads/{branch}"}
+
+
+@app.get("/_loadtest/runs")
+async def get_runs(prefix: str = ""):
+    """Workflow runs by head ref, read by the load generator for end-to-end latencies"""
+    return {
+        "counters": counters,
+        "runs": {head_ref: run for head_ref, run in runs.items() if head_ref.startswith(prefix)},
+    }
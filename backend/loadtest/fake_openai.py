@@ -0,0 +1,143 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests.
+
+Answers after a configurable latency with responses the resolvers accept:
+structured outputs are filled from the requested JSON schema, keeping the
+"ours" side of the conflict as the resolution, and the intent and confidence
+prompts get the JSON their parsers expect. With FAKE_OPENAI_TOOL_CALLS the
+agent's first turn calls one of its tools, so tool latency is exercised too.
+
+Point the backend at it with OPENAI_BASE_URL=http://<host>:9200/v1.
+
+Usage (from backend/):
+    uvicorn loadtest.fake_openai:app --port 9200
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+
+FAKE_OPENAI_LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", 800))
+# Latency varies uniformly by this fraction either way
+FAKE_OPENAI_JITTER = float(os.getenv("FAKE_OPENAI_JITTER", 0.5))
+FAKE_OPENAI_TOOL_CALLS = os.getenv("FAKE_OPENAI_TOOL_CALLS", "false").lower() == "true"
+FAKE_OPENAI_CONFIDENCE = float(os.getenv("FAKE_OPENAI_CONFIDENCE", 0.9))
+
+app = FastAPI()
+
+counters = {"requests": 0, "tool_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def ours_resolution(text: str) -> str:
+    """The conflicted text with every hunk resolved to its first side"""
+    if "<<<<<<<" not in text:
+        return text
+    return re.sub(
+        r"^<{7}[^\n]*\n(.*?)^(?:\|{7}.*?)?^={7}\n.*?^>{7}[^\n]*\n?",
+        lambda match: match.group(1),
+        text,
+        flags=re.MULTILINE | re.DOTALL,
+    )
+
+
+def fill_schema(schema: dict, resolution: str):
+    """A value matching a JSON schema, strings take the resolution and numbers the confidence"""
+    kind = schema.get("type")
+    if kind == "object" or "properties" in schema:
+        return {name: fill_schema(prop, resolution) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fill_schema(schema.get("items", {}), resolution)]
+    if kind in ("number", "integer"):
+        return FAKE_OPENAI_CONFIDENCE if kind == "number" else 1
+    if kind == "boolean":
+        return True
+    return resolution
+
+
+def completion_content(messages: list, body: dict) -> str:
+    text = "\n".join(message_text(message) for message in messages)
+    conflicted = next((message_text(m) for m in reversed(messages) if "<<<<<<<" in message_text(m)), text)
+    resolution = ours_resolution(conflicted)
+
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return json.dumps(fill_schema(response_format["json_schema"]["schema"], resolution))
+    # Prompts parsed with PydanticOutputParser carry their schema in the text
+    if "Summary of HEAD code intent" in text:
+        return json.dumps({"head": "Keeps the current behaviour", "base": "Changes the behaviour"})
+    if "Confidence score between 0 and 1" in text:
+        return json.dumps({"confidence": FAKE_OPENAI_CONFIDENCE})
+    return resolution
+
+
+def tool_call(tools: list, messages: list):
+    """Calls the first tool once per conversation, before any tool result is in the messages"""
+    if not FAKE_OPENAI_TOOL_CALLS or not tools or any(m.get("role") == "tool" for m in messages):
+        return None
+    function = tools[0]["function"]
+    conflicted = next((message_text(m) for m in reversed(messages) if "<<<<<<<" in message_text(m)), "")
+    arguments = fill_schema(function.get("parameters", {}), conflicted)
+    counters["tool_calls"] += 1
+    return {
+        "id": f"call_{uuid.uuid4().hex[:24]}",
+        "type": "function",
+        "function": {"name": function["name"], "arguments": json.dumps(arguments)},
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    counters["requests"] += 1
+
+    latency = FAKE_OPENAI_LATENCY_MS * random.uniform(1 - FAKE_OPENAI_JITTER, 1 + FAKE_OPENAI_JITTER)
+    await asyncio.sleep(max(latency, 0) / 1000)
+
+    call = tool_call(body.get("tools") or [], messages)
+    message = {"role": "assistant", "content": None if call else completion_content(messages, body)}
+    if call:
+        message["tool_calls"] = [call]
+
+    prompt_tokens = sum(estimate_tokens(message_text(m)) for m in messages)
+    completion_tokens = estimate_tokens(message["content"] or call["function"]["arguments"])
+    counters["prompt_tokens"] += prompt_tokens
+    counters["completion_tokens"] += completion_tokens
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if call else "stop",
+            "logprobs": None,
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/_loadtest/stats")
+async def stats():
+    return counters
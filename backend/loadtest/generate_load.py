@@ -0,0 +1,222 @@
+"""
+End-to-end load generator.
+
+Replays signed pull_request webhooks against /webhook at a fixed rate
+(open loop, so a slow backend does not slow the arrivals down), samples the
+webhook stream and Celery queue depth every second, and reports throughput,
+ack latency and, from the fake GitHub's workflow runs, the latency from
+webhook to workflow dispatch and to a finished resolution.
+
+Expects the backend, webhook consumer and Celery worker to run against the
+stand-ins in this package:
+    uvicorn loadtest.fake_github:app --port 9100    (GITHUB_API_URL)
+    uvicorn loadtest.fake_openai:app --port 9200    (OPENAI_BASE_URL, with /v1)
+
+Usage (from backend/):
+    python -m loadtest.generate_load --seed --repos 50
+    python -m loadtest.generate_load --rate 20 --duration 60 [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+from loadtest.common import (LOADTEST_ID_BASE, LOADTEST_INSTALLATION_ID, LOADTEST_OWNER, encode, first_pr_number,
+                             percentiles, pull_request_payload, repo_payload, sign)
+
+WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+BACKEND_URL = os.getenv("LOADTEST_BACKEND_URL", "http://localhost:8001")
+FAKE_GITHUB_URL = os.getenv("LOADTEST_FAKE_GITHUB_URL", "http://localhost:9100")
+# Terminal statuses of a fake workflow run
+FINISHED = ("resolved", "timeout")
+
+
+def seed(repos: int):
+    """Creates the load test user and repositories, safe to run repeatedly"""
+    from sqlalchemy.dialects.postgresql import insert
+
+    from db import SessionLocal
+    from models.repo import Repository
+    from models.user import User
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(User).values(
+            username=LOADTEST_OWNER, github_id=LOADTEST_ID_BASE, name="Load test",
+        ).on_conflict_do_nothing(index_elements=[User.github_id]))
+        user = db.query(User).filter_by(github_id=LOADTEST_ID_BASE).first()
+        rows = []
+        for index in range(repos):
+            repo = repo_payload(index)
+            rows.append({
+                "user_id": user.id,
+                "installation_id": LOADTEST_INSTALLATION_ID,
+                "github_id": repo["id"],
+                "node_id": repo["node_id"],
+                "name": repo["name"],
+                "full_name": repo["full_name"],
+                "private": repo["private"],
+                "status": "active",
+            })
+        db.execute(insert(Repository).values(rows).on_conflict_do_nothing(index_elements=[Repository.github_id]))
+        db.commit()
+        print(f"Seeded {repos} repositories for {LOADTEST_OWNER} (installation {LOADTEST_INSTALLATION_ID})")
+    finally:
+        db.close()
+
+
+async def sample_queues(samples: list, stop: asyncio.Event):
+    """Records the webhook stream length, its unacknowledged entries and the Celery queues every second"""
+    from config import CELERY_QUEUES
+    from redis_setup import get_redis
+    from utils.webhook_queue import WEBHOOK_CONSUMER_GROUP, WEBHOOK_STREAM
+
+    r = get_redis()
+    while not stop.is_set():
+        try:
+            pending = await r.xpending(WEBHOOK_STREAM, WEBHOOK_CONSUMER_GROUP)
+            samples.append({
+                "at": time.time(),
+                "webhook_stream": await r.xlen(WEBHOOK_STREAM),
+                "webhook_pending": pending["pending"],
+                **{f"celery_{queue}": await r.llen(queue) for queue in CELERY_QUEUES},
+            })
+        except Exception as e:
+            print(f"Queue sample failed: {e}")
+        await asyncio.sleep(1)
+
+
+async def send_webhook(client: httpx.AsyncClient, payload: dict, ack_latencies: list, statuses: Counter):
+    body = encode(payload)
+    headers = {
+        "Content-Type": "application/json",
+        "X-GitHub-Event": "pull_request",
+        "X-GitHub-Delivery": str(uuid.uuid4()),
+        "X-Hub-Signature-256": sign(body, WEBHOOK_SECRET),
+    }
+    started = time.perf_counter()
+    try:
+        response = await client.post("/webhook", content=body, headers=headers)
+        statuses[response.status_code] += 1
+    except httpx.HTTPError as e:
+        statuses[type(e).__name__] += 1
+        return
+    ack_latencies.append(time.perf_counter() - started)
+
+
+async def generate(rate: float, duration: float, repos: int, run_id: str):
+    """Sends rate webhooks per second for duration seconds, returns the send time of every PR by head ref"""
+    sent_at = {}
+    ack_latencies = []
+    statuses = Counter()
+    total = int(rate * duration)
+    first_number = first_pr_number()
+    limits = httpx.Limits(max_connections=max(int(rate * 2), 10))
+    async with httpx.AsyncClient(base_url=BACKEND_URL, timeout=30, limits=limits) as client:
+        started = time.monotonic()
+        in_flight = []
+        for i in range(total):
+            # Sleep until this request's slot instead of after the previous one
+            # returns, so backend slowness shows up as latency, not lower load
+            delay = started + i / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            payload = pull_request_payload(i % repos, first_number + i // repos, run_id)
+            sent_at[payload["pull_request"]["head"]["ref"]] = time.time()
+            in_flight.append(asyncio.create_task(send_webhook(client, payload, ack_latencies, statuses)))
+        await asyncio.gather(*in_flight)
+        elapsed = time.monotonic() - started
+    return sent_at, ack_latencies, statuses, elapsed
+
+
+async def wait_for_runs(run_id: str, drain: float):
+    """Polls the fake GitHub until every dispatched run finished and no new ones arrive, or drain runs out"""
+    deadline = time.monotonic() + drain
+    runs = {}
+    stable_polls = 0
+    async with httpx.AsyncClient(base_url=FAKE_GITHUB_URL, timeout=30) as client:
+        while time.monotonic() < deadline:
+            response = await client.get("/_loadtest/runs", params={"prefix": f"loadtest/{run_id}/"})
+            current = response.json()["runs"]
+            finished = all(run["status"] in FINISHED or run["status"].startswith("error") for run in current.values())
+            stable_polls = stable_polls + 1 if current and finished and len(current) == len(runs) else 0
+            runs = current
+            if stable_polls >= 3:
+                break
+            await asyncio.sleep(2)
+    return runs
+
+
+async def run(args):
+    run_id = uuid.uuid4().hex[:8]
+    print(f"Run {run_id}: {args.rate}/s for {args.duration}s over {args.repos} repositories")
+
+    samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_queues(samples, stop))
+    sent_at, ack_latencies, statuses, elapsed = await generate(args.rate, args.duration, args.repos, run_id)
+    print(f"Sent {len(sent_at)} webhooks in {elapsed:.1f}s, waiting up to {args.drain}s for resolutions")
+    runs = await wait_for_runs(run_id, args.drain)
+    stop.set()
+    await sampler
+
+    dispatch = [run["dispatched_at"] - sent_at[ref] for ref, run in runs.items() if ref in sent_at]
+    end_to_end = [run["resolved_at"] - sent_at[ref] for ref, run in runs.items() if ref in sent_at and "resolved_at" in run]
+    run_statuses = Counter(run["status"] if not run["status"].startswith("error") else "error" for run in runs.values())
+    results = {
+        "run_id": run_id,
+        "rate": args.rate,
+        "duration": args.duration,
+        "sent": len(sent_at),
+        "send_seconds": round(elapsed, 2),
+        "throughput": round(len(ack_latencies) / elapsed, 2) if elapsed else None,
+        "ack_statuses": {str(status): count for status, count in statuses.items()},
+        "ack_latency": percentiles(ack_latencies),
+        "workflow_runs": dict(run_statuses),
+        "dispatch_latency": percentiles(dispatch),
+        "end_to_end_latency": percentiles(end_to_end),
+        "max_queue_depth": {
+            key: max((sample[key] for sample in samples), default=None)
+            for key in (samples[0] if samples else {}) if key != "at"
+        },
+        "queue_samples": samples,
+    }
+
+    print(f"\nAck throughput:       {results['throughput']}/s  statuses {results['ack_statuses']}")
+    print(f"Ack latency:          {results['ack_latency']}")
+    print(f"Workflow runs:        {results['workflow_runs']}")
+    print(f"Webhook to dispatch:  {results['dispatch_latency']}")
+    print(f"Webhook to resolved:  {results['end_to_end_latency']}")
+    print(f"Max queue depth:      {results['max_queue_depth']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay signed pull_request webhooks and measure end-to-end latency")
+    parser.add_argument("--seed", action="store_true", help="Create the load test user and repositories, then exit")
+    parser.add_argument("--repos", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=10, help="Webhooks per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to send for")
+    parser.add_argument("--drain", type=float, default=600, help="Seconds to wait for resolutions after sending")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.repos)
+        return
+    if not WEBHOOK_SECRET:
+        parser.error("GITHUB_WEBHOOK_SECRET must match the backend's to sign the webhooks")
+
+    results = asyncio.run(run(args))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,13 +12,22 @@ from routers.tasks import task_router
 from routers.dashboard import dashboard_router
 from routers.merge_details import merge_details_router
 from routers.user import user_router
-from db import init_db
+from db import async_engine, init_db
+from redis_setup import init_redis, close_redis, init_sync_redis, close_sync_redis
+from utils.github_client import close_github_client
+from utils.metrics import metrics_app
 from logger import setup_logging
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()  # Initialize the database
+    init_redis()
+    init_sync_redis()
     yield
+    await close_redis()
+    await async_engine.dispose()
+    close_sync_redis()
+    close_github_client()
 
 setup_logging()
 
@@ -51,4 +60,6 @@ app.include_router(mc_router, tags=["merge_conflict"])
 app.include_router(task_router, tags=["tasks"])
 app.include_router(dashboard_router, tags=["dashboard"])
 app.include_router(merge_details_router, tags=["merge_details"])
-app.include_router(user_router, tags=["user"])
\ No newline at end of file
+app.include_router(user_router, tags=["user"])
+
+app.mount("/metrics", metrics_app())
\ No newline at end of file
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, Date
+from db import Base
+
+
+class DashboardRollup(Base):
+    """
+    Per user, per day aggregates backing /dashboard. One row per
+    (metric, bucket), e.g. ('conflict_status', 'accepted') or ('pr_hour', '2').
+    """
+    __tablename__ = 'dashboard_rollup'
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    metric = Column(String, primary_key=True) # pr, pr_hour, conflict_status, conflict_hour, confidence, built
+    bucket = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -1,11 +1,20 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Index, text
+from sqlalchemy.orm import column_property
 from db import Base
 from datetime import datetime
 
 class MergeConflict(Base):
     __tablename__ = 'merge_conflicts'
+    __table_args__ = (
+        # Latest conflict of a PR in a given status (handle_new_pr), and pr_id lookups
+        Index('ix_merge_conflicts_pr_id_status_created_at', 'pr_id', 'status', 'created_at'),
+        # Conflicts left open too long (systems_operational on /dashboard)
+        Index('ix_merge_conflicts_open_created_at', 'created_at', postgresql_where=text("status = 'open'")),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    pr_id = Column(Integer, nullable=False)
-    status = Column(String, nullable=False, default='open') # open, closed, resolved, escalated, accepted, rejected
+    pr_id = Column(Integer, ForeignKey('pr.id'), nullable=False)
+    # open, closed, resolved, escalated, accepted, rejected, overwritten. The
+    # previous value is loaded on assignment, for the live counters' transitions
+    status = column_property(Column(String, nullable=False, default='open'), active_history=True)
     created_at = Column(DateTime, nullable=False, default=datetime.now)
\ No newline at end of file
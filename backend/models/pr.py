@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred
 from db import Base
 from datetime import datetime
 
@@ -6,7 +8,7 @@ class PullRequests(Base):
     __tablename__ = 'pr'
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    repo_id = Column(Integer, nullable=False)
+    repo_id = Column(Integer, ForeignKey('repositories.id'), nullable=False, index=True)
     pr_number = Column(Integer, nullable=False)
     installation_id = Column(BigInteger, nullable=False)
     url = Column(String, nullable=False)
@@ -18,5 +20,11 @@ class PullRequests(Base):
     merged_at = Column(DateTime, nullable=True)
     mergeable = Column(Boolean, nullable=True)
     commits = Column(Integer, nullable=False, default=0)
-    details = Column(String, nullable=True)
+    head_ref = Column(String, nullable=True)
+    base_ref = Column(String, nullable=True)
+    head_sha = Column(String, nullable=True)
+    author_login = Column(String, nullable=True)
+    # The last webhook payload, lz4 compressed by Postgres. Deferred so PR
+    # queries do not load it unless it is asked for (undefer or a column select)
+    details = deferred(Column(JSONB, nullable=True))
     created_at = Column(DateTime, nullable=False, default=datetime.now)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger, ForeignKey
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger
 from db import Base
 from datetime import datetime
@@ -7,7 +7,7 @@ class Repository(Base):
     __tablename__ = 'repositories'
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False, index=True)
     installation_id = Column(BigInteger, nullable=False)
     github_id = Column(BigInteger, unique=True, nullable=False)
     node_id = Column(String, unique=True, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, BigInteger, ForeignKey, false
 from db import Base
 from datetime import datetime
 
@@ -7,10 +7,13 @@ class Resolved_code(Base):
     __tablename__ = 'resolved_code'
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    merge_conflict_id = Column(Integer, nullable=False)
+    merge_conflict_id = Column(Integer, ForeignKey('merge_conflicts.id'), nullable=False, index=True)
     task_id = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     resolved_code_branch = Column(String, nullable=False)
     confidence_score = Column(Float, nullable=False)
     token_usage = Column(BigInteger, nullable=True)
+    cache_hit = Column(Boolean, nullable=False, default=False, server_default=false())
+    cached_token_usage = Column(BigInteger, nullable=True) # tokens the cached resolution originally cost, i.e. saved by the hit
+    routing = Column(String, nullable=True) # cache, fast, escalated or agent
     created_at = Column(DateTime, nullable=False, default=datetime.now)
\ No newline at end of file
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, BigInteger, ForeignKey
+from sqlalchemy.orm import column_property
 from db import Base
 from datetime import datetime
 
@@ -7,10 +8,11 @@ class Task(Base):
     __tablename__ = 'task'
 
     id = Column(String, primary_key=True, index=True)
-    pr_id = Column(Integer, nullable=True)
-    status = Column(String, nullable=False, default='queued')
+    pr_id = Column(Integer, ForeignKey('pr.id'), nullable=True)
+    # Previous value loaded on assignment, for the live counters' transitions
+    status = column_property(Column(String, nullable=False, default='queued'), active_history=True)
     task_type = Column(String, nullable=False)
-    merge_id = Column(Integer, nullable=True)
-    celery_task_id = Column(String, nullable=True)
+    merge_id = Column(Integer, ForeignKey('merge_conflicts.id'), nullable=True, index=True)
+    celery_task_id = Column(String, nullable=True, index=True)
     created_at = Column(DateTime, nullable=False, default=datetime.now)
 
@@ -1,4 +1,99 @@
-from redis.asyncio import Redis
 import os
-def get_redis():
-    return Redis(host=os.getenv("REDIS_HOST"), port=os.getenv("REDIS_PORT"), decode_responses=True)
\ No newline at end of file
+import redis
+from redis.asyncio import Redis, BlockingConnectionPool, ConnectionPool
+
+REDIS_HOST = os.getenv("REDIS_HOST")
+REDIS_PORT = os.getenv("REDIS_PORT")
+# Max connections per process, for each of the async and sync pools
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", 50))
+# Seconds to wait for a free connection once the pool is exhausted
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 10))
+
+_async_pool = None
+_pubsub_pool = None
+_sync_pool = None
+
+
+def _connection_kwargs():
+    return {
+        "host": REDIS_HOST,
+        "port": REDIS_PORT,
+        "decode_responses": True,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "health_check_interval": 30,
+    }
+
+
+def init_redis():
+    """Creates the process-wide async pools. Called from the FastAPI lifespan."""
+    global _async_pool, _pubsub_pool
+    if _async_pool is None:
+        _async_pool = BlockingConnectionPool(
+            max_connections=REDIS_POOL_SIZE,
+            timeout=REDIS_POOL_TIMEOUT,
+            **_connection_kwargs()
+        )
+    if _pubsub_pool is None:
+        # Subscriptions hold their connection for as long as a client is
+        # streaming, so they get their own pool instead of starving requests
+        _pubsub_pool = ConnectionPool(**_connection_kwargs())
+
+
+async def close_redis():
+    global _async_pool, _pubsub_pool
+    for pool in (_async_pool, _pubsub_pool):
+        if pool is not None:
+            await pool.disconnect()
+    _async_pool = None
+    _pubsub_pool = None
+
+
+def get_redis() -> Redis:
+    """Async client on the shared pool, for use inside the FastAPI event loop."""
+    if _async_pool is None:
+        init_redis()
+    return Redis(connection_pool=_async_pool)
+
+
+def get_pubsub_redis() -> Redis:
+    """Async client for long lived pub/sub subscriptions."""
+    if _pubsub_pool is None:
+        init_redis()
+    return Redis(connection_pool=_pubsub_pool)
+
+
+def init_sync_redis():
+    """Creates the process-wide sync pool. Called once per Celery worker process."""
+    global _sync_pool
+    if _sync_pool is None:
+        _sync_pool = redis.BlockingConnectionPool(
+            max_connections=REDIS_POOL_SIZE,
+            timeout=REDIS_POOL_TIMEOUT,
+            **_connection_kwargs()
+        )
+
+
+def close_sync_redis():
+    global _sync_pool
+    if _sync_pool is not None:
+        _sync_pool.disconnect()
+    _sync_pool = None
+
+
+def get_sync_redis() -> redis.Redis:
+    """Sync client on the shared pool, for Celery tasks and threads."""
+    if _sync_pool is None:
+        init_sync_redis()
+    return redis.Redis(connection_pool=_sync_pool)
+
+
+def task_result_key(task_id: str) -> str:
+    """Key holding the final result of a task, read by /get-task"""
+    return f"task_result:{task_id}"
+
+def task_result_channel(task_id: str) -> str:
+    """Pub/sub channel the task result is published on, streamed by /stream-task"""
+    return f"task_result_channel:{task_id}"
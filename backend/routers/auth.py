@@ -10,9 +10,11 @@ from dotenv import load_dotenv
 from db import get_db
 from redis_setup import get_redis
 
-from utils.auth_helper import get_private_key, get_or_refresh_installation_token, oauth, GITHUB_PRIVATE_KEY_PATH, create_jwt_token, verify_token
+from utils.auth_helper import oauth, GITHUB_PRIVATE_KEY_PATH, create_jwt_token, averify_token
+from utils.token_manager import get_or_refresh_installation_token, get_signing_key, get_verifying_key
 from models.user import User
 from utils.auth_helper import jwt_required
+from utils.user_cache import UserPrincipal, invalidate_user
 
 auth_router = APIRouter()
 
@@ -42,6 +44,8 @@ async def auth(request: Request, db=Depends(get_db)):
             db.add(user)
             db.commit()
             db.refresh(user)
+        # A fresh login always re-reads the user on the next request
+        invalidate_user(user.id)
         access_token = create_jwt_token(user)
         return RedirectResponse(url=f"{os.getenv('FRONTEND_URL')}?token={access_token}")
     except Exception as e:
@@ -50,7 +54,7 @@ async def auth(request: Request, db=Depends(get_db)):
 @auth_router.get("/install-app")
 async def install_app(request: Request, token: str = Query(...)):
     try:
-        user:User = verify_token(token)
+        user: UserPrincipal = await averify_token(token)
         # print("User verified:", user)
         request.session["user"] = {
             "id": user.id,
@@ -67,7 +71,7 @@ async def install_app(request: Request, token: str = Query(...)):
     # Generate state
     state = jwt.encode(
         {"user_id": user.id, "exp": time.time() + 300},
-        get_private_key(),
+        get_signing_key(),
         algorithm="RS256"
     )
 
@@ -91,7 +95,7 @@ async def installation_callback(
         # Verify state
         decoded_state = jwt.decode(
             state,
-            get_private_key(),
+            get_verifying_key(),
             algorithms=["RS256"]
         )
         
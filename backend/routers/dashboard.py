@@ -1,120 +1,125 @@
-from math import ceil
 from fastapi import APIRouter, Depends, Request
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from db import get_db
-from models.pr import PullRequests
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta
+from db import get_async_db
 from models.merge_conflicts import MergeConflict
-from models.repo import Repository
-from models.user import User
-from models.resolved_code import Resolved_code
+from models.dashboard_rollup import DashboardRollup
 from utils.auth_helper import jwt_required
+from utils.dashboard_rollup import ROLLUP_BUILT, refresh_rollup
+from utils.live_counters import read_live_counters, seed_user_counters
 
 dashboard_router = APIRouter()
 
+RESOLVED_STATUSES = ['resolved', 'accepted', 'rejected']
+PENDING_STATUSES = ['open', 'escalated']
+
+
+def conflict_matrix_category(status):
+    if status in RESOLVED_STATUSES:
+        return 'resolved'
+    if status == 'open':
+        return 'pending'
+    if status == 'escalated':
+        return 'escalated'
+    return 'closed'
+
+
 @dashboard_router.get("/dashboard")
 @jwt_required
-async def get_statusbar_data(request: Request, db: Session = Depends(get_db)):
+async def get_statusbar_data(request: Request, db: AsyncSession = Depends(get_async_db)):
     user = request.state.user
-    # Example logic, tweak as needed
-    
+    today = date.today()
+
     # active_monitors = db.query(Task).filter(Task.status == "resolving").count()
 
-    # System operational if no merge_conflicts are open for >30 mins
+    # Conflict counts come from the live counters in Redis, in O(1) however
+    # many conflicts the user has
     threshold_time = datetime.now() - timedelta(minutes=30)
-    old_open_conflicts = db.query(MergeConflict).filter(
-        MergeConflict.status == 'open',
-        MergeConflict.created_at < threshold_time
-    ).count()
+    this_week_start = today - timedelta(days=6)
+    this_week = [this_week_start + timedelta(days=offset) for offset in range(7)]
+    live = await read_live_counters(user.id, this_week, threshold_time)
+    if live is None:
+        # Not seeded yet, a new user or Redis lost its data
+        await seed_user_counters(db, user.id)
+        live = await read_live_counters(user.id, this_week, threshold_time)
+
+    # System operational if no merge_conflicts are open for >30 mins
+    old_open_conflicts = live["open_overdue"]
+    if old_open_conflicts is None:
+        # The open set is built by the first reconcile, until then ask Postgres
+        old_open_conflicts = (await db.execute(select(func.count(MergeConflict.id)).where(
+            MergeConflict.status == 'open',
+            MergeConflict.created_at < threshold_time
+        ))).scalar()
     systems_operational = old_open_conflicts == 0
 
     # Realtime processing: any task with status == running
     # realtime_processing = active_monitors > 0
 
-    pr = db.query(PullRequests).join(Repository, PullRequests.repo_id == Repository.id).join(User, User.id == Repository.user_id).filter(
-        User.id == user.id,
-    ).all()
-    this_week_pr = [x for x in pr if x.created_at >= datetime.now() - timedelta(days=7)]
-    prev_week_pr = [x for x in pr if x.created_at < datetime.now() - timedelta(days=7) and x.created_at >= datetime.now() - timedelta(days=14)]
-    
-    pr_count = len(this_week_pr)
-    pr_change = len(this_week_pr) - len(prev_week_pr)
-    pr_change_percentage = (pr_change / len(prev_week_pr) * 100) if prev_week_pr else 0
-
-    pr_ids = [pr.id for pr in pr]
-    conflicts = db.query(MergeConflict).filter(MergeConflict.pr_id.in_(pr_ids)).all()
-
-    num_resolved = 0
-    num_pending = 0
-    num_accepted = 0
-    for conflict in conflicts:
-        if conflict.status in ['resolved', 'accepted', 'rejected']:
-            if conflict.status == 'accepted':
-                num_accepted += 1
-            num_resolved += 1
-        elif conflict.status in ['open', 'escalated']:
-            num_pending += 1
-    
-    conflict_ids = [conflict.id for conflict in conflicts]
-    resolved_code = db.query(Resolved_code).filter(Resolved_code.merge_conflict_id.in_(conflict_ids)).all()
-
-    confidence_calc = [[0,0], [0,0], [0,0], [0,0], [0,0], [0,0], [0,0], [0,0], [0,0], [0,0]]
-    for resolved in resolved_code:
-        pos = ceil(resolved.confidence_score/10)-1 
-        conflict = filter(lambda x: x.id == resolved.merge_conflict_id, conflicts)
-        if conflict and next(conflict).status == 'accepted':
-            confidence_calc[pos][0] += 1
-        elif conflict and next(conflict).status == 'rejected':
-            confidence_calc[pos][1] += 1
-    
+    # Totals over the whole history, summed from the per day rollup, along
+    # with the marker telling whether the rollup was built at all
+    totals_query = select(
+        DashboardRollup.metric, DashboardRollup.bucket, func.sum(DashboardRollup.count)
+    ).where(
+        DashboardRollup.user_id == user.id,
+        DashboardRollup.metric.in_(['pr_hour', 'conflict_hour', 'confidence', ROLLUP_BUILT])
+    ).group_by(DashboardRollup.metric, DashboardRollup.bucket)
+    totals = (await db.execute(totals_query)).all()
+    if not any(metric == ROLLUP_BUILT for metric, _, _ in totals):
+        # First visit since the rollup was introduced, build it from history.
+        # Once built, a user without PRs simply has no other rows
+        await db.run_sync(refresh_rollup, user.id)
+        await db.commit()
+        totals = (await db.execute(totals_query)).all()
+
+    # Per day PR counts for the last two weeks
+    recent = (await db.execute(select(DashboardRollup.day, DashboardRollup.count).where(
+        DashboardRollup.user_id == user.id,
+        DashboardRollup.day > today - timedelta(days=14),
+        DashboardRollup.metric == 'pr'
+    ))).all()
+
+    statuses = live["statuses"]
+    num_resolved = sum(statuses.get(status, 0) for status in RESOLVED_STATUSES)
+    num_pending = sum(statuses.get(status, 0) for status in PENDING_STATUSES)
+    num_accepted = statuses.get('accepted', 0)
+    confidence_calc = [[0,0] for _ in range(10)]
+    pr_conflict_timing = [[0,0] for _ in range(5)]
+    for metric, bucket, count in totals:
+        if metric == 'confidence':
+            pos, status = bucket.split(':')
+            confidence_calc[int(pos)][0 if status == 'accepted' else 1] += count
+        elif metric == 'pr_hour':
+            pr_conflict_timing[int(bucket)][0] += count
+        elif metric == 'conflict_hour':
+            pr_conflict_timing[int(bucket)][1] += count
+
+    this_week_pr = 0
+    prev_week_pr = 0
+    for day, count in recent:
+        if day >= this_week_start:
+            this_week_pr += count
+        else:
+            prev_week_pr += count
+
     conflict_matrix = {}
-    for conflict in conflicts:
-        if conflict.created_at < datetime.now() - timedelta(days=7):
+    for day, counts in live["days"].items():
+        if not any(counts.values()):
             continue
-        if func.to_char(conflict.created_at, 'Day') not in conflict_matrix:
-            conflict_matrix[func.to_char(conflict.created_at, 'Day')] = {
-                'resolved': 0,
-                'pending': 0,
-                'escalated': 0,
-                'closed': 0
-            }
-        if conflict.status in ['resolved', 'accepted', 'rejected']:
-            conflict_matrix[func.to_char(conflict.created_at, 'Day')]['resolved'] += 1
-        elif conflict.status == 'open':
-            conflict_matrix[func.to_char(conflict.created_at, 'Day')]['pending'] += 1
-        elif conflict.status == 'escalated':
-            conflict_matrix[func.to_char(conflict.created_at, 'Day')]['escalated'] += 1
-        else:
-            conflict_matrix[func.to_char(conflict.created_at, 'Day')]['closed'] += 1
+        day_name = day.strftime('%A')
+        conflict_matrix[day_name] = {
+            'resolved': 0,
+            'pending': 0,
+            'escalated': 0,
+            'closed': 0
+        }
+        for status, count in counts.items():
+            conflict_matrix[day_name][conflict_matrix_category(status)] += count
 
-    pr_conflict_timing = [[0,0] for _ in range(5)]
-    for pr in pr:
-        hr = func.extract('hour', pr.created_at)
-        if hr>=8 and hr<11:
-            pr_conflict_timing[0][0] +=1
-        elif hr>=11 and hr<14:
-            pr_conflict_timing[1][0] +=1
-        elif hr>=14 and hr<17:
-            pr_conflict_timing[2][0] +=1
-        elif hr>=17 and hr<20:
-            pr_conflict_timing[3][0] +=1
-        elif hr>=20 or hr<8:
-            pr_conflict_timing[4][0] +=1
-    for conflict in conflicts:
-        hr = func.extract('hour', conflict.created_at)
-        if hr>=8 and hr<11:
-            pr_conflict_timing[0][1] +=1
-        elif hr>=11 and hr<14:
-            pr_conflict_timing[1][1] +=1
-        elif hr>=14 and hr<17:
-            pr_conflict_timing[2][1] +=1
-        elif hr>=17 and hr<20:
-            pr_conflict_timing[3][1] +=1
-        elif hr>=20 or hr<8:
-            pr_conflict_timing[4][1] +=1
-
-    
+    pr_count = this_week_pr
+    pr_change = this_week_pr - prev_week_pr
+    pr_change_percentage = (pr_change / prev_week_pr * 100) if prev_week_pr else 0
 
     return {
         "systems_operational": systems_operational,
@@ -1,11 +1,12 @@
 from typing import List
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from utils.merge_conflict_tools import resolve_conflict
+from utils.merge_conflict_tools import resolve_conflict, resolve_merge, split_conflict_segments
 from db import get_db
 from models.taskLog import Task
 from utils.utils import add_task
+from utils.metrics import RESOLUTIONS
 
 mc_router = APIRouter()
 
@@ -14,8 +15,39 @@ class ConflictResolutionRequest(BaseModel):
     file_path: str
     task_id: str
     merge_id: int
+    simple_resolved: int = 0  # hunks the CLI already resolved with the simple rules
+
+class ConflictFile(BaseModel):
+    file: str
+    file_path: str
+
+class MergeResolutionRequest(BaseModel):
+    files: List[ConflictFile]
+    task_id: str
+    merge_id: int
+    simple_resolved: int = 0
+
+def record_simple_resolved(simple_resolved: int, contents: List[str]):
+    """
+    Counts the hunks the CLI resolved with the simple rules. The count is
+    client supplied, so it is capped at the conflict blocks submitted along
+    with it rather than trusted as is.
+    """
+    submitted = sum(len(split_conflict_segments(content)) // 2 for content in contents)
+    RESOLUTIONS.labels(source="simple_rule").inc(min(max(simple_resolved, 0), submitted))
 
 @mc_router.post("/resolve_conflicts")
 def resolve_conflicts(data: ConflictResolutionRequest, db=Depends(get_db)):
+    record_simple_resolved(data.simple_resolved, [data.file])
     add_task("Resolve_conflict_AI", "queued", merge_id=data.merge_id, task_id=data.task_id)
     resolve_conflict.delay(data.file, data.task_id, data.file_path)
+
+
+@mc_router.post("/resolve_merge")
+def resolve_merge_conflicts(data: MergeResolutionRequest, db=Depends(get_db)):
+    """Queues one job resolving every conflicted file of a merge, with a single result branch"""
+    if not data.files:
+        raise HTTPException(status_code=400, detail="No conflicted files submitted")
+    record_simple_resolved(data.simple_resolved, [f.file for f in data.files])
+    add_task("Resolve_merge_AI", "queued", merge_id=data.merge_id, task_id=data.task_id)
+    resolve_merge.delay([f.model_dump() for f in data.files], data.task_id)
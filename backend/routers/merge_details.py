@@ -1,34 +1,52 @@
-from fastapi import APIRouter, Request, Depends
-from sqlalchemy.orm import Session
-from db import get_db
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Request, Depends, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 
 from utils.auth_helper import jwt_required
-from models.repo import Repository
-from models.pr import PullRequests
-from models.merge_conflicts import MergeConflict
+from utils.merge_details import (decode_cursor, encode_cursor, group_by_repository, merge_details_counts_query,
+                                 merge_details_page_query)
 
+# Rows per page, one row per PR (or per repository without PRs)
+MERGE_DETAILS_PAGE_SIZE = int(os.getenv("MERGE_DETAILS_PAGE_SIZE", 100))
+MERGE_DETAILS_MAX_PAGE_SIZE = 500
 
 merge_details_router = APIRouter()
 
 @merge_details_router.get("/merge-details")
 @jwt_required
-async def get_merge_details(request: Request, db: Session = Depends(get_db)):
+async def get_merge_details(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(MERGE_DETAILS_PAGE_SIZE, ge=1, le=MERGE_DETAILS_MAX_PAGE_SIZE),
+    repo_id: Optional[int] = Query(None),
+    state: Optional[str] = Query(None, description="PR state, open or closed"),
+    conflicted: Optional[bool] = Query(None, description="Only PRs with (true) or without (false) merge conflicts"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    The user's repositories with their PRs, a page at a time. A repository
+    whose PRs span two pages appears on both, with the rest of its PRs.
+    """
     user = request.state.user
-    repos = db.query(Repository).filter(Repository.user_id == user.id).all()
-    prs = db.query(PullRequests).filter(PullRequests.repo_id.in_([repo.id for repo in repos])).all()
-    merge_conflicts = db.query(MergeConflict).filter(MergeConflict.pr_id.in_([pr.id for pr in prs])).all()
-    active_conflicts_suggestions = [conflict for conflict in merge_conflicts if conflict.status in ['open', 'escalated', 'resolved']]
-    resolved_conflicts_suggestions = [conflict for conflict in merge_conflicts if conflict.status in ['closed', 'accepted', 'rejected']]
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+
+    rows = (await db.execute(merge_details_page_query(user.id, limit, after, repo_id, state, conflicted))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    counts = (await db.execute(merge_details_counts_query(user.id, repo_id, state, conflicted))).one()
 
-    pr_info = []
-    for repo in repos:
-        curr_prs = [pr for pr in prs if pr.repo_id == repo.id]
-        pr_info.append({**repo.__dict__, 'pull_requests': [pr.__dict__ for pr in curr_prs]})
-    
     return {
-        "total_repos": len(repos),
-        "total_prs": len(prs),
-        "active_conflicts_suggestions": len(active_conflicts_suggestions),
-        "resolved_conflicts_suggestions": len(resolved_conflicts_suggestions),
-        "pr_info": pr_info,
-    }
\ No newline at end of file
+        "total_repos": counts.total_repos,
+        "total_prs": counts.total_prs,
+        "active_conflicts_suggestions": counts.active,
+        "resolved_conflicts_suggestions": counts.resolved,
+        "pr_info": group_by_repository(rows),
+        "next_cursor": encode_cursor(rows[-1].repo_id, rows[-1].pr_id) if has_more else None,
+    }
@@ -1,5 +1,6 @@
 import json
-from fastapi import APIRouter, Depends, HTTPException
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
 from db import get_db
 from fastapi.responses import StreamingResponse
 import asyncio
@@ -7,19 +8,27 @@ import asyncio
 from models.taskLog import Task
 from models.merge_conflicts import MergeConflict
 from models.resolved_code import Resolved_code
-from redis_setup import get_redis
+from redis_setup import get_redis, get_pubsub_redis, task_result_key, task_result_channel
 
 
 task_router = APIRouter()
 
+# Comment lines keep proxies and the client from dropping an idle stream
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_TIMEOUT_SECONDS = int(os.getenv("TASK_STREAM_TIMEOUT_SECONDS", 1800))
+
+
+def format_sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
 
 @task_router.get("/get-task/{task_id}")
-async def get_task_status(task_id: str, db=Depends(get_db)):
+async def get_task_status(task_id: str):
     """
     Endpoint to get the status of a task by its ID.
     """
     r = get_redis()
-    result = await r.get(f"task_result:{task_id}")
+    result = await r.get(task_result_key(task_id))
     if result:
         return json.loads(result)
     return None
@@ -37,4 +46,44 @@ async def get_task_status(task_id: str, db=Depends(get_db)):
     #     }
     
     # return task
-    
\ No newline at end of file
+
+
+@task_router.get("/stream-task/{task_id}")
+async def stream_task_status(task_id: str, request: Request):
+    """
+    Server-sent events stream for a task. Emits a single `result` event
+    as soon as the worker publishes the result, then closes.
+    """
+    async def event_stream():
+        r = get_redis()
+        pubsub = get_pubsub_redis().pubsub()
+        try:
+            # Subscribe before reading the stored result so a result published
+            # in between is not missed
+            await pubsub.subscribe(task_result_channel(task_id))
+            result = await r.get(task_result_key(task_id))
+            if result:
+                yield format_sse("result", json.loads(result))
+                return
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + STREAM_TIMEOUT_SECONDS
+            while loop.time() < deadline:
+                if await request.is_disconnected():
+                    return
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=STREAM_KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse("result", message["data"])
+                return
+            yield format_sse("timeout", json.dumps({"task_id": task_id}))
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,11 +1,15 @@
 import os
-from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
 import hmac
 import hashlib
 import logging
+import time
+from redis.exceptions import RedisError
 
-from utils.event_routing import route_event
-from db import get_db
+from utils.event_routing import event_label
+from utils.webhook_queue import enqueue_webhook
+from utils.metrics import WEBHOOK_SECONDS
 
 WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
 
@@ -24,9 +28,22 @@ def verify_signature(payload_body, signature_header):
     expected_signature = "sha256=" + hash_object.hexdigest()
     return hmac.compare_digest(expected_signature, signature_header)
 
-@webhook_router.post("/webhook")
+@webhook_router.post("/webhook", status_code=202)
 async def handle_webhook(request: Request):
-    logger.info("/webhook called")
+    """
+    Verifies the delivery and buffers it on a Redis stream. Routing and task
+    bookkeeping happen in the webhook consumer, so GitHub gets its ack without
+    waiting on Celery or Postgres.
+    """
+    started = time.perf_counter()
+    try:
+        return await ack_webhook(request)
+    finally:
+        # Headers of unsigned requests are not trusted, not even as a label
+        event = getattr(request.state, "webhook_event", "unverified")
+        WEBHOOK_SECONDS.labels(stage="ack", event=event).observe(time.perf_counter() - started)
+
+async def ack_webhook(request: Request):
     signature = request.headers.get("X-Hub-Signature-256", "")
     body = await request.body()
     
@@ -34,12 +51,15 @@ async def handle_webhook(request: Request):
         raise HTTPException(status_code=401, detail="Invalid signature")
     
     event_type = request.headers.get("X-GitHub-Event")
-    payload = await request.json()
+    request.state.webhook_event = event_label(event_type)
+    delivery_id = request.headers.get("X-GitHub-Delivery")
     
     try:
-        route_event(event_type, payload)
-    except Exception as e:
+        entry_id = await enqueue_webhook(event_type, delivery_id, body)
+    except RedisError as e:
         logger.error(f"Error in /webhook: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing event: {str(e)}")
-    return {"status": "success", "message": f"Processed {event_type} event"}
-    
\ No newline at end of file
+        raise HTTPException(status_code=503, detail="Could not buffer event")
+    if entry_id is None:
+        logger.info(f"Ignoring redelivered webhook {delivery_id}")
+        return JSONResponse(status_code=202, content={"status": "duplicate", "message": f"Delivery {delivery_id} already received"})
+    return {"status": "accepted", "message": f"Queued {event_type} event"}
@@ -0,0 +1,180 @@
+"""
+Query plan regression check for the hot query paths.
+
+Seeds synthetic users, repositories, PRs, merge conflicts, resolutions and
+tasks inside a transaction, runs ANALYZE, EXPLAINs every hot query and fails
+if any of them falls back to a sequential scan of a large table. Also pages
+through /merge-details under each filter and fails if the listed repositories
+and PRs disagree with the totals shown next to them. Everything
+is rolled back at the end, so it is safe to point at a development database
+that has the latest migrations applied.
+
+Usage (from backend/):
+    python -m scripts.check_query_plans [--prs 50000]
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import desc, func, select, text
+from sqlalchemy.dialects import postgresql
+
+from db import engine
+from models.merge_conflicts import MergeConflict
+from models.pr import PullRequests
+from models.repo import Repository
+from models.resolved_code import Resolved_code
+from models.taskLog import Task
+from utils.merge_details import merge_details_counts_query, merge_details_page_query
+
+# Synthetic rows use ids far above anything real so they cannot collide
+SEED_ID_BASE = 2_000_000_000
+SCANNED_TABLES = {"repositories", "pr", "merge_conflicts", "resolved_code", "task"}
+
+
+# Filters of the /merge-details page whose rows must add up to its totals
+MERGE_DETAILS_FILTERS = [
+    {},
+    {"conflicted": True},
+    {"conflicted": False},
+    {"state": "open"},
+    {"state": "closed"},
+    {"state": "open", "conflicted": False},
+]
+MERGE_DETAILS_PAGE_SIZE = 100
+
+
+def seed(connection, prs: int):
+    users = max(prs // 500, 1)
+    repos = max(prs // 50, 1)
+    # Repositories past the first `repos` get no PRs
+    empty_repos = max(repos // 10, 1)
+    params = {"base": SEED_ID_BASE, "users": users, "repos": repos, "empty_repos": empty_repos, "prs": prs}
+    statements = [
+        """INSERT INTO "user" (id, username, github_id, created_at)
+           SELECT :base + g, 'seed-user-' || g, :base + g, now()
+           FROM generate_series(1, :users) g""",
+        """INSERT INTO repositories (id, user_id, installation_id, github_id, node_id, name, full_name, private, status, created_at)
+           SELECT :base + g, :base + 1 + g % :users, g, :base + g, 'seed-repo-' || g, 'repo' || g, 'seed/repo' || g, false, 'active', now()
+           FROM generate_series(1, :repos + :empty_repos) g""",
+        """INSERT INTO pr (id, repo_id, pr_number, installation_id, url, github_id, node_id, state, mergeable, title, commits, created_at)
+           SELECT :base + g, :base + 1 + g % :repos, g, g, 'https://example.invalid', :base + g, 'seed-pr-' || g,
+                  (ARRAY['open', 'closed'])[1 + g % 2], (ARRAY[true, false, NULL])[1 + g % 3], 'seed', 1,
+                  now() - (g % 1000) * interval '1 hour'
+           FROM generate_series(1, :prs) g""",
+        """INSERT INTO merge_conflicts (id, pr_id, status, created_at)
+           SELECT :base + g, :base + g, (ARRAY['open', 'resolved', 'accepted', 'rejected', 'closed', 'overwritten'])[1 + g % 6],
+                  now() - (g % 1000) * interval '1 hour'
+           FROM generate_series(1, :prs) g""",
+        """INSERT INTO resolved_code (id, merge_conflict_id, task_id, file_path, resolved_code_branch, confidence_score, created_at)
+           SELECT :base + g, :base + g, 'seed-task-' || g, 'file.py', 'auto-fix-seed', (g % 100) / 100.0, now()
+           FROM generate_series(1, :prs) g""",
+        """INSERT INTO task (id, pr_id, status, task_type, merge_id, celery_task_id, created_at)
+           SELECT 'seed-task-' || g, :base + g, 'resolved', 'merge_conflicts', :base + g, 'seed-celery-' || g, now()
+           FROM generate_series(1, :prs) g""",
+    ]
+    for statement in statements:
+        connection.execute(text(statement), params)
+    for table in sorted(SCANNED_TABLES):
+        connection.execute(text(f'ANALYZE "{table}"'))
+
+
+def hot_queries():
+    """Statements mirroring the hot paths, keyed by where they are used"""
+    user_id = SEED_ID_BASE + 1
+    repo_ids = [SEED_ID_BASE + i for i in range(1, 51)]
+    pr_ids = [SEED_ID_BASE + i for i in range(1, 51)]
+    return {
+        "repositories by user (dashboard, merge-details)":
+            select(Repository).where(Repository.user_id == user_id),
+        "PRs by repo (dashboard, merge-details)":
+            select(PullRequests.id).where(PullRequests.repo_id.in_(repo_ids)),
+        "conflicts by PR (dashboard, merge-details)":
+            select(MergeConflict).where(MergeConflict.pr_id.in_(pr_ids)),
+        "page of repositories with PRs (merge-details)":
+            merge_details_page_query(user_id, 100, after=(repo_ids[0], pr_ids[0])),
+        "repository, PR and conflict totals (merge-details)":
+            merge_details_counts_query(user_id),
+        "latest conflict of a PR by status (handle_new_pr)":
+            select(MergeConflict).where(MergeConflict.pr_id == pr_ids[0], MergeConflict.status == 'open')
+                .order_by(desc(MergeConflict.created_at)).limit(1),
+        "conflicts open for >30 min (dashboard)":
+            select(func.count(MergeConflict.id)).where(MergeConflict.status == 'open', MergeConflict.created_at < datetime.now() - timedelta(minutes=30)),
+        "resolutions by conflict (dashboard rollup)":
+            select(Resolved_code).where(Resolved_code.merge_conflict_id.in_(pr_ids)),
+        "task by celery task id (every Celery task start)":
+            select(Task).where(Task.celery_task_id == 'seed-celery-1'),
+        "tasks by merge (handle_new_pr)":
+            select(Task).where(Task.merge_id == pr_ids[0]),
+    }
+
+
+def sequential_scans(plan: dict):
+    """Yields the tables read with a sequential scan anywhere in the plan"""
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in SCANNED_TABLES:
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from sequential_scans(child)
+
+
+def merge_details_listed(connection, user_id: int, filters: dict):
+    """Repositories and PRs listed by paging through /merge-details to the end"""
+    repos, prs, after = set(), 0, None
+    while True:
+        rows = connection.execute(merge_details_page_query(user_id, MERGE_DETAILS_PAGE_SIZE, after=after, **filters)).all()
+        page = rows[:MERGE_DETAILS_PAGE_SIZE]
+        repos.update(row.repo_id for row in page)
+        prs += sum(row.pr_id is not None for row in page)
+        if len(rows) <= MERGE_DETAILS_PAGE_SIZE:
+            return len(repos), prs
+        after = (page[-1].repo_id, page[-1].pr_id or 0)
+
+
+def check_merge_details_totals(connection) -> list:
+    """Names of the filters whose page rows disagree with the page's totals"""
+    user_id = SEED_ID_BASE + 1
+    failures = []
+    for filters in MERGE_DETAILS_FILTERS:
+        name = "merge-details totals " + (", ".join(f"{key}={value}" for key, value in filters.items()) or "unfiltered")
+        counts = connection.execute(merge_details_counts_query(user_id, **filters)).one()
+        listed = merge_details_listed(connection, user_id, filters)
+        totals = (counts.total_repos, counts.total_prs)
+        status = "FAIL" if listed != totals else "ok"
+        print(f"[{status}] {name}" + (f": pages list {listed[0]} repos and {listed[1]} PRs, totals say {totals[0]} and {totals[1]}" if listed != totals else ""))
+        if listed != totals:
+            failures.append(name)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if hot queries plan sequential scans or merge-details totals disagree with its pages")
+    parser.add_argument("--prs", type=int, default=50000, help="Number of synthetic PRs to seed")
+    args = parser.parse_args()
+
+    failures = []
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            seed(connection, args.prs)
+            for name, statement in hot_queries().items():
+                sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                plan = connection.execute(text("EXPLAIN (FORMAT JSON) " + sql)).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = sorted(set(sequential_scans(plan[0]["Plan"])))
+                status = "FAIL" if scans else "ok"
+                print(f"[{status}] {name}" + (f": seq scan on {', '.join(scans)}" if scans else ""))
+                if scans:
+                    failures.append(name)
+            failures.extend(check_merge_details_totals(connection))
+        finally:
+            transaction.rollback()
+
+    if failures:
+        print(f"{len(failures)} checks failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,12 @@ from functools import wraps
 from fastapi import HTTPException
 import os
 from pathlib import Path
-import time
 from authlib.integrations.starlette_client import OAuth
 from fastapi import Depends, Request
 from fastapi.responses import JSONResponse
-import httpx
 from jose import jwt
-from redis_setup import get_redis
 from dotenv import load_dotenv
-from db import get_db
-from models.user import User
+from utils.user_cache import UserPrincipal, aload_user, get_cached_user, load_user
 
 load_dotenv()
 # OAuth setup
@@ -51,52 +47,6 @@ def get_private_key():
 
 
 
-async def generate_new_installation_token(installation_id: str):
-    async with httpx.AsyncClient() as client:
-        # Create JWT for app authentication
-        app_jwt = jwt.encode(
-            {
-                "iat": int(time.time()),
-                "exp": int(time.time()) + 600,
-                "iss": GITHUB_APP_ID
-            },
-            get_private_key(),
-            algorithm="RS256"
-        )
-        # Get installation token
-        headers = {
-            "Authorization": f"Bearer {app_jwt}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        token_response = await client.post(
-            f"https://api.github.com/app/installations/{installation_id}/access_tokens",
-            headers=headers
-        )
-        token_response.raise_for_status()
-        print(token_response.text)
-        json_response = token_response.json()
-        installation_token = json_response["token"]
-        expires_at = json_response["expires_at"]
-        return installation_token, expires_at
-
-async def get_or_refresh_installation_token(installation_id: str):
-    redis = get_redis()
-    installation_token= await redis.get(f"installation_id:{installation_id}")
-    expires_at = await redis.get(f"installation_id:{installation_id}_expires_at")
-
-    if installation_token and expires_at:
-        expiry_time = datetime.strptime(expires_at, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-        current_time = datetime.now(timezone.utc)
-        if expiry_time > current_time:
-            return installation_token
-
-    # Re-generate token here
-    new_token, expires_at = await generate_new_installation_token(installation_id)
-    await redis.set(f"installation_id:{installation_id}", new_token, ex=3600)
-    await redis.set(f"installation_id:{installation_id}_expires_at", expires_at, ex=3600)
-    return new_token
-
-
 def create_jwt_token(user):
     """Create a JWT token for the user session"""
     payload = {
@@ -111,20 +61,31 @@ def create_jwt_token(user):
     token = jwt.encode(payload, os.getenv("JWT_KEY"), algorithm="HS256")
     return token
 
-def verify_token(token: str):
-    """Verify the JWT token and return the user data"""
+def decode_token(token: str) -> dict:
+    """Decode and verify the JWT token, returning its payload"""
     try:
-        db = next(get_db())
-        payload = jwt.decode(token, os.getenv("JWT_KEY"), algorithms=["HS256"])
-        user = db.query(User).filter(User.id == payload["user_id"]).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        return jwt.decode(token, os.getenv("JWT_KEY"), algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.JWTError as e:
         raise HTTPException(status_code=401, detail=str(e))
 
+def verify_token(token: str) -> UserPrincipal:
+    """Verify the JWT token and return the user data"""
+    payload = decode_token(token)
+    user = get_cached_user(payload["user_id"]) or load_user(payload["user_id"])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def averify_token(token: str) -> UserPrincipal:
+    """Async variant of verify_token, reads the user through the async engine on a cache miss"""
+    payload = decode_token(token)
+    user = get_cached_user(payload["user_id"]) or await aload_user(payload["user_id"])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
 def jwt_required(func):
     @wraps(func)
     async def wrapper(request: Request, *args, **kwargs):
@@ -134,7 +95,7 @@ def jwt_required(func):
 
         token = auth_header.split(" ")[1]
         try:
-            user = verify_token(token)
+            user = await averify_token(token)
             request.state.user = user
         except HTTPException as e:
             return JSONResponse(status_code=401, content={"detail": e.detail})
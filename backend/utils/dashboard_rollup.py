@@ -0,0 +1,124 @@
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import Date, Integer, String, and_, case, cast, extract, func, insert, literal, select, union_all
+
+from config import celery_app
+from db import session_scope
+from models.dashboard_rollup import DashboardRollup
+from models.merge_conflicts import MergeConflict
+from models.pr import PullRequests
+from models.repo import Repository
+from models.resolved_code import Resolved_code
+
+# Marker row written by a full build, so a user with no activity is not
+# rebuilt from history on every /dashboard load
+ROLLUP_BUILT = 'built'
+
+
+def day_of(column):
+    return cast(func.date_trunc('day', column), Date)
+
+
+def hour_bucket(column):
+    """Buckets a timestamp into the dashboard's 08-11, 11-14, 14-17, 17-20 and night slots"""
+    hour = extract('hour', column)
+    return case(
+        (and_(hour >= 8, hour < 11), '0'),
+        (and_(hour >= 11, hour < 14), '1'),
+        (and_(hour >= 14, hour < 17), '2'),
+        (and_(hour >= 17, hour < 20), '3'),
+        else_='4'
+    )
+
+
+def confidence_bucket(column):
+    """Index of the 10%-wide confidence bucket for a 0-1 confidence score"""
+    return cast(cast(func.least(func.greatest(func.ceil(column * 10) - 1, 0), 9), Integer), String)
+
+
+def rollup_select(user_id: int, days: Optional[Iterable[date]] = None):
+    """
+    Aggregates the user's PRs, conflicts and resolutions into rollup rows,
+    restricted to the given days if any.
+    """
+    pr_day = day_of(PullRequests.created_at)
+    conflict_day = day_of(MergeConflict.created_at)
+    user = literal(user_id, Integer)
+    if days is not None:
+        days = list(days)
+
+    def pr_query(*columns):
+        query = select(user, pr_day, *columns, func.count()) \
+            .select_from(PullRequests) \
+            .join(Repository, PullRequests.repo_id == Repository.id) \
+            .where(Repository.user_id == user_id)
+        if days is not None:
+            query = query.where(pr_day.in_(days))
+        return query
+
+    def conflict_query(*columns):
+        query = select(user, conflict_day, *columns, func.count()) \
+            .select_from(MergeConflict) \
+            .join(PullRequests, MergeConflict.pr_id == PullRequests.id) \
+            .join(Repository, PullRequests.repo_id == Repository.id) \
+            .where(Repository.user_id == user_id)
+        if days is not None:
+            query = query.where(conflict_day.in_(days))
+        return query
+
+    pr_hour = hour_bucket(PullRequests.created_at)
+    conflict_hour = hour_bucket(MergeConflict.created_at)
+    confidence = func.concat(confidence_bucket(Resolved_code.confidence_score), ':', MergeConflict.status)
+
+    queries = [
+        pr_query(literal('pr'), literal('total')).group_by(pr_day),
+        pr_query(literal('pr_hour'), pr_hour).group_by(pr_day, pr_hour),
+        conflict_query(literal('conflict_status'), MergeConflict.status).group_by(conflict_day, MergeConflict.status),
+        conflict_query(literal('conflict_hour'), conflict_hour).group_by(conflict_day, conflict_hour),
+        conflict_query(literal('confidence'), confidence)
+            .join(Resolved_code, Resolved_code.merge_conflict_id == MergeConflict.id)
+            .where(MergeConflict.status.in_(['accepted', 'rejected']))
+            .group_by(conflict_day, confidence),
+    ]
+    return union_all(*queries)
+
+
+def refresh_rollup(db, user_id: int, days: Optional[Iterable[date]] = None):
+    """
+    Recomputes the user's rollup rows for the given days, or for their whole
+    history if days is None, marking the rollup as built. The caller commits.
+    """
+    if days is not None:
+        days = set(days)
+        if not days:
+            return
+    # Serializes concurrent refreshes of the same user, which would otherwise
+    # race between the delete and the insert
+    db.execute(select(func.pg_advisory_xact_lock(user_id)))
+    delete = db.query(DashboardRollup).filter(DashboardRollup.user_id == user_id)
+    if days is not None:
+        delete = delete.filter(DashboardRollup.day.in_(days), DashboardRollup.metric != ROLLUP_BUILT)
+    delete.delete(synchronize_session=False)
+    db.execute(
+        insert(DashboardRollup).from_select(
+            ['user_id', 'day', 'metric', 'bucket', 'count'],
+            rollup_select(user_id, days)
+        )
+    )
+    if days is None:
+        db.execute(insert(DashboardRollup).values(
+            user_id=user_id, day=date.today(), metric=ROLLUP_BUILT, bucket='', count=1
+        ))
+
+
+@celery_app.task
+def refresh_pr_rollup(pr_id: int):
+    """Recomputes the rollup days touched by a PR and its merge conflicts"""
+    with session_scope() as db:
+        user_id = db.query(Repository.user_id).join(PullRequests, PullRequests.repo_id == Repository.id).filter(PullRequests.id == pr_id).scalar()
+        if user_id is None:
+            return
+        days = {day for (day,) in db.query(day_of(PullRequests.created_at)).filter(PullRequests.id == pr_id)}
+        days.update(day for (day,) in db.query(day_of(MergeConflict.created_at)).filter(MergeConflict.pr_id == pr_id).distinct())
+        refresh_rollup(db, user_id, days)
@@ -1,23 +1,36 @@
+from sqlalchemy import select
+
+from models.taskLog import Task
 from utils.repository_db_actions import handle_add_repositories, handle_remove_repositories
 from utils.pr_db_actions import handle_new_pr
 from utils.utils import add_task
 
+# The events route_event handles, the only values the webhook metrics are labelled with
+ROUTED_EVENTS = ("installation", "installation_repositories", "pull_request")
+
+
+def event_label(event_type) -> str:
+    """Metric label of an event, bounded whatever the X-GitHub-Event header says"""
+    return event_type if event_type in ROUTED_EVENTS else "other"
+
 def route_event(event_type, payload):
+    """
+    Maps a webhook event to the Celery work it needs.
+    Returns a list of (task_type, signature) pairs, see dispatch_events.
+    """
     if event_type == "installation_repositories":
         if payload.get("action") == "added":
             repos = payload.get("repositories_added", [])
             installation_id = payload.get("installation", {}).get("id")
             if len(repos)>0 or not installation_id is None:
-                task = handle_add_repositories.delay(repos, installation_id)
-                add_task("add_repo", "queued", celery_task_id=task.id)
+                return [("add_repo", handle_add_repositories.s(repos, installation_id))]
             else:
                 raise ValueError("No repositories added in the payload")
         elif payload.get("action") == "removed":
             repos = payload.get("repositories_removed", [])
             installation_id = payload.get("installation", {}).get("id")
             if len(repos)>0 or not installation_id is None:
-                task = handle_remove_repositories.delay(repos)
-                add_task("archive_repo", "queued", celery_task_id=task.id)
+                return [("archive_repo", handle_remove_repositories.s(repos))]
             else:
                 raise ValueError("No repositories added in the payload")
     elif event_type == "installation":
@@ -25,18 +38,39 @@ def route_event(event_type, payload):
             repos = payload.get("repositories", [])
             installation_id = payload.get("installation", {}).get("id")
             if len(repos)>0 and not installation_id is None:
-                task = handle_add_repositories.delay(repos, installation_id)
-                add_task("add_repo", "queued", celery_task_id=task.id)
+                return [("add_repo", handle_add_repositories.s(repos, installation_id))]
             else:
                 raise ValueError("No repositories added in the payload")
         elif payload.get("action") == "deleted":
             repos = payload.get("repositories", [])
             installation_id = payload.get("installation", {}).get("id")
             if len(repos)>0 or not installation_id is None:
-                task = handle_remove_repositories.delay(repos)
-                add_task("archive_repo", "queued", celery_task_id=task.id)
+                return [("archive_repo", handle_remove_repositories.s(repos))]
             else:
                 raise ValueError("No repositories added in the payload")
     elif event_type == "pull_request":
-        task = handle_new_pr.delay(payload)
-        add_task("handle_pr_event", "queued", celery_task_id=task.id)
+        return [("handle_pr_event", handle_new_pr.s(payload))]
+    return []
+
+def dispatch_events(db, routed, sent=frozenset(), mark_sent=None):
+    """
+    Records a queued Task for every routed event in a single commit, then
+    sends the work to Celery. Task rows exist before any worker can look
+    them up by celery_task_id.
+    routed holds (task_type, signature, celery_task_id) triples. Ids that
+    already have a Task row reuse it and ids in sent are not sent again, so
+    dispatching a redelivered batch under the same ids does not duplicate
+    work; mark_sent is called with each id once Celery has it.
+    """
+    ids = [celery_task_id for _, _, celery_task_id in routed]
+    recorded = set(db.scalars(select(Task.celery_task_id).where(Task.celery_task_id.in_(ids)))) if ids else set()
+    for task_type, _, celery_task_id in routed:
+        if celery_task_id not in recorded:
+            add_task(task_type, "queued", celery_task_id=celery_task_id, db=db)
+    db.commit()
+    for _, signature, celery_task_id in routed:
+        if celery_task_id in sent:
+            continue
+        signature.apply_async(task_id=celery_task_id)
+        if mark_sent is not None:
+            mark_sent(celery_task_id)
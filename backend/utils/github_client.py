@@ -0,0 +1,178 @@
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+from redis.exceptions import RedisError
+
+from redis_setup import get_sync_redis
+from utils.metrics import GITHUB_REQUEST_SECONDS
+
+try:
+    import h2  # noqa: F401
+    GITHUB_HTTP2 = True
+except ImportError:
+    GITHUB_HTTP2 = False
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_POOL_SIZE = int(os.getenv("GITHUB_POOL_SIZE", 20))
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", 4))
+# Stop spending an installation's quota when this many requests are left,
+# and wait for the window to reset instead
+GITHUB_RATE_LIMIT_RESERVE = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", 10))
+# Longest a request sleeps for a rate limit before giving up with GitHubRateLimited
+GITHUB_MAX_RATE_LIMIT_WAIT = float(os.getenv("GITHUB_MAX_RATE_LIMIT_WAIT", 60))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20
+# Only these are retried after a 5xx or a timeout, a repeated POST could act twice
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "PATCH", "DELETE"}
+
+_client = None
+_client_pid = None
+
+
+class GitHubRateLimited(Exception):
+    """Raised when a request would have to wait longer than GITHUB_MAX_RATE_LIMIT_WAIT"""
+    def __init__(self, retry_after: float):
+        super().__init__(f"GitHub rate limit, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def get_github_client() -> httpx.Client:
+    """Process-wide client, so connections to GitHub are kept alive and reused"""
+    global _client, _client_pid
+    # A client inherited through a fork would share its sockets with the parent
+    if _client is None or _client_pid != os.getpid():
+        _client = httpx.Client(
+            base_url=GITHUB_API_URL,
+            http2=GITHUB_HTTP2,
+            limits=httpx.Limits(max_connections=GITHUB_POOL_SIZE, max_keepalive_connections=GITHUB_POOL_SIZE),
+            timeout=httpx.Timeout(15, connect=5),
+            headers={"User-Agent": "git-sleuth"}
+        )
+        _client_pid = os.getpid()
+    return _client
+
+
+def close_github_client():
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+    _client = None
+    _client_pid = None
+
+
+def rate_limit_key(key) -> str:
+    return f"github_rate_limit:{key}"
+
+
+def _rate_limit_wait(key) -> float:
+    """Seconds to wait before spending more of this installation's quota"""
+    try:
+        remaining, reset, blocked_until = get_sync_redis().hmget(rate_limit_key(key), "remaining", "reset", "blocked_until")
+    except RedisError as e:
+        print(f"Could not read GitHub rate limit state: {e}")
+        return 0
+    now = time.time()
+    wait = 0
+    if blocked_until and float(blocked_until) > now:
+        wait = float(blocked_until) - now
+    if remaining is not None and reset and int(remaining) <= GITHUB_RATE_LIMIT_RESERVE and float(reset) > now:
+        wait = max(wait, float(reset) - now)
+    return wait
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Delay GitHub asks for on a primary or secondary rate limit response, None otherwise"""
+    if response.status_code not in (403, 429):
+        return None
+    if "retry-after" in response.headers:
+        return float(response.headers["retry-after"])
+    if response.headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in response.headers:
+        return max(float(response.headers["x-ratelimit-reset"]) - time.time(), 1)
+    # Secondary limits without a Retry-After ask for at least a minute
+    if response.status_code == 429 or "secondary rate limit" in response.text.lower():
+        return 60
+    return None
+
+
+def _record_rate_limit(key, response: httpx.Response, retry_after: Optional[float]):
+    mapping = {}
+    if "x-ratelimit-remaining" in response.headers and "x-ratelimit-reset" in response.headers:
+        mapping["remaining"] = response.headers["x-ratelimit-remaining"]
+        mapping["reset"] = response.headers["x-ratelimit-reset"]
+    if retry_after is not None:
+        mapping["blocked_until"] = time.time() + retry_after
+    if not mapping:
+        return
+    try:
+        pipe = get_sync_redis().pipeline()
+        pipe.hset(rate_limit_key(key), mapping=mapping)
+        pipe.expire(rate_limit_key(key), 3700)
+        pipe.execute()
+    except RedisError as e:
+        print(f"Could not record GitHub rate limit state: {e}")
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _sleep_for_rate_limit(wait: float):
+    if wait > GITHUB_MAX_RATE_LIMIT_WAIT:
+        raise GitHubRateLimited(wait)
+    # Jitter keeps waiting workers from all firing the moment the window resets
+    time.sleep(wait + random.uniform(0, 1))
+
+
+def retryable_transport_error(error: httpx.TransportError, method: str) -> bool:
+    # Nothing reached GitHub on a failed connect, safe to retry any method
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return method in IDEMPOTENT_METHODS
+
+
+def github_request(method: str, path: str, token: Optional[str] = None, installation_id=None, **kwargs) -> httpx.Response:
+    """
+    Sends a request to the GitHub API on the shared client. path is relative to
+    GITHUB_API_URL (absolute URLs are used as is).
+    Rate limit headers are tracked per installation in Redis, so every worker
+    delays requests once an installation's quota runs low. Rate limit responses
+    are retried after the delay GitHub asks for, network errors and 5xx of
+    idempotent requests with jittered exponential backoff. The final response is
+    returned, callers check its status.
+    """
+    method = method.upper()
+    key = installation_id if installation_id is not None else "app"
+    headers = {"Accept": "application/vnd.github+json", **kwargs.pop("headers", {})}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    attempt = 0
+    while True:
+        wait = _rate_limit_wait(key)
+        if wait > 0:
+            _sleep_for_rate_limit(wait)
+        started = time.perf_counter()
+        try:
+            response = get_github_client().request(method, path, headers=headers, **kwargs)
+        except httpx.TransportError as e:
+            GITHUB_REQUEST_SECONDS.labels(method=method, status="error").observe(time.perf_counter() - started)
+            if not retryable_transport_error(e, method) or attempt >= GITHUB_MAX_RETRIES:
+                raise
+        else:
+            GITHUB_REQUEST_SECONDS.labels(method=method, status=str(response.status_code)).observe(time.perf_counter() - started)
+            retry_after = _retry_after(response)
+            _record_rate_limit(key, response, retry_after)
+            if attempt >= GITHUB_MAX_RETRIES:
+                return response
+            if retry_after is not None:
+                print(f"GitHub rate limited {method} {path}, retrying in {retry_after:.0f}s")
+                _sleep_for_rate_limit(retry_after)
+                attempt += 1
+                continue
+            if response.status_code < 500 or method not in IDEMPOTENT_METHODS:
+                return response
+        time.sleep(_backoff(attempt))
+        attempt += 1
@@ -0,0 +1,71 @@
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from redis_setup import get_sync_redis
+
+# Tasks of one installation that may run at once on each capped queue, so a
+# single busy installation cannot take every worker of a pool
+INSTALLATION_CONCURRENCY = {
+    "github-io": int(os.getenv("GITHUB_IO_INSTALLATION_CONCURRENCY", 8)),
+    "llm": int(os.getenv("LLM_INSTALLATION_CONCURRENCY", 4)),
+    "onboarding": int(os.getenv("ONBOARDING_INSTALLATION_CONCURRENCY", 2)),
+}
+# A slot not released within this many seconds (the worker died) is freed
+INSTALLATION_SLOT_LEASE = int(os.getenv("INSTALLATION_SLOT_LEASE", 1800))
+# Tasks that find no free slot go back to the queue after about this long,
+# behind the other installations' tasks
+INSTALLATION_SLOT_RETRY_DELAY = float(os.getenv("INSTALLATION_SLOT_RETRY_DELAY", 5))
+
+# Slots are members of a sorted set scored by lease expiry. Expired leases are
+# dropped, then the slot is taken if the installation is under its limit
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+
+def installation_slots_key(kind: str, installation_id) -> str:
+    return f"installation_slots:{kind}:{installation_id}"
+
+
+def acquire_slot(kind: str, installation_id, holder: str) -> bool:
+    now = time.time()
+    acquired = get_sync_redis().eval(
+        ACQUIRE_SCRIPT, 1, installation_slots_key(kind, installation_id),
+        now, now + INSTALLATION_SLOT_LEASE, holder, INSTALLATION_CONCURRENCY[kind], INSTALLATION_SLOT_LEASE
+    )
+    return bool(acquired)
+
+
+def release_slot(kind: str, installation_id, holder: str):
+    get_sync_redis().zrem(installation_slots_key(kind, installation_id), holder)
+
+
+@contextmanager
+def installation_slot(task, kind: str, installation_id, **retry_kwargs):
+    """
+    Runs the body holding one of the installation's slots for kind. Without a
+    free slot the task is retried later instead of blocking the worker, so
+    capped tasks are declared with max_retries=None. retry_kwargs are passed
+    to task.retry, e.g. kwargs for tasks that keep state across retries. Pass
+    args along with kwargs: task.retry keeps the original positional args
+    otherwise, and kwargs repeating them make the retried message invalid.
+    """
+    if installation_id is None:
+        yield
+        return
+    holder = task.request.id
+    if not acquire_slot(kind, installation_id, holder):
+        countdown = INSTALLATION_SLOT_RETRY_DELAY * random.uniform(1, 2)
+        raise task.retry(countdown=countdown, **retry_kwargs)
+    try:
+        yield
+    finally:
+        release_slot(kind, installation_id, holder)
@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from itertools import chain
+from typing import Iterable, Optional
+
+import redis
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from config import celery_app
+from db import session_scope
+from models.merge_conflicts import MergeConflict
+from models.pr import PullRequests
+from models.repo import Repository
+from models.user import User
+from redis_setup import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+CONFLICT_STATUSES = ['open', 'closed', 'resolved', 'escalated', 'accepted', 'rejected', 'overwritten']
+# Days of per day conflict counts kept, /dashboard shows the last week
+LIVE_COUNTER_DAYS = 15
+
+# Conflicts by status, per user and per repository, and per user per day of
+# creation. Kept current by the session listeners below and rebuilt from
+# Postgres by reconcile_live_counters, so /dashboard never counts rows.
+OPEN_CONFLICTS_KEY = "live_counters:open_conflicts"
+# Set by the last reconcile, the open set is only trusted once it exists
+RECONCILED_KEY = "live_counters:reconciled_at"
+
+# Increments to KEYS[2] are only applied once the user's hash KEYS[1] has been
+# seeded, so a partial hash is never mistaken for a complete one. ARGV lists
+# every status, zero deltas included, so a repository or day hash missing
+# from a seeded user, e.g. the day that started after the last seed, is
+# created with all of its statuses
+INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+def user_conflicts_key(user_id: int) -> str:
+    return f"live_counters:conflicts:user:{user_id}"
+
+
+def repo_conflicts_key(repo_id: int) -> str:
+    return f"live_counters:conflicts:repo:{repo_id}"
+
+
+def user_day_conflicts_key(user_id: int, day: date) -> str:
+    return f"live_counters:conflicts:user:{user_id}:{day.isoformat()}"
+
+
+def day_expiry(day: date) -> int:
+    return int(time.mktime((day + timedelta(days=LIVE_COUNTER_DAYS + 1)).timetuple()))
+
+
+def conflict_day(created_at: datetime) -> date:
+    """
+    Day bucket of a conflict. Both the live updates and the reconcile bucket in
+    the app, so the database session's timezone cannot move counts between days.
+    """
+    return created_at.date()
+
+
+def first_counted_day() -> date:
+    return date.today() - timedelta(days=LIVE_COUNTER_DAYS - 1)
+
+
+def status_counts(counts: Counter) -> dict:
+    """Every known status, zeros included, so a seeded hash always exists"""
+    return {**dict.fromkeys(CONFLICT_STATUSES, 0), **counts}
+
+
+def status_transition(session, obj):
+    """(old, new) status of a flushed object, None standing for not existing"""
+    history = inspect(obj).attrs.status.history
+    if obj in session.deleted:
+        return next(chain(history.deleted, history.unchanged), None), None
+    if obj in session.new:
+        return None, obj.status
+    if not history.added:
+        return None, None
+    return next(iter(history.deleted), None), history.added[0]
+
+
+@event.listens_for(Session, "after_flush")
+def collect_status_transitions(session, flush_context):
+    """
+    Records the MergeConflict status changes of the flush, applied to Redis
+    once the transaction commits. Bulk query.update() calls bypass
+    this, the reconcile job corrects for them.
+    """
+    conflicts = []
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, MergeConflict):
+            continue
+        old, new = status_transition(session, obj)
+        if old != new:
+            conflicts.append((obj.id, obj.pr_id, obj.created_at, old, new))
+    if not conflicts:
+        return
+
+    owners = {
+        pr_id: (repo_id, user_id) for pr_id, repo_id, user_id in session.execute(
+            select(PullRequests.id, PullRequests.repo_id, Repository.user_id)
+            .join(Repository, PullRequests.repo_id == Repository.id)
+            .where(PullRequests.id.in_({pr_id for _, pr_id, _, _, _ in conflicts}))
+        )
+    }
+    transitions = session.info.setdefault("live_counter_transitions", [])
+    for conflict_id, pr_id, created_at, old, new in conflicts:
+        if pr_id in owners:
+            transitions.append((conflict_id, *owners[pr_id], created_at, old, new))
+
+
+@event.listens_for(Session, "after_commit")
+def apply_status_transitions(session):
+    transitions = session.info.pop("live_counter_transitions", None)
+    if not transitions:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        apply_transitions_safely(transitions)
+    else:
+        # Committed through an AsyncSession, keep the blocking round trip off the event loop
+        loop.run_in_executor(None, apply_transitions_safely, transitions)
+
+
+def apply_transitions_safely(conflicts: list):
+    try:
+        apply_transitions(conflicts)
+    except redis.RedisError as e:
+        # The data is committed, the next reconcile brings the counters back in line
+        logger.warning(f"Live counter update failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_status_transitions(session):
+    session.info.pop("live_counter_transitions", None)
+
+
+def apply_transitions(conflicts: list):
+    """Applies a committed transaction's status changes in one MULTI/EXEC"""
+    increments = defaultdict(Counter)
+    expiries = {}
+    first_day = first_counted_day()
+    pipe = get_sync_redis().pipeline()
+    for conflict_id, repo_id, user_id, created_at, old, new in conflicts:
+        user_key = user_conflicts_key(user_id)
+        keys = [user_key, repo_conflicts_key(repo_id)]
+        day = conflict_day(created_at)
+        if day >= first_day:
+            keys.append(user_day_conflicts_key(user_id, day))
+            expiries[keys[-1]] = day_expiry(day)
+        for key in keys:
+            increments[user_key, key][old] -= 1
+            increments[user_key, key][new] += 1
+        if new == 'open':
+            pipe.zadd(OPEN_CONFLICTS_KEY, {conflict_id: created_at.timestamp()})
+        elif old == 'open':
+            pipe.zrem(OPEN_CONFLICTS_KEY, conflict_id)
+
+    for (user_key, key), counts in increments.items():
+        counts.pop(None, None)
+        if any(counts.values()):
+            args = [arg for status, delta in status_counts(counts).items() for arg in (status, delta)]
+            pipe.eval(INCREMENT_SCRIPT, 2, user_key, key, *args)
+    for key, expiry in expiries.items():
+        pipe.expireat(key, expiry)
+    pipe.execute()
+
+
+def conflict_snapshot(db, user_id: Optional[int] = None) -> dict:
+    """
+    Current conflict counts from Postgres, of one user or of every user:
+    {user_id: {"statuses": Counter, "repos": {repo_id: Counter}, "days": {day: Counter}}}
+    """
+    snapshot = defaultdict(lambda: {"statuses": Counter(), "repos": defaultdict(Counter), "days": defaultdict(Counter)})
+    users = select(User.id)
+    repos = select(Repository.user_id, Repository.id)
+    by_repo = select(Repository.user_id, Repository.id, MergeConflict.status, func.count()) \
+        .select_from(MergeConflict) \
+        .join(PullRequests, MergeConflict.pr_id == PullRequests.id) \
+        .join(Repository, PullRequests.repo_id == Repository.id) \
+        .group_by(Repository.user_id, Repository.id, MergeConflict.status)
+    # Recent conflicts one by one, bucketed by conflict_day like the live updates
+    recent = select(Repository.user_id, MergeConflict.created_at, MergeConflict.status) \
+        .select_from(MergeConflict) \
+        .join(PullRequests, MergeConflict.pr_id == PullRequests.id) \
+        .join(Repository, PullRequests.repo_id == Repository.id) \
+        .where(MergeConflict.created_at >= datetime.combine(first_counted_day(), datetime.min.time()))
+    if user_id is not None:
+        users = users.where(User.id == user_id)
+        repos = repos.where(Repository.user_id == user_id)
+        by_repo = by_repo.where(Repository.user_id == user_id)
+        recent = recent.where(Repository.user_id == user_id)
+
+    for (uid,) in db.execute(users):
+        snapshot[uid]
+    for uid, repo_id in db.execute(repos):
+        snapshot[uid]["repos"][repo_id]
+    for uid, repo_id, status, count in db.execute(by_repo):
+        snapshot[uid]["statuses"][status] += count
+        snapshot[uid]["repos"][repo_id][status] += count
+    for uid, created_at, status in db.execute(recent):
+        snapshot[uid]["days"][conflict_day(created_at)][status] += 1
+    return snapshot
+
+
+def queue_user_counters(pipe, user_id: int, counters: dict):
+    """Queues the commands replacing a user's counters, on a sync or an async pipeline"""
+    replace = {user_conflicts_key(user_id): counters["statuses"]}
+    replace.update((repo_conflicts_key(repo_id), counts) for repo_id, counts in counters["repos"].items())
+    for key, counts in replace.items():
+        pipe.delete(key)
+        pipe.hset(key, mapping=status_counts(counts))
+    today = date.today()
+    for day in (today - timedelta(days=offset) for offset in range(LIVE_COUNTER_DAYS)):
+        key = user_day_conflicts_key(user_id, day)
+        pipe.delete(key)
+        pipe.hset(key, mapping=status_counts(counters["days"].get(day, Counter())))
+        pipe.expireat(key, day_expiry(day))
+
+
+async def seed_user_counters(db, user_id: int):
+    """Builds a user's counters from Postgres, db being an AsyncSession"""
+    snapshot = await db.run_sync(conflict_snapshot, user_id)
+    pipe = get_redis().pipeline()
+    queue_user_counters(pipe, user_id, snapshot[user_id])
+    await pipe.execute()
+
+
+async def read_live_counters(user_id: int, days: Iterable[date], open_before: datetime) -> Optional[dict]:
+    """
+    The user's conflicts by status, overall and for each of days, in a single
+    round trip. None if the user's counters are not seeded yet. open_overdue
+    counts the conflicts, of every user, open since before open_before; it is
+    None until the first reconcile has built the open set.
+    """
+    days = list(days)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hgetall(user_conflicts_key(user_id))
+    for day in days:
+        pipe.hgetall(user_day_conflicts_key(user_id, day))
+    pipe.exists(RECONCILED_KEY)
+    pipe.zcount(OPEN_CONFLICTS_KEY, '-inf', f"({open_before.timestamp()}")
+    statuses, *per_day, reconciled, open_overdue = await pipe.execute()
+    if not statuses:
+        return None
+    return {
+        "statuses": {status: int(count) for status, count in statuses.items()},
+        "days": {day: {status: int(count) for status, count in counts.items()} for day, counts in zip(days, per_day)},
+        "open_overdue": open_overdue if reconciled else None,
+    }
+
+
+@celery_app.task
+def reconcile_live_counters():
+    """
+    Rebuilds every counter from Postgres, run periodically by celery beat.
+    Corrects drift from failed Redis writes, bulk updates and transitions that
+    raced a previous reconcile.
+    """
+    with session_scope() as db:
+        snapshot = conflict_snapshot(db)
+        open_conflicts = {
+            conflict_id: created_at.timestamp() for conflict_id, created_at in
+            db.query(MergeConflict.id, MergeConflict.created_at).filter(MergeConflict.status == 'open')
+        }
+
+    client = get_sync_redis()
+    for user_id, counters in snapshot.items():
+        pipe = client.pipeline()
+        queue_user_counters(pipe, user_id, counters)
+        pipe.execute()
+
+    pipe = client.pipeline()
+    pipe.delete(OPEN_CONFLICTS_KEY)
+    if open_conflicts:
+        pipe.zadd(OPEN_CONFLICTS_KEY, open_conflicts)
+    pipe.set(RECONCILED_KEY, int(time.time()))
+    pipe.execute()
+    print(f"Reconciled live counters of {len(snapshot)} users, {len(open_conflicts)} open conflicts")
@@ -1,6 +1,11 @@
-import asyncio
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import tiktoken
 from langchain.agents import Tool
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain.chat_models import init_chat_model
@@ -10,15 +15,20 @@ from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 from langchain_core.output_parsers import PydanticOutputParser
 from dotenv import load_dotenv
-from celery import current_task
+from celery import chord, current_task
 
 from models.merge_conflicts import MergeConflict
+from models.pr import PullRequests
 from models.resolved_code import Resolved_code
 from utils.utils import generate_random_alphanumeric_string
+from utils.resolution_cache import get_cached_resolution, store_resolution
+from utils.dashboard_rollup import refresh_pr_rollup
+from utils.installation_limits import installation_slot
 from config import celery_app
-from db import get_db
+from db import session_scope
 from models.taskLog import Task
-from redis_setup import get_redis
+from redis_setup import get_sync_redis, task_result_key, task_result_channel
+from utils.metrics import AGENT_SECONDS, FAST_RESOLVER_SECONDS, RESOLUTIONS, ROUTING_DECISIONS, TOOL_SECONDS, record_llm_usage
 import json
 
 
@@ -57,7 +67,9 @@ def get_summary_of_conflict_chunk(conflict_chunk: str) -> IntentSummary:
     The summary should include the intent of both the HEAD and BASE versions of the code.
     """
     chain = intent_prompt | creative_llm 
-    response = chain.invoke({"input_text": conflict_chunk})
+    with TOOL_SECONDS.labels(tool="get_summary_of_conflict_chunk").time():
+        response = chain.invoke({"input_text": conflict_chunk})
+    record_llm_usage(response)
     res = intent_parser.parse(response.content)
     return res
 
@@ -68,67 +80,301 @@ def get_confidence_score(conflict_chunk: str, context: str) -> float:
     The score is between 0 and 1, where 1 means high confidence in the resolution.
     """
     chain = conf_prompt | analytical_llm 
-    response = chain.invoke({"input_text": conflict_chunk, "context": context})
+    with TOOL_SECONDS.labels(tool="get_confidence_score").time():
+        response = chain.invoke({"input_text": conflict_chunk, "context": context})
+    record_llm_usage(response)
     res = confidence_parser.parse(response.content)
     return res.confidence
 
-@tool
-def get_conflict_markers(file_content: str) -> List[str]:
-    """Extracts conflict blocks from a file content that contains git conflict markers.
+def split_conflict_segments(file_content: str) -> List[str]:
     """
-    conflict_blocks = []
-
-    in_conflict = False
+    Splits file content into alternating plain and conflict block segments.
+    Even indices hold the (possibly empty) plain text, odd indices the conflict
+    blocks, so "".join(segments) == file_content.
+    """
+    segments = []
+    plain = []
     current_block = []
-    lines = file_content.splitlines(keepends=True)
+    in_conflict = False
 
-    for line in lines:
+    for line in file_content.splitlines(keepends=True):
         if line.startswith("<<<<<<<"):
+            # An unterminated block stays part of the plain text
+            plain.extend(current_block)
             in_conflict = True
             current_block = [line]
         elif in_conflict:
             current_block.append(line)
             if line.startswith(">>>>>>>"):
                 in_conflict = False
-                conflict_blocks.append("".join(current_block))
+                segments.append("".join(plain))
+                segments.append("".join(current_block))
+                plain = []
                 current_block = []
+        else:
+            plain.append(line)
+
+    plain.extend(current_block)
+    segments.append("".join(plain))
+    return segments
 
-    return conflict_blocks
+@tool
+def get_conflict_markers(file_content: str) -> List[str]:
+    """Extracts conflict blocks from a file content that contains git conflict markers.
+    """
+    return split_conflict_segments(file_content)[1::2]
 
 class ResolvedCode(BaseModel):
     resolved_code: str = Field(..., description="The resolved code after merging the conflict")
     confidence_score: float = Field(..., ge=0.0, le=1.0, description="Confidence score of the resolution between 0 and 1")
 
+RESOLVER_MODEL = "gpt-4o"
+RESOLVER_PROMPT = """You are a helpful assistant that can resolve code conflicts. 
+    Return the resolved code along with a confidence score. 
+    Do not return anything else. Do not show preference for one branch over another.
+    If both branches have valid code, merge them intelligently."""
+
+# Small conflicts are first tried with a single structured call to a cheaper
+# model, only large ones or ones it is unsure about go to the full agent
+FAST_RESOLVER_MODEL = os.getenv("FAST_RESOLVER_MODEL", "gpt-4o-mini")
+FAST_RESOLVER_PROMPT = """You resolve git merge conflicts. 
+    Merge both sides of every conflict intelligently without preferring either branch, 
+    and return the complete resolved code without any conflict markers along with 
+    a confidence score between 0 and 1. Score below 0.5 if the intent of either side is unclear."""
+RESOLVE_ROUTING = os.getenv("RESOLVE_ROUTING", "true").lower() == "true"
+# Conflicts above this many tokens, or with more than FAST_PATH_MAX_HUNKS blocks, skip the fast path
+FAST_PATH_MAX_TOKENS = int(os.getenv("FAST_PATH_MAX_TOKENS", 800))
+FAST_PATH_MAX_HUNKS = int(os.getenv("FAST_PATH_MAX_HUNKS", 1))
+# Fast resolutions below this confidence are redone by the agent
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", 0.8))
+
+fast_llm = ChatOpenAI(
+        model_name=FAST_RESOLVER_MODEL,
+        temperature=0.0)
+
+fast_resolver = ChatPromptTemplate.from_messages([
+    ("system", FAST_RESOLVER_PROMPT),
+    ("user", "{conflict}"),
+]) | fast_llm.with_structured_output(ResolvedCode, include_raw=True)
+
+# Part of every resolution cache key, so changing a model or prompt
+# automatically stops serving resolutions produced by the old ones
+RESOLVER_VERSION = hashlib.sha256(
+    "\0".join([
+        RESOLVER_MODEL,
+        RESOLVER_PROMPT,
+        creative_llm.model_name,
+        intent_prompt.template,
+        analytical_llm.model_name,
+        conf_prompt.template,
+        FAST_RESOLVER_MODEL,
+        FAST_RESOLVER_PROMPT,
+        str(FAST_PATH_MIN_CONFIDENCE),
+    ]).encode("utf-8")
+).hexdigest()[:16]
+
 react_model = init_chat_model(
-    model="gpt-4o",
+    model=RESOLVER_MODEL,
     temperature=0
 )
 
 agent = create_react_agent(
     model=react_model,  
     tools=[get_summary_of_conflict_chunk, get_confidence_score, get_conflict_markers],  
-    prompt="""You are a helpful assistant that can resolve code conflicts. 
-    Return the resolved code along with a confidence score. 
-    Do not return anything else. Do not show preference for one branch over another.
-    If both branches have valid code, merge them intelligently.""",
+    prompt=RESOLVER_PROMPT,
     # debug=True,
     response_format=ResolvedCode
 )
 
-@celery_app.task(name="resolve_conflict")
-def resolve_conflict(conflict_chunk: str, task_id: str, file_path: str) :
+def count_tokens(messages) -> int:
+    """Total tokens of the agent's LLM responses, also recorded per model"""
+    return sum(record_llm_usage(msg) for msg in messages)
+
+# Files with at least this many conflict blocks are resolved block by block,
+# with up to RESOLVE_HUNK_CONCURRENCY agent runs in flight at once
+RESOLVE_FANOUT = os.getenv("RESOLVE_FANOUT", "true").lower() == "true"
+RESOLVE_FANOUT_MIN_HUNKS = int(os.getenv("RESOLVE_FANOUT_MIN_HUNKS", 2))
+RESOLVE_HUNK_CONCURRENCY = int(os.getenv("RESOLVE_HUNK_CONCURRENCY", 4))
+
+def run_resolver_agent(conflict_text: str):
     """
-    Resolves a conflict chunk using the agent.
-    The conflict chunk is expected to be in the format of a git conflict marker.
-    Returns the resolved code and confidence score.
+    Runs the agent on conflict text.
+    Returns the structured ResolvedCode and the total tokens used.
     """
-    
-    celery_task_id = current_task.request.id
-    db = next(get_db())
+    with AGENT_SECONDS.time():
+        response = agent.invoke(
+            {"messages": [{"role": "user", "content": conflict_text}]}
+        )
+    return response['structured_response'], count_tokens(response["messages"])
+
+# Routing decisions from cheapest to most expensive, a file resolved in
+# several hunks is recorded with the most expensive one
+ROUTES = ["cache", "fast", "escalated", "agent"]
+
+@lru_cache(maxsize=1)
+def routing_encoding():
+    """Tokenizer of the fast model, None if it cannot be loaded (tiktoken downloads it on first use)"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(FAST_RESOLVER_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Could not load tokenizer for routing, estimating token counts: {e}")
+        return None
+
+def count_preflight_tokens(text: str) -> int:
+    encoding = routing_encoding()
+    if encoding is None:
+        # Roughly four characters per token for code
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def route_conflict(conflict_text: str) -> str:
+    """Pre-flight routing, "fast" for small single block conflicts and "agent" otherwise"""
+    if not RESOLVE_ROUTING:
+        return "agent"
+    if len(split_conflict_segments(conflict_text)) // 2 > FAST_PATH_MAX_HUNKS:
+        return "agent"
+    # Cheap upper bound first, a token is at least one character
+    if len(conflict_text) > FAST_PATH_MAX_TOKENS * 8:
+        return "agent"
+    if count_preflight_tokens(conflict_text) > FAST_PATH_MAX_TOKENS:
+        return "agent"
+    return "fast"
+
+def accept_fast_resolution(resolved_code: Optional[ResolvedCode]) -> bool:
+    if resolved_code is None:
+        # The response did not parse into a ResolvedCode
+        return False
+    if resolved_code.confidence_score < FAST_PATH_MIN_CONFIDENCE:
+        return False
+    # Markers left in the output mean the conflict was not actually resolved
+    return not any(marker in resolved_code.resolved_code for marker in ("<<<<<<<", ">>>>>>>"))
+
+def run_fast_resolver(conflict_text: str):
+    """Single structured call to the fast model. Returns the ResolvedCode and the tokens used."""
+    with FAST_RESOLVER_SECONDS.time():
+        response = fast_resolver.invoke({"conflict": conflict_text})
+    return response["parsed"], record_llm_usage(response["raw"])
+
+def resolution_from_cache(cached: dict) -> dict:
+    RESOLUTIONS.labels(source="cache").inc()
+    return {
+        "resolved_code": cached["resolved_code"],
+        "confidence_score": cached["confidence_score"],
+        "token_usage": 0,
+        "cache_hit": True,
+        "cached_token_usage": cached["token_usage"],
+        "routing": "cache",
+    }
+
+def resolution_from_llm(conflict_text: str, resolved_code: ResolvedCode, token_usage: int, routing: str) -> dict:
+    store_resolution(conflict_text, RESOLVER_VERSION, resolved_code.resolved_code, resolved_code.confidence_score, token_usage)
+    RESOLUTIONS.labels(source="llm").inc()
+    ROUTING_DECISIONS.labels(route=routing).inc()
+    return {
+        "resolved_code": resolved_code.resolved_code,
+        "confidence_score": resolved_code.confidence_score,
+        "token_usage": token_usage,
+        "cache_hit": False,
+        "cached_token_usage": None,
+        "routing": routing,
+    }
+
+def resolve_text(conflict_text: str) -> dict:
+    """
+    Resolves conflict text, reusing a cached resolution if there is one. Small
+    conflicts get a single fast model call first and only escalate to the agent
+    when its answer is not confident enough.
+    """
+    cached = get_cached_resolution(conflict_text, RESOLVER_VERSION)
+    if cached:
+        return resolution_from_cache(cached)
+    routing = route_conflict(conflict_text)
+    fast_tokens = 0
+    if routing == "fast":
+        resolved_code, fast_tokens = run_fast_resolver(conflict_text)
+        if accept_fast_resolution(resolved_code):
+            return resolution_from_llm(conflict_text, resolved_code, fast_tokens, routing)
+        routing = "escalated"
+    resolved_code, token_usage = run_resolver_agent(conflict_text)
+    return resolution_from_llm(conflict_text, resolved_code, fast_tokens + token_usage, routing)
+
+def resolve_file(file_content: str) -> dict:
+    """
+    Resolves a conflicted file. Files with several conflict blocks are split
+    into hunks that are resolved concurrently and spliced back in order, so
+    latency tracks the slowest hunk rather than the sum of all of them.
+    """
+    segments = split_conflict_segments(file_content)
+    hunks = segments[1::2]
+    if not RESOLVE_FANOUT or len(hunks) < max(RESOLVE_FANOUT_MIN_HUNKS, 1):
+        return resolve_text(file_content)
+
+    # Threads rather than asyncio.run: the module level clients and agent keep
+    # their async HTTP clients bound to the first event loop they ran on, and
+    # every task would run on a new one
+    with ThreadPoolExecutor(max_workers=RESOLVE_HUNK_CONCURRENCY) as pool:
+        results = list(pool.map(resolve_text, hunks))
+    for index, hunk, result in zip(range(1, len(segments), 2), hunks, results):
+        resolved = result["resolved_code"]
+        # Keep the line break that followed the >>>>>>> marker
+        if hunk.endswith("\n") and not resolved.endswith("\n"):
+            resolved += "\n"
+        segments[index] = resolved
+
+    # Weight each hunk's confidence by its size so one tiny, uncertain hunk
+    # does not dominate a file of large confident ones
+    weights = [hunk.count("\n") or 1 for hunk in hunks]
+    confidence_score = sum(w * r["confidence_score"] for w, r in zip(weights, results)) / sum(weights)
+    cached_token_usage = sum(r["cached_token_usage"] or 0 for r in results)
+    return {
+        "resolved_code": "".join(segments),
+        "confidence_score": confidence_score,
+        "token_usage": sum(r["token_usage"] for r in results),
+        "cache_hit": all(r["cache_hit"] for r in results),
+        "cached_token_usage": cached_token_usage or None,
+        "routing": max((r["routing"] for r in results), key=ROUTES.index),
+    }
+
+def publish_task_result(task_id: str, result: str):
+    """
+    Stores the task result for /get-task and notifies the /stream-task
+    subscribers waiting on it.
+    """
+    pipe = get_sync_redis().pipeline()
+    pipe.set(task_result_key(task_id), json.dumps(result))
+    pipe.publish(task_result_channel(task_id), result)
+    pipe.execute()
+
+def record_resolution(db, merge: MergeConflict, task: Task, file_path: str, branch: str, resolution: dict):
+    db.add(Resolved_code(merge_conflict_id=merge.id, 
+                         file_path=file_path, 
+                         resolved_code_branch=branch, 
+                         confidence_score=resolution["confidence_score"],
+                         task_id=task.id,
+                         token_usage=resolution["token_usage"],
+                         cache_hit=resolution["cache_hit"],
+                         cached_token_usage=resolution["cached_token_usage"],
+                         routing=resolution["routing"]))
+
+def installation_for_task(db, task_id: str):
+    """The installation whose PR the resolution task belongs to, None for tasks without a merge conflict"""
+    return (
+        db.query(PullRequests.installation_id)
+        .join(MergeConflict, MergeConflict.pr_id == PullRequests.id)
+        .join(Task, Task.merge_id == MergeConflict.id)
+        .filter(Task.id == task_id)
+        .scalar()
+    )
+
+def start_resolution_task(db, task_id: str):
+    """Marks the task as resolving and returns it with its merge conflict"""
     task = db.query(Task).filter(Task.id == task_id).first()
     if not task:
         raise ValueError(f"Task with ID {task_id} not found in the database")
-    task.celery_task_id = celery_task_id
+    task.celery_task_id = current_task.request.id
     
     merge = db.query(MergeConflict).filter(MergeConflict.id == task.merge_id).first()
     if not merge:
@@ -136,50 +382,106 @@ def resolve_conflict(conflict_chunk: str, task_id: str, file_path: str) :
     
     task.status = "resolving"
     db.commit()
-    response = agent.invoke(
-        {"messages": [{"role": "user", "content": conflict_chunk}]}
-    )
-    
-    resolved_code = response['structured_response']
-    total_tokens_used = 0
+    return task, merge
 
-    for msg in resolved_code["messages"]:
-        # Some messages have `response_metadata` with token_usage
-        if hasattr(msg, "response_metadata") and msg.response_metadata.get("token_usage"):
-            total_tokens_used += msg.response_metadata["token_usage"]["total_tokens"]
-
-        # Some have `usage_metadata` instead
-        elif hasattr(msg, "usage_metadata") and msg.usage_metadata.get("total_tokens"):
-            total_tokens_used += msg.usage_metadata["total_tokens"]
+@celery_app.task(name="resolve_conflict", bind=True, max_retries=None)
+def resolve_conflict(self, conflict_chunk: str, task_id: str, file_path: str) :
+    """
+    Resolves a conflict chunk using the agent.
+    The conflict chunk is expected to be in the format of a git conflict marker.
+    Returns the resolved code and confidence score.
+    """
     
-    task.status = "resolved"
-    print(f"Resolved code: {resolved_code.resolved_code}")
-    print(f"Confidence score: {resolved_code.confidence_score}")
-    resolved_code_branch = "auto-fix-"+generate_random_alphanumeric_string()
-    new_resolved_code = Resolved_code(merge_conflict_id=merge.id, 
-                                      file_path=file_path, 
-                                      resolved_code_branch=resolved_code_branch, 
-                                      confidence_score=resolved_code.confidence_score,
-                                      task_id=task.id,
-                                      token_usage=total_tokens_used)
-    db.add(new_resolved_code)
-    db.commit()
+    with session_scope() as db:
+        with installation_slot(self, "llm", installation_for_task(db, task_id)):
+            task, merge = start_resolution_task(db, task_id)
+            resolution = resolve_file(conflict_chunk)
+
+        task.status = "resolved"
+        print(f"Resolved code: {resolution['resolved_code']}")
+        print(f"Confidence score: {resolution['confidence_score']}")
+        print(f"Resolution cache {'hit' if resolution['cache_hit'] else 'miss'}")
+        resolved_code_branch = "auto-fix-"+generate_random_alphanumeric_string()
+        record_resolution(db, merge, task, file_path, resolved_code_branch, resolution)
+        pr_id = merge.pr_id
+    refresh_pr_rollup.delay(pr_id)
     try:
-        r = get_redis()
         res_body = {
             "status": "resolved",
-            "resolved_code": resolved_code.resolved_code,
-            "confidence_score": resolved_code.confidence_score,
+            "resolved_code": resolution["resolved_code"],
+            "confidence_score": resolution["confidence_score"],
             "branch": resolved_code_branch
         }
         result = json.dumps(res_body)
-        asyncio.run(r.set(f"task_result:{task_id}", json.dumps(result)))
+        publish_task_result(task_id, result)
         print("Task ID", task_id)
     except Exception as e:
         print("ERROR: ", e)
 
     return None
 
+@celery_app.task(name="resolve_merge")
+def resolve_merge(files: List[Dict[str, str]], task_id: str):
+    """
+    Resolves every conflicted file of a merge. Each file is resolved by its own
+    resolve_merge_file task and finalize_merge_resolution combines them, so the
+    merge takes roughly as long as its slowest file.
+    files is a list of {"file": content, "file_path": path}.
+    """
+    with session_scope() as db:
+        start_resolution_task(db, task_id)
+        installation_id = installation_for_task(db, task_id)
+
+    callback = finalize_merge_resolution.s(task_id).on_error(merge_resolution_failed.s(task_id))
+    chord(resolve_merge_file.s(f["file"], f["file_path"], installation_id) for f in files)(callback)
+
+@celery_app.task(name="resolve_merge_file", bind=True, max_retries=None)
+def resolve_merge_file(self, file_content: str, file_path: str, installation_id: Optional[int] = None) -> dict:
+    with installation_slot(self, "llm", installation_id):
+        resolution = resolve_file(file_content)
+    resolution["file_path"] = file_path
+    return resolution
+
+@celery_app.task(name="finalize_merge_resolution")
+def finalize_merge_resolution(resolutions: List[dict], task_id: str):
+    """Records the resolved files on a single branch and publishes the combined result"""
+    with session_scope() as db:
+        task = db.query(Task).filter(Task.id == task_id).first()
+        merge = db.query(MergeConflict).filter(MergeConflict.id == task.merge_id).first()
+
+        resolved_code_branch = "auto-fix-"+generate_random_alphanumeric_string()
+        for resolution in resolutions:
+            record_resolution(db, merge, task, resolution["file_path"], resolved_code_branch, resolution)
+        task.status = "resolved"
+        pr_id = merge.pr_id
+    refresh_pr_rollup.delay(pr_id)
+    print(f"Resolved {len(resolutions)} files for task {task_id} on {resolved_code_branch}")
+
+    res_body = {
+        "status": "resolved",
+        "branch": resolved_code_branch,
+        # A merge is only as trustworthy as its weakest file
+        "confidence_score": min(r["confidence_score"] for r in resolutions),
+        "files": [
+            {
+                "file_path": r["file_path"],
+                "resolved_code": r["resolved_code"],
+                "confidence_score": r["confidence_score"],
+            }
+            for r in resolutions
+        ],
+    }
+    publish_task_result(task_id, json.dumps(res_body))
+
+@celery_app.task(name="merge_resolution_failed")
+def merge_resolution_failed(request, exc, traceback, task_id: str):
+    """Errback of the resolve_merge chord, so clients waiting on the task are not left hanging"""
+    print(f"Merge resolution for task {task_id} failed: {exc}")
+    with session_scope() as db:
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if task:
+            task.status = "failed"
+    publish_task_result(task_id, json.dumps({"status": "failed", "error": str(exc)}))
 
 
 
@@ -0,0 +1,141 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, tuple_
+
+from models.merge_conflicts import MergeConflict
+from models.pr import PullRequests
+from models.repo import Repository
+
+ACTIVE_CONFLICT_STATUSES = ['open', 'escalated', 'resolved']
+RESOLVED_CONFLICT_STATUSES = ['closed', 'accepted', 'rejected']
+
+# Only what the merge conflict page shows, never the raw webhook payload in pr.details
+REPO_COLUMNS = [
+    Repository.id.label("repo_id"),
+    Repository.github_id.label("repo_github_id"),
+    Repository.name.label("repo_name"),
+    Repository.full_name.label("repo_full_name"),
+    Repository.private.label("repo_private"),
+    Repository.status.label("repo_status"),
+    Repository.created_at.label("repo_created_at"),
+]
+PR_COLUMNS = [
+    PullRequests.id.label("pr_id"),
+    PullRequests.pr_number,
+    PullRequests.url.label("pr_url"),
+    PullRequests.state.label("pr_state"),
+    PullRequests.title.label("pr_title"),
+    PullRequests.closed_at.label("pr_closed_at"),
+    PullRequests.merged_at.label("pr_merged_at"),
+    PullRequests.mergeable.label("pr_mergeable"),
+    PullRequests.commits.label("pr_commits"),
+    PullRequests.created_at.label("pr_created_at"),
+]
+
+
+def encode_cursor(repo_id: int, pr_id: Optional[int]) -> str:
+    return f"{repo_id}:{pr_id or 0}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Raises ValueError for a malformed cursor"""
+    repo_id, pr_id = cursor.split(":")
+    return int(repo_id), int(pr_id)
+
+
+def pr_filters(state: Optional[str] = None, conflicted: Optional[bool] = None) -> list:
+    """Conditions on PullRequests shared by the page and its counts"""
+    filters = []
+    if state is not None:
+        filters.append(PullRequests.state == state)
+    if conflicted is True:
+        filters.append(PullRequests.mergeable.is_(False))
+    elif conflicted is False:
+        filters.append(or_(PullRequests.mergeable.is_(None), PullRequests.mergeable.is_(True)))
+    return filters
+
+
+def merge_details_page_query(user_id: int, limit: int, after: Optional[Tuple[int, int]] = None,
+                             repo_id: Optional[int] = None, state: Optional[str] = None,
+                             conflicted: Optional[bool] = None):
+    """
+    One page of the user's repositories joined with their PRs, one row per PR
+    (or one row with no PR for a repository without any), in (repo, PR) order.
+    Pages are keyed on that order, so later pages cost the same as the first.
+    Selects one row more than limit to tell whether there is a next page.
+    """
+    # Repositories without PRs sort before their (absent) PRs
+    pr_key = func.coalesce(PullRequests.id, 0)
+    # The PR filters belong in the join condition, in the WHERE clause a NULL
+    # mergeable of a repository without PRs would pass the conflicted=False one
+    filters = pr_filters(state, conflicted)
+    query = select(*REPO_COLUMNS, *PR_COLUMNS) \
+        .select_from(Repository) \
+        .outerjoin(PullRequests, and_(PullRequests.repo_id == Repository.id, *filters)) \
+        .where(Repository.user_id == user_id)
+    if repo_id is not None:
+        query = query.where(Repository.id == repo_id)
+    if filters:
+        # Only the repositories with a matching PR are listed, like in the counts
+        query = query.where(PullRequests.id.isnot(None))
+    if after is not None:
+        query = query.where(tuple_(Repository.id, pr_key) > tuple_(*after))
+    return query.order_by(Repository.id, pr_key).limit(limit + 1)
+
+
+def merge_details_counts_query(user_id: int, repo_id: Optional[int] = None, state: Optional[str] = None,
+                               conflicted: Optional[bool] = None):
+    """
+    Repository, PR and conflict totals of the user in a single aggregate
+    statement, under the same filters as the page. With a PR filter only the
+    repositories that have a matching PR are counted, as only those are listed.
+    """
+    repo_ids = select(Repository.id).where(Repository.user_id == user_id)
+    if repo_id is not None:
+        repo_ids = repo_ids.where(Repository.id == repo_id)
+    filters = pr_filters(state, conflicted)
+    pr_ids = select(PullRequests.id).where(PullRequests.repo_id.in_(repo_ids), *filters)
+    if filters:
+        repo_ids = select(PullRequests.repo_id).where(PullRequests.id.in_(pr_ids)).distinct()
+    conflicts = select(
+        func.count().filter(MergeConflict.status.in_(ACTIVE_CONFLICT_STATUSES)).label("active"),
+        func.count().filter(MergeConflict.status.in_(RESOLVED_CONFLICT_STATUSES)).label("resolved"),
+    ).where(MergeConflict.pr_id.in_(pr_ids)).subquery()
+    return select(
+        select(func.count()).select_from(repo_ids.subquery()).scalar_subquery().label("total_repos"),
+        select(func.count()).select_from(pr_ids.subquery()).scalar_subquery().label("total_prs"),
+        conflicts.c.active,
+        conflicts.c.resolved,
+    )
+
+
+def group_by_repository(rows) -> List[dict]:
+    """Folds (repo, PR) rows, already in repo order, into repositories with their pull_requests"""
+    repos = []
+    for row in rows:
+        if not repos or repos[-1]["id"] != row.repo_id:
+            repos.append({
+                "id": row.repo_id,
+                "github_id": row.repo_github_id,
+                "name": row.repo_name,
+                "full_name": row.repo_full_name,
+                "private": row.repo_private,
+                "status": row.repo_status,
+                "created_at": row.repo_created_at,
+                "pull_requests": [],
+            })
+        if row.pr_id is not None:
+            repos[-1]["pull_requests"].append({
+                "id": row.pr_id,
+                "repo_id": row.repo_id,
+                "pr_number": row.pr_number,
+                "url": row.pr_url,
+                "state": row.pr_state,
+                "title": row.pr_title,
+                "closed_at": row.pr_closed_at,
+                "merged_at": row.pr_merged_at,
+                "mergeable": row.pr_mergeable,
+                "commits": row.pr_commits,
+                "created_at": row.pr_created_at,
+            })
+    return repos
@@ -0,0 +1,116 @@
+import os
+import time
+from datetime import datetime
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, make_asgi_app, multiprocess, start_http_server
+
+# Celery runs prefork children, so its processes write their samples to files in
+# this directory (set in docker-compose) and the parent serves the aggregate
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+CELERY_METRICS_PORT = int(os.getenv("CELERY_METRICS_PORT", 9808))
+WEBHOOK_CONSUMER_METRICS_PORT = int(os.getenv("WEBHOOK_CONSUMER_METRICS_PORT", 9809))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+QUEUE_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+WEBHOOK_SECONDS = Histogram(
+    "gitsleuth_webhook_seconds",
+    "Time spent handling a webhook delivery, by stage (ack in the API, route in the consumer)",
+    ["stage", "event"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    "gitsleuth_task_queue_wait_seconds",
+    "Time between a Celery task being published (or becoming due) and a worker starting it",
+    ["task"],
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+AGENT_SECONDS = Histogram(
+    "gitsleuth_agent_seconds",
+    "Duration of a resolver agent invocation",
+    buckets=LLM_BUCKETS,
+)
+TOOL_SECONDS = Histogram(
+    "gitsleuth_agent_tool_seconds",
+    "Duration of an agent tool call",
+    ["tool"],
+    buckets=LLM_BUCKETS,
+)
+GITHUB_REQUEST_SECONDS = Histogram(
+    "gitsleuth_github_request_seconds",
+    "Latency of a single GitHub API request",
+    ["method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "gitsleuth_llm_tokens",
+    "Total tokens used by a single LLM call",
+    ["model"],
+    buckets=TOKEN_BUCKETS,
+)
+FAST_RESOLVER_SECONDS = Histogram(
+    "gitsleuth_fast_resolver_seconds",
+    "Duration of a single shot fast model resolution",
+    buckets=LLM_BUCKETS,
+)
+ROUTING_DECISIONS = Counter(
+    "gitsleuth_routing_decisions",
+    "LLM resolutions by route (fast, escalated from fast to the agent, agent)",
+    ["route"],
+)
+RESOLUTIONS = Counter(
+    "gitsleuth_resolutions",
+    "Conflicts resolved, by how they were resolved (simple_rule, cache, llm)",
+    ["source"],
+)
+
+
+def record_llm_usage(message):
+    """Records the tokens of an LLM response message, returns the total or 0 if it has none"""
+    metadata = getattr(message, "response_metadata", None) or {}
+    if metadata.get("token_usage"):
+        tokens = metadata["token_usage"]["total_tokens"]
+    elif getattr(message, "usage_metadata", None) and message.usage_metadata.get("total_tokens"):
+        tokens = message.usage_metadata["total_tokens"]
+    else:
+        return 0
+    LLM_TOKENS.labels(model=metadata.get("model_name", "unknown")).observe(tokens)
+    return tokens
+
+
+def record_queue_wait(task, request):
+    """Observes how long a task sat in the queue, from the published_at header set at publish time"""
+    published_at = getattr(request, "published_at", None)
+    if published_at is None:
+        return
+    ready_at = float(published_at)
+    # Tasks with a countdown are not waiting in the queue before they are due
+    if request.eta:
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        ready_at = max(ready_at, eta.timestamp())
+    TASK_QUEUE_WAIT_SECONDS.labels(task=task.name).observe(max(time.time() - ready_at, 0))
+
+
+def metrics_registry():
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_app():
+    """ASGI app serving /metrics for the FastAPI process"""
+    return make_asgi_app(registry=metrics_registry())
+
+
+def start_metrics_server(port: int):
+    """Serves /metrics from a background thread, for processes without an HTTP server"""
+    start_http_server(port, registry=metrics_registry())
+
+
+def mark_process_dead(pid: int):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
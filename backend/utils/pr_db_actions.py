@@ -2,65 +2,111 @@ from celery import current_task
 from celery.result import AsyncResult
 from fastapi import Request, HTTPException
 from typing import Optional
-import httpx
-import asyncio
-import json
+import os
+import time
 
 from sqlalchemy import desc
 
 from utils.utils import add_task
 from models.pr import PullRequests
 from config import celery_app
-from routers.auth import get_or_refresh_installation_token
-from db import get_db
+from utils.token_manager import get_installation_token
+from utils.github_client import GitHubRateLimited, github_request
+from utils.installation_limits import installation_slot
+from db import session_scope
 from models.repo import Repository
 from models.merge_conflicts import MergeConflict
 from models.taskLog import Task
+from utils.dashboard_rollup import refresh_pr_rollup
 
-async def fetch_pr_details(owner: str, repo: str, pr_number: int, installation_id: int) -> dict:
-    """Poll GitHub API for PR details until mergeable is not null"""
-    print("installation_id", installation_id)
-    print(f"Fetching PR details for {owner}/{repo}#{pr_number}")
-    GITHUB_ACCESS_TOKEN = await get_or_refresh_installation_token(installation_id)
-    print(f"access token {GITHUB_ACCESS_TOKEN}")
-    HEADERS = {
-        "Authorization": f"Bearer {GITHUB_ACCESS_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+# Mergeability is computed by GitHub in the background. Instead of sleeping in
+# the worker, the check is rescheduled with exponential backoff until GitHub has
+# an answer or the deadline passes
+MERGEABILITY_BASE_DELAY = int(os.getenv("MERGEABILITY_BASE_DELAY", 2))
+MERGEABILITY_MAX_DELAY = int(os.getenv("MERGEABILITY_MAX_DELAY", 60))
+MERGEABILITY_DEADLINE = int(os.getenv("MERGEABILITY_DEADLINE", 900))
 
-    url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}"
-    async with httpx.AsyncClient() as client:
-        for _ in range(5):  # Retry up to 5 times
-            response = await client.get(url, headers=HEADERS)
-            if response.status_code != 200:
-                raise Exception("GitHub API error")
-            
-            pr_data = response.json()
-            if pr_data["mergeable"] is not None:  # Mergeability calculated
-                return pr_data
-            
-            await asyncio.sleep(3)  # Wait 3 seconds before retrying
-        
-        raise Exception("Mergeability check timeout")
-    
+def fetch_pr_details(owner: str, repo: str, pr_number: int, installation_id: int) -> dict:
+    """Fetch the PR from the GitHub API"""
+    print(f"Fetching PR details for {owner}/{repo}#{pr_number}")
+    response = github_request(
+        "GET",
+        f"/repos/{owner}/{repo}/pulls/{pr_number}",
+        token=get_installation_token(installation_id),
+        installation_id=installation_id
+    )
+    if response.status_code != 200:
+        raise Exception("GitHub API error")
+    return response.json()
 
-async def check_pr_mergeable(data):
+def record_mergeability(db, pr, mergeable: bool, data):
+    """Stores the PR's mergeability and opens a merge conflict if it has one"""
+    pr.mergeable = mergeable
+    db.commit()
+    db.refresh(pr)
+    if not mergeable:
+        mc = MergeConflict(pr_id=pr.id, status="open")
+        db.add(mc)
+        db.commit()
+        db.refresh(mc)
+        print(f"Added Merge id {mc.id}")
+        celery_task = resolve_merge_conflicts.delay(data, mc.id)
+        add_task("merge_conflicts", "queued", celery_task_id=celery_task.id, pr_id=pr.id, merge_id=mc.id)
 
-    if data.get("mergeable") is None:
-        try:
-            # Fetch updated PR details with mergeable status
-            updated_pr = await fetch_pr_details(
+@celery_app.task(bind=True, max_retries=None)
+def check_pr_mergeability(self, data, pr_id: int, deadline: Optional[float] = None):
+    """
+    Checks whether GitHub has computed the PR's mergeability yet. While it is
+    still unknown the task is retried with a growing countdown, freeing the
+    worker between attempts, until MERGEABILITY_DEADLINE seconds have passed.
+    """
+    if deadline is None:
+        deadline = time.time() + MERGEABILITY_DEADLINE
+    # The task is queued with data and pr_id as positional args, a retry
+    # passing them again as kwargs would be rejected as a duplicate argument
+    retry_args = (data, pr_id)
+    retry_kwargs = {"deadline": deadline}
+    installation_id = data["installation"]["id"]
+    try:
+        with installation_slot(self, "github-io", installation_id, args=retry_args, kwargs=retry_kwargs):
+            pr_data = fetch_pr_details(
                 owner=data["repository"]["owner"]["login"],
                 repo=data["repository"]["name"],
                 pr_number=data["number"],
-                installation_id=data["installation"]["id"]
+                installation_id=installation_id
             )
-            
-            return updated_pr["mergeable"]
-                
-        except Exception as e:
-            print(f"Error checking mergeability: {e}")
-            raise e
+    except GitHubRateLimited as e:
+        raise self.retry(countdown=e.retry_after, args=retry_args, kwargs=retry_kwargs)
+
+    with session_scope() as db:
+        pr = db.query(PullRequests).filter(PullRequests.id == pr_id).first()
+        if not pr:
+            raise ValueError(f"PR with ID {pr_id} not found in the database")
+
+        if pr_data["head"]["sha"] != pr.head_sha:
+            # A newer push arrived, its own event checks the new head
+            print(f"PR {pr_id} moved to {pr_data['head']['sha']}, dropping the mergeability check")
+            return
+
+        if pr_data["mergeable"] is None:
+            countdown = min(MERGEABILITY_MAX_DELAY, MERGEABILITY_BASE_DELAY * 2 ** self.request.retries)
+            if time.time() + countdown > deadline:
+                print(f"Mergeability of PR {pr_id} still unknown after {MERGEABILITY_DEADLINE}s, giving up")
+                return
+            raise self.retry(countdown=countdown, args=retry_args, kwargs=retry_kwargs)
+
+        record_mergeability(db, pr, pr_data["mergeable"], data)
+    refresh_pr_rollup.delay(pr_id)
+
+def pr_head_columns(data) -> dict:
+    """The payload fields kept in their own columns, so reading them never loads details"""
+    pull_request = data["pull_request"]
+    return {
+        "head_ref": pull_request["head"]["ref"],
+        "base_ref": pull_request["base"]["ref"],
+        "head_sha": pull_request["head"]["sha"],
+        "author_login": (pull_request.get("user") or {}).get("login"),
+    }
 
 def add_pr_to_database(db, data):
     repo = db.query(Repository).filter_by(github_id=data["repository"]["id"]).first()
@@ -79,21 +125,18 @@ def add_pr_to_database(db, data):
         merged_at=data["pull_request"]["merged_at"],
         mergeable=data["pull_request"]['mergeable'],  # Initially set to None, will be updated later
         commits=data["pull_request"]["commits"],
-        details=json.dumps(data)  # Store the full PR data as a string
+        details=data,
+        **pr_head_columns(data)
     )
     db.add(pr)
     db.commit()
     db.refresh(pr)
     return pr
 
-async def trigger_workflow(repo_name, owner, action_workflow_filename, base_branch, head_branch, GITHUB_TOKEN, merge_id):
+def trigger_workflow(repo_name, owner, action_workflow_filename, base_branch, head_branch, installation_id, merge_id):
 
     # Trigger GitHub Action workflow_dispatch
-    url = f"https://api.github.com/repos/{owner}/{repo_name}/actions/workflows/{action_workflow_filename}/dispatches"
-    headers = {
-        "Authorization": f"Bearer {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github+json"
-    }
+    GITHUB_TOKEN = get_installation_token(installation_id)
     json_data = {
         "ref":base_branch,  # run action on base branch (e.g., main)
         "inputs": {
@@ -104,122 +147,136 @@ async def trigger_workflow(repo_name, owner, action_workflow_filename, base_bran
         }
     }
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=headers, json=json_data)
-        if resp.status_code != 204:
-            raise Exception(f"Failed to trigger workflow: {resp.text}")
+    resp = github_request(
+        "POST",
+        f"/repos/{owner}/{repo_name}/actions/workflows/{action_workflow_filename}/dispatches",
+        token=GITHUB_TOKEN,
+        installation_id=installation_id,
+        json=json_data
+    )
+    if resp.status_code != 204:
+        raise Exception(f"Failed to trigger workflow: {resp.text}")
 
 @celery_app.task
 def handle_new_pr(data):
     try:
-        db = next(get_db())
-        task = db.query(Task).filter(Task.celery_task_id == current_task.request.id).first()
-        if task:
-            task.status = "resolving"
-            db.commit()
-        if data['action'] == "opened":
-            pr = add_pr_to_database(db, data)
-            mc = None
-        elif data['action'] == "synchronize":
-            pr = db.query(PullRequests).filter_by(github_id=data["pull_request"]["id"]).first()
-            if not pr:
+        with session_scope() as db:
+            task = db.query(Task).filter(Task.celery_task_id == current_task.request.id).first()
+            if task:
+                task.status = "resolving"
+                db.commit()
+            if data['action'] == "opened":
                 pr = add_pr_to_database(db, data)
                 mc = None
-            else:
-                mc = db.query(MergeConflict).filter_by(pr_id=pr.id).first()
-                if mc:
-                    task = db.query(Task).filter(Task.merge_id == mc.id).first()
-                    if task.status in ["queued", "resolving"]:
-                        result = AsyncResult(task.celery_task_id)
-                        result.revoke(terminate=True, signal='SIGTERM')
-                        task.status = "terminated"
-                        db.commit()
-                    mc.status = "overwritten"
-            pr.state = data["pull_request"]["state"]
-            pr.title = data["pull_request"]["title"]
-            pr.closed_at = data["pull_request"]["closed_at"]
-            pr.merged_at = data["pull_request"]["merged_at"]
-            pr.commits = data["pull_request"]["commits"]
-            pr.details = json.dumps(data)
-        elif data['action'] == "closed":
-            pr = db.query(PullRequests).filter(PullRequests.github_id==data["pull_request"]["id"]).first()
-            if not pr:
-                pr = add_pr_to_database(db, data)
-                mc = MergeConflict(pr_id = pr.id, status="closed")
-                db.add(mc)
-            else:
+            elif data['action'] == "synchronize":
+                pr = db.query(PullRequests).filter_by(github_id=data["pull_request"]["id"]).first()
+                if not pr:
+                    pr = add_pr_to_database(db, data)
+                    mc = None
+                else:
+                    mc = db.query(MergeConflict).filter_by(pr_id=pr.id).first()
+                    if mc:
+                        task = db.query(Task).filter(Task.merge_id == mc.id).first()
+                        if task.status in ["queued", "resolving"]:
+                            result = AsyncResult(task.celery_task_id)
+                            result.revoke(terminate=True, signal='SIGTERM')
+                            task.status = "terminated"
+                            db.commit()
+                        mc.status = "overwritten"
+                pr.state = data["pull_request"]["state"]
+                pr.title = data["pull_request"]["title"]
                 pr.closed_at = data["pull_request"]["closed_at"]
                 pr.merged_at = data["pull_request"]["merged_at"]
-                mc = db.query(MergeConflict).filter(MergeConflict.pr_id==pr.id, MergeConflict.status in ['queued', 'resolving', 'open']).first()
-                if mc:
-                    mc.status = "closed"
-                    celery_resolve_task = db.query(Task).filter(Task.merge_id==mc.id, Task.task_type == "Resolve_conflict_AI")
-                    if celery_resolve_task and celery_resolve_task.status in ["queued", "resolving"]:
-                        result = AsyncResult(celery_resolve_task.celery_task_id)
-                        result.revoke(terminate=True, signal='SIGTERM')
-                        celery_resolve_task.status = "terminated"
-                        db.commit()
-                else:
+                pr.commits = data["pull_request"]["commits"]
+                pr.details = data
+                for column, value in pr_head_columns(data).items():
+                    setattr(pr, column, value)
+            elif data['action'] == "closed":
+                pr = db.query(PullRequests).filter(PullRequests.github_id==data["pull_request"]["id"]).first()
+                if not pr:
+                    pr = add_pr_to_database(db, data)
                     mc = MergeConflict(pr_id = pr.id, status="closed")
                     db.add(mc)
-            db.commit()
-        elif data['action'] == 'reopened':
-            pr = db.query(PullRequests).filter(PullRequests.github_id==data["pull_request"]["id"]).first()
-            if not pr:
-                pr = add_pr_to_database(db, data)
-            else:
-                mc = db.query(MergeConflict).filter(MergeConflict.pr_id==pr.id, MergeConflict.status in ["open", "queued", "resolving"]).order_by(desc(MergeConflict.created_at)).first()
-                if mc:
-                    mc.status = "overwritten"
-                    celery_resolve_task = db.query(Task).filter(Task.merge_id==mc.id, Task.task_type == "Resolving_conflicts")
-                    if celery_resolve_task and celery_resolve_task.status in ["queued", "resolving"]:
-                        result = AsyncResult(celery_resolve_task.celery_task_id)
-                        result.revoke(terminate=True, signal='SIGTERM')
-                        celery_resolve_task.status = "terminated"
-                    
-                    db.commit()
-
-        if data['action'] != "closed":
-            mergeable = asyncio.run(check_pr_mergeable(data))
-            pr.mergeable = mergeable
-            db.commit()
-            db.refresh(pr)
-            if not mergeable:
-                mc = MergeConflict(pr_id=pr.id, status="open")
-                db.add(mc)
+                else:
+                    pr.closed_at = data["pull_request"]["closed_at"]
+                    pr.merged_at = data["pull_request"]["merged_at"]
+                    mc = db.query(MergeConflict).filter(MergeConflict.pr_id==pr.id, MergeConflict.status in ['queued', 'resolving', 'open']).first()
+                    if mc:
+                        mc.status = "closed"
+                        celery_resolve_task = db.query(Task).filter(Task.merge_id==mc.id, Task.task_type == "Resolve_conflict_AI")
+                        if celery_resolve_task and celery_resolve_task.status in ["queued", "resolving"]:
+                            result = AsyncResult(celery_resolve_task.celery_task_id)
+                            result.revoke(terminate=True, signal='SIGTERM')
+                            celery_resolve_task.status = "terminated"
+                            db.commit()
+                    else:
+                        mc = MergeConflict(pr_id = pr.id, status="closed")
+                        db.add(mc)
                 db.commit()
-                db.refresh(mc)
-                print(f"Added Merge id {mc.id}")
-                celery_task = resolve_merge_conflicts.delay(data, mc.id)
-                add_task("merge_conflicts", "queued", celery_task_id=celery_task.id, pr_id=pr.id, merge_id=mc.id)
+            elif data['action'] == 'reopened':
+                pr = db.query(PullRequests).filter(PullRequests.github_id==data["pull_request"]["id"]).first()
+                if not pr:
+                    pr = add_pr_to_database(db, data)
+                else:
+                    mc = db.query(MergeConflict).filter(MergeConflict.pr_id==pr.id, MergeConflict.status in ["open", "queued", "resolving"]).order_by(desc(MergeConflict.created_at)).first()
+                    if mc:
+                        mc.status = "overwritten"
+                        celery_resolve_task = db.query(Task).filter(Task.merge_id==mc.id, Task.task_type == "Resolving_conflicts")
+                        if celery_resolve_task and celery_resolve_task.status in ["queued", "resolving"]:
+                            result = AsyncResult(celery_resolve_task.celery_task_id)
+                            result.revoke(terminate=True, signal='SIGTERM')
+                            celery_resolve_task.status = "terminated"
+                    
+                        db.commit()
+
+            if data['action'] != "closed":
+                mergeable = data["pull_request"].get("mergeable")
+                if mergeable is None:
+                    # Not computed yet, check again later without holding this worker
+                    check_pr_mergeability.delay(data, pr.id)
+                else:
+                    record_mergeability(db, pr, mergeable, data)
+            pr_id = pr.id
+        refresh_pr_rollup.delay(pr_id)
     except Exception as e:
         print(f"Error handling new PR: {e}")
         raise Exception("Error processing PR data")
     
 
-@celery_app.task
-def resolve_merge_conflicts(data, merge_id):
-    installation_token = asyncio.run(get_or_refresh_installation_token(data["installation"]["id"]))
-    headers = {
-        "Authorization": f"Bearer {installation_token}",
-        "Accept": "application/vnd.github.v3+json",
-        "User-Agent": "MyGitHubApp"
-    }
+@celery_app.task(bind=True, max_retries=None)
+def resolve_merge_conflicts(self, data, merge_id):
+    installation_id = data["installation"]["id"]
+    try:
+        with installation_slot(self, "github-io", installation_id):
+            dispatch_merge_conflict_workflow(data, merge_id)
+    except GitHubRateLimited as e:
+        raise self.retry(countdown=e.retry_after)
+
+def dispatch_merge_conflict_workflow(data, merge_id):
+    installation_id = data["installation"]["id"]
+    with session_scope() as db:
+        # The PR's current branches, from their own columns so details is never loaded
+        head_ref, base_ref = db.query(PullRequests.head_ref, PullRequests.base_ref) \
+            .join(MergeConflict, MergeConflict.pr_id == PullRequests.id) \
+            .filter(MergeConflict.id == merge_id).one()
+    installation_token = get_installation_token(installation_id)
 
     body_data = {
         "ref": "main",  # or your branch
         "inputs": {
-            "head_ref": data['pull_request']['head']['ref'],
-            "base_ref": data['pull_request']['base']['ref'], 
+            "head_ref": head_ref,
+            "base_ref": base_ref,
             "merge_id": str(merge_id),
             "GH_APP_TOKEN": installation_token
         } 
     }
 
-    response = httpx.post(
-        f"https://api.github.com/repos/{data['repository']['full_name']}/actions/workflows/merge-conflict.yaml/dispatches",
-        headers=headers,
+    response = github_request(
+        "POST",
+        f"/repos/{data['repository']['full_name']}/actions/workflows/merge-conflict.yaml/dispatches",
+        token=installation_token,
+        installation_id=installation_id,
         json=body_data
     )
-
-    print(response.status_code, response.text)
\ No newline at end of file
+    if response.status_code != 204:
+        raise Exception(f"Failed to trigger merge conflict workflow: {response.status_code} {response.text}")
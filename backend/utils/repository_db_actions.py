@@ -1,45 +1,88 @@
+from sqlalchemy.dialects.postgresql import insert
+
 from models.user import User
 from config import celery_app
 from models.repo import Repository
 from celery import current_task
 
-from db import get_db
-from utils.setup_workflow_files import setup_workflow_files
+from db import session_scope
+from utils.setup_workflow_files import setup_workflow_files_for_repos
 from models.taskLog import Task
 
-@celery_app.task
-def handle_add_repositories(repositories: list, installation_id: int = None):
-    db_session = next(get_db())
+# Rows per INSERT statement, keeps the bind parameter count well below Postgres' limit
+UPSERT_BATCH_SIZE = 1000
+
+def mark_task_resolving(db_session):
     task = db_session.query(Task).filter(Task.celery_task_id == current_task.request.id).first()
     if task:
         task.status = "resolving"
         db_session.commit()
-    for repo in repositories:
-        setup_workflow_files.delay(repo['full_name'], installation_id)
-        github_id = repo.pop('id')
-        entry = db_session.query(Repository).filter(Repository.github_id == github_id).first()
-        if entry:
-            entry.status = "active"
-            db_session.commit()
-        else:
-            user = repo["full_name"].split("/")[0]
-            repo["user_id"] = db_session.query(User).filter(User.username == user).first().id
-            new_entry = Repository(installation_id=installation_id, github_id=github_id, **repo)
-            db_session.add(new_entry)
-    db_session.commit()
+
+@celery_app.task
+def handle_add_repositories(repositories: list, installation_id: int = None):
+    with session_scope() as db_session:
+        mark_task_resolving(db_session)
+
+        github_ids = [repo['id'] for repo in repositories]
+        existing = {
+            github_id for (github_id,) in
+            db_session.query(Repository.github_id).filter(Repository.github_id.in_(github_ids))
+        }
+        new_repos = [repo for repo in repositories if repo['id'] not in existing]
+        owners = {repo["full_name"].split("/")[0] for repo in new_repos}
+        user_ids = dict(db_session.query(User.username, User.id).filter(User.username.in_(owners))) if owners else {}
+
+        rows = {}
+        for repo in new_repos:
+            owner = repo["full_name"].split("/")[0]
+            if owner not in user_ids:
+                print(f"Skipping repository {repo['full_name']}, no user {owner} in the database")
+                continue
+            # Keyed by github_id, a statement may not upsert the same row twice
+            rows[repo['id']] = {
+                "user_id": user_ids[owner],
+                "installation_id": installation_id,
+                "github_id": repo['id'],
+                "node_id": repo['node_id'],
+                "name": repo['name'],
+                "full_name": repo['full_name'],
+                "private": repo['private'],
+                "status": "active",
+            }
+        rows = list(rows.values())
+
+        if existing:
+            db_session.query(Repository).filter(Repository.github_id.in_(existing)).update(
+                {"status": "active", "installation_id": installation_id},
+                synchronize_session=False
+            )
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            statement = insert(Repository).values(rows[start:start + UPSERT_BATCH_SIZE])
+            # A concurrent event may have inserted the same repository meanwhile
+            statement = statement.on_conflict_do_update(
+                index_elements=[Repository.github_id],
+                set_={"status": "active", "installation_id": statement.excluded.installation_id}
+            )
+            db_session.execute(statement)
+
+    setup_workflow_files_for_repos([repo['full_name'] for repo in repositories], installation_id)
 
 
 @celery_app.task
 def handle_remove_repositories(repositories):
-    db_session = next(get_db())
-    task = db_session.query(Task).filter(Task.celery_task_id == current_task.request.id).first()
-    if task:
-        task.status = "resolving"
-        db_session.commit()
-    for repo in repositories:
-        entry = db_session.query(Repository).filter_by(github_id=repo['id']).first()
-        if entry:
-            entry.status = 'removed'
-        else:
-            raise ValueError(f"Repository with ID {repo['id']} not found in the database")
-    db_session.commit()
\ No newline at end of file
+    with session_scope() as db_session:
+        mark_task_resolving(db_session)
+
+        github_ids = [repo['id'] for repo in repositories]
+        known = {
+            github_id for (github_id,) in
+            db_session.query(Repository.github_id).filter(Repository.github_id.in_(github_ids))
+        }
+        unknown = [github_id for github_id in github_ids if github_id not in known]
+        if unknown:
+            print(f"Repositories with IDs {unknown} not found in the database")
+        if known:
+            db_session.query(Repository).filter(Repository.github_id.in_(known)).update(
+                {"status": "removed"},
+                synchronize_session=False
+            )
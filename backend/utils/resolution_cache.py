@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from redis_setup import get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Entries expire after this many seconds without a hit, and each hit pushes
+# the expiry out again. This Redis also holds the Celery queues and the
+# webhook stream, so it runs without an eviction policy: the cache's size is
+# bounded by the distinct conflicts resolved within one TTL, not by LRU
+RESOLUTION_CACHE_TTL = int(os.getenv("RESOLUTION_CACHE_TTL", 7 * 24 * 3600))
+
+CONFLICT_MARKERS = ("<<<<<<<", "|||||||", ">>>>>>>")
+
+
+def normalize_conflict(conflict_text: str) -> str:
+    """
+    Normalizes conflict text so re-runs and rebases of the same conflict hash
+    the same. Only the branch labels after the markers are dropped: they never
+    appear in the resolution, while line endings and whitespace are part of
+    the resolved code returned for the file.
+    """
+    lines = []
+    for line in conflict_text.splitlines(keepends=True):
+        marker = line[:7]
+        if marker in CONFLICT_MARKERS:
+            line = marker + line[len(line.rstrip("\r\n")):]
+        lines.append(line)
+    return "".join(lines)
+
+
+def resolution_cache_key(conflict_text: str, resolver_version: str) -> str:
+    digest = hashlib.sha256(
+        f"{resolver_version}\0{normalize_conflict(conflict_text)}".encode("utf-8")
+    ).hexdigest()
+    return f"resolution_cache:{digest}"
+
+
+def get_cached_resolution(conflict_text: str, resolver_version: str) -> Optional[dict]:
+    """
+    Returns the stored resolution for the conflict text, or None on a miss.
+    Cache failures are treated as misses so resolution never depends on Redis.
+    """
+    try:
+        cached = get_sync_redis().getex(
+            resolution_cache_key(conflict_text, resolver_version),
+            ex=RESOLUTION_CACHE_TTL
+        )
+    except RedisError as e:
+        logger.warning(f"Resolution cache lookup failed: {e}")
+        return None
+    if not cached:
+        return None
+    return json.loads(cached)
+
+
+def store_resolution(conflict_text: str, resolver_version: str, resolved_code: str, confidence_score: float, token_usage: int):
+    try:
+        get_sync_redis().set(
+            resolution_cache_key(conflict_text, resolver_version),
+            json.dumps({
+                "resolved_code": resolved_code,
+                "confidence_score": confidence_score,
+                "token_usage": token_usage
+            }),
+            ex=RESOLUTION_CACHE_TTL
+        )
+    except RedisError as e:
+        logger.warning(f"Resolution cache store failed: {e}")
@@ -1,104 +1,145 @@
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+from celery import group
 
-import asyncio
-import httpx
 from config import celery_app
-from utils.auth_helper import get_or_refresh_installation_token
+from utils.github_client import GitHubRateLimited, github_request
+from utils.installation_limits import installation_slot
+from utils.token_manager import get_installation_token
 
+WORKFLOW_FILES_DIR = Path(__file__).resolve().parent.parent / "workflow_files"
+WORKFLOW_FILE_NAMES = ["merge-conflict.yaml", "apply-resolution.yaml"]
+REPO_WORKFLOW_DIR = ".github/workflows"
 
-def get_latest_commit_info(repo_full_name, branch, token):
-    headers = {"Authorization": f"token {token}"}
-    res = httpx.get(
-        f"https://api.github.com/repos/{repo_full_name}/git/ref/heads/{branch}",
-        headers=headers
-    )
-    ref_info = res.json()
-    commit_sha = ref_info["object"]["sha"]
-
-    commit_data = httpx.get(
-        f"https://api.github.com/repos/{repo_full_name}/git/commits/{commit_sha}",
-        headers=headers
-    ).json()
-
-    tree_sha = commit_data["tree"]["sha"]
-    return commit_sha, tree_sha
-
-def create_blob(repo_full_name, content, token):
-    headers = {"Authorization": f"token {token}"}
-    res = httpx.post(
-        f"https://api.github.com/repos/{repo_full_name}/git/blobs",
-        json={"content": content, "encoding": "utf-8"},
-        headers=headers
+
+@lru_cache(maxsize=1)
+def load_workflow_templates() -> dict:
+    """Workflow file contents keyed by their path in the repository, read once per process"""
+    return {
+        f"{REPO_WORKFLOW_DIR}/{name}": (WORKFLOW_FILES_DIR / name).read_text(encoding="utf-8")
+        for name in WORKFLOW_FILE_NAMES
+    }
+
+def git_blob_sha(content: str) -> str:
+    """The SHA git assigns to a blob with this content, as reported by the contents API"""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def get_default_branch(repo_full_name, installation_id):
+    res = github_request("GET", f"/repos/{repo_full_name}", token=get_installation_token(installation_id), installation_id=installation_id)
+    res.raise_for_status()
+    return res.json().get("default_branch", "main")
+
+def get_latest_commit_info(repo_full_name, branch, installation_id):
+    """Head commit and tree SHAs of the branch, in a single call"""
+    res = github_request("GET", f"/repos/{repo_full_name}/branches/{branch}", token=get_installation_token(installation_id), installation_id=installation_id)
+    res.raise_for_status()
+    commit = res.json()["commit"]
+    return commit["sha"], commit["commit"]["tree"]["sha"]
+
+def get_workflow_file_shas(repo_full_name, branch, installation_id) -> dict:
+    """Blob SHAs of the files currently in the repository's workflow directory"""
+    res = github_request(
+        "GET",
+        f"/repos/{repo_full_name}/contents/{REPO_WORKFLOW_DIR}",
+        token=get_installation_token(installation_id),
+        installation_id=installation_id,
+        params={"ref": branch}
     )
-    return res.json()["sha"]
+    if res.status_code == 404:
+        return {}
+    res.raise_for_status()
+    return {entry["path"]: entry["sha"] for entry in res.json() if entry["type"] == "file"}
 
-def create_tree(repo_full_name, base_tree, files, token):
+def create_tree(repo_full_name, base_tree, files, installation_id):
     """
-    files: list of dicts with 'path' and 'sha' keys
+    files: dict of path to file content, sent inline so no blobs have to be created first
     """
-    headers = {"Authorization": f"token {token}"}
     tree_items = [
         {
-            "path": file["path"],
+            "path": path,
             "mode": "100644",
             "type": "blob",
-            "sha": file["sha"]
+            "content": content
         }
-        for file in files
+        for path, content in files.items()
     ]
-    res = httpx.post(
-        f"https://api.github.com/repos/{repo_full_name}/git/trees",
-        json={"base_tree": base_tree, "tree": tree_items},
-        headers=headers
+    res = github_request(
+        "POST",
+        f"/repos/{repo_full_name}/git/trees",
+        token=get_installation_token(installation_id),
+        installation_id=installation_id,
+        json={"base_tree": base_tree, "tree": tree_items}
     )
+    res.raise_for_status()
     return res.json()["sha"]
 
 
-def create_commit(repo_full_name, message, tree_sha, parent_sha, token):
-    headers = {"Authorization": f"token {token}"}
-    res = httpx.post(
-        f"https://api.github.com/repos/{repo_full_name}/git/commits",
+def create_commit(repo_full_name, message, tree_sha, parent_sha, installation_id):
+    res = github_request(
+        "POST",
+        f"/repos/{repo_full_name}/git/commits",
+        token=get_installation_token(installation_id),
+        installation_id=installation_id,
         json={
             "message": message,
             "tree": tree_sha,
             "parents": [parent_sha]
-        },
-        headers=headers
+        }
     )
+    res.raise_for_status()
     return res.json()["sha"]
 
-def update_ref(repo_full_name, branch, commit_sha, token):
-    headers = {"Authorization": f"token {token}"}
-    httpx.patch(
-        f"https://api.github.com/repos/{repo_full_name}/git/refs/heads/{branch}",
-        json={"sha": commit_sha},
-        headers=headers
+def update_ref(repo_full_name, branch, commit_sha, installation_id):
+    res = github_request(
+        "PATCH",
+        f"/repos/{repo_full_name}/git/refs/heads/{branch}",
+        token=get_installation_token(installation_id),
+        installation_id=installation_id,
+        json={"sha": commit_sha}
     )
-    
-def get_default_branch(repo_full_name, token):
-    headers = {"Authorization": f"token {token}"}
-    res = httpx.get(
-        f"https://api.github.com/repos/{repo_full_name}",
-        headers=headers
-    )
-    return res.json().get("default_branch", "main")
+    res.raise_for_status()
+
+@celery_app.task(bind=True, max_retries=None)
+def setup_workflow_files(self, repo_full_name, installation_id):
+    """
+    Commits the workflow templates to the repository's default branch.
+    Repositories that already have the current templates are left alone.
+    Returns the new commit SHA, or None if nothing had to change.
+    """
+    try:
+        with installation_slot(self, "onboarding", installation_id):
+            return install_workflow_files(repo_full_name, installation_id)
+    except GitHubRateLimited as e:
+        # Safe to start over, the branch only moves once the commit is complete
+        raise self.retry(countdown=e.retry_after)
 
-@celery_app.task
-def setup_workflow_files(repo_full_name, installation_id):
-    token = asyncio.run(get_or_refresh_installation_token(installation_id)) 
-    file_paths = ["merge-conflict.yaml", "apply-resolution.yaml"]
-    local_file_dir = "workflow_files/"
-    repo_file_dir = ".github/workflows/"
-    branch = get_default_branch(repo_full_name, token)
-    commit_sha, tree_sha = get_latest_commit_info(repo_full_name, branch, token)
-    files_data = []
-    for file_path in file_paths:
-        with open(local_file_dir+file_path, "r") as file:
-            content = file.read()
-        blob_sha = create_blob(repo_full_name, content, token)
-        files_data.append({"path": repo_file_dir+file_path, "sha": blob_sha})
-
-    new_tree_sha = create_tree(repo_full_name, tree_sha, files_data, token)
-    new_commit_sha = create_commit(repo_full_name, "Setup multiple workflow files", new_tree_sha, commit_sha, token)
-    update_ref(repo_full_name, branch, new_commit_sha, token)
-
-    return new_commit_sha
\ No newline at end of file
+def install_workflow_files(repo_full_name, installation_id):
+    templates = load_workflow_templates()
+    branch = get_default_branch(repo_full_name, installation_id)
+    current = get_workflow_file_shas(repo_full_name, branch, installation_id)
+    outdated = {
+        path: content for path, content in templates.items()
+        if current.get(path) != git_blob_sha(content)
+    }
+    if not outdated:
+        print(f"Workflow files in {repo_full_name} are up to date")
+        return None
+
+    commit_sha, tree_sha = get_latest_commit_info(repo_full_name, branch, installation_id)
+    new_tree_sha = create_tree(repo_full_name, tree_sha, outdated, installation_id)
+    new_commit_sha = create_commit(repo_full_name, "Setup multiple workflow files", new_tree_sha, commit_sha, installation_id)
+    update_ref(repo_full_name, branch, new_commit_sha, installation_id)
+
+    return new_commit_sha
+
+def setup_workflow_files_for_repos(repo_full_names, installation_id):
+    """
+    Installs the workflows in many repositories at once. The tasks run
+    concurrently across workers, paced by the installation's rate limit.
+    """
+    if not repo_full_names:
+        return None
+    return group(setup_workflow_files.s(name, installation_id) for name in repo_full_names).apply_async()
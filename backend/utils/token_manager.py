@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from jose import jwk, jwt
+from redis.exceptions import LockError
+
+from redis_setup import get_sync_redis
+from utils.github_client import github_request
+from utils.auth_helper import GITHUB_APP_ID, get_private_key
+
+# Installation tokens live for an hour, refresh them this many seconds early
+# so callers never get a token that expires mid-request
+INSTALLATION_TOKEN_REFRESH_MARGIN = int(os.getenv("INSTALLATION_TOKEN_REFRESH_MARGIN", 300))
+# GitHub accepts app JWTs valid for up to 10 minutes
+APP_JWT_TTL = 540
+APP_JWT_REFRESH_MARGIN = 60
+# How long a refresh may hold the lock, and how long other callers wait for it
+TOKEN_LOCK_TIMEOUT = 30
+TOKEN_LOCK_WAIT = 15
+
+_installation_tokens = {}
+_app_jwt = None
+_lock = threading.Lock()
+
+
+def installation_token_key(installation_id) -> str:
+    return f"installation_token:{installation_id}"
+
+
+def installation_token_lock_key(installation_id) -> str:
+    return f"installation_token_lock:{installation_id}"
+
+
+@lru_cache(maxsize=1)
+def get_signing_key():
+    """The app's private key, read and parsed once per process"""
+    return jwk.construct(get_private_key(), "RS256")
+
+
+@lru_cache(maxsize=1)
+def get_verifying_key():
+    return get_signing_key().public_key()
+
+
+def get_app_jwt() -> str:
+    """App JWT for authenticating as the GitHub App, re-signed shortly before it expires"""
+    global _app_jwt
+    now = int(time.time())
+    with _lock:
+        if _app_jwt and _app_jwt[1] - APP_JWT_REFRESH_MARGIN > now:
+            return _app_jwt[0]
+        # iat is backdated to allow for clock drift with GitHub
+        token = jwt.encode(
+            {"iat": now - 60, "exp": now + APP_JWT_TTL, "iss": GITHUB_APP_ID},
+            get_signing_key(),
+            algorithm="RS256"
+        )
+        _app_jwt = (token, now + APP_JWT_TTL)
+        return token
+
+
+def generate_new_installation_token(installation_id: str):
+    """Mints an installation token. Returns the token and its expiry as a unix timestamp."""
+    token_response = github_request(
+        "POST",
+        f"/app/installations/{installation_id}/access_tokens",
+        token=get_app_jwt()
+    )
+    token_response.raise_for_status()
+    json_response = token_response.json()
+    expires_at = datetime.strptime(json_response["expires_at"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    return json_response["token"], expires_at.timestamp()
+
+
+def _fresh(entry) -> bool:
+    return entry is not None and entry[1] - INSTALLATION_TOKEN_REFRESH_MARGIN > time.time()
+
+
+def _read_shared_token(redis, installation_id):
+    value = redis.get(installation_token_key(installation_id))
+    if not value:
+        return None
+    value = json.loads(value)
+    return value["token"], value["expires_at"]
+
+
+def _refresh_installation_token(redis, installation_id):
+    """
+    Mints a new token and shares it through Redis. Holds a Redis lock while doing
+    so, callers that lose the race wait for it and use the token it stored.
+    """
+    lock = redis.lock(installation_token_lock_key(installation_id), timeout=TOKEN_LOCK_TIMEOUT, blocking_timeout=TOKEN_LOCK_WAIT)
+    acquired = lock.acquire()
+    try:
+        # Someone else may have refreshed while we waited on the lock
+        entry = _read_shared_token(redis, installation_id)
+        if _fresh(entry):
+            return entry
+        if not acquired:
+            print(f"Timed out waiting on the token lock for installation {installation_id}, minting anyway")
+        token, expires_at = generate_new_installation_token(installation_id)
+        ttl = int(expires_at - time.time())
+        if ttl > 0:
+            redis.set(
+                installation_token_key(installation_id),
+                json.dumps({"token": token, "expires_at": expires_at}),
+                ex=ttl
+            )
+        return token, expires_at
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockError:
+                # The lock timed out while we were minting
+                pass
+
+
+def get_installation_token(installation_id) -> str:
+    """
+    Installation token for GitHub API calls, served from the process cache, then
+    Redis, and only minted when neither holds one that is still comfortably valid.
+    """
+    installation_id = str(installation_id)
+    entry = _installation_tokens.get(installation_id)
+    if _fresh(entry):
+        return entry[0]
+
+    redis = get_sync_redis()
+    entry = _read_shared_token(redis, installation_id)
+    if not _fresh(entry):
+        entry = _refresh_installation_token(redis, installation_id)
+    _installation_tokens[installation_id] = entry
+    return entry[0]
+
+
+async def get_or_refresh_installation_token(installation_id) -> str:
+    entry = _installation_tokens.get(str(installation_id))
+    if _fresh(entry):
+        return entry[0]
+    return await asyncio.to_thread(get_installation_token, installation_id)
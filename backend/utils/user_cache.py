@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+
+from db import AsyncSessionLocal, SessionLocal
+from models.user import User
+
+# Authenticated users are served from this per process cache for up to
+# USER_CACHE_TTL seconds, so polling the dashboard does not hit Postgres
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Detached snapshot of a User row, safe to share between requests"""
+    id: int
+    username: str
+    name: Optional[str]
+    email: Optional[str]
+    avatar_url: Optional[str]
+    github_id: int
+    bio: Optional[str]
+    created_at: datetime
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            name=user.name,
+            email=user.email,
+            avatar_url=user.avatar_url,
+            github_id=user.github_id,
+            bio=user.bio,
+            created_at=user.created_at,
+        )
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_cached_user(user_id: int) -> Optional[UserPrincipal]:
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at < time.monotonic():
+            del _cache[user_id]
+            return None
+        _cache.move_to_end(user_id)
+        return principal
+
+
+def cache_user(principal: UserPrincipal):
+    with _lock:
+        _cache[principal.id] = (time.monotonic() + USER_CACHE_TTL, principal)
+        _cache.move_to_end(principal.id)
+        while len(_cache) > USER_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def invalidate_user(user_id: int):
+    """Drops a cached user, call after changing or deleting the row"""
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def load_user(user_id: int) -> Optional[UserPrincipal]:
+    """Reads the user from the database and caches it. Blocking, keep it off the event loop."""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            return None
+        principal = UserPrincipal.from_user(user)
+    finally:
+        db.close()
+    cache_user(principal)
+    return principal
+
+
+async def aload_user(user_id: int) -> Optional[UserPrincipal]:
+    """Async variant of load_user, for the event loop"""
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+        if not user:
+            return None
+        principal = UserPrincipal.from_user(user)
+    cache_user(principal)
+    return principal
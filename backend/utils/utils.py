@@ -2,13 +2,12 @@ import random
 import string
 import uuid
 
-from db import get_db
+from db import session_scope
 from models.taskLog import Task
 
 
-def add_task(task_type, status, celery_task_id=None, pr_id=None, merge_id=None, task_id=None):
-    """Add a new task to the database."""
-    db = next(get_db())
+def add_task(task_type, status, celery_task_id=None, pr_id=None, merge_id=None, task_id=None, db=None):
+    """Add a new task to the database. When a session is passed in, the caller commits."""
     if not task_id:
         task_id = str(uuid.uuid4())
     task = Task(
@@ -19,9 +18,14 @@ def add_task(task_type, status, celery_task_id=None, pr_id=None, merge_id=None,
         merge_id=merge_id,
         celery_task_id=celery_task_id
     )
-    db.add(task)
-    db.commit()
-    db.refresh(task)
+    if db is not None:
+        db.add(task)
+        return task
+    with session_scope() as db:
+        db.add(task)
+        db.flush()
+        # Detached with its attributes loaded, so it stays readable after the session closes
+        db.expunge(task)
     return task
 
 def generate_random_alphanumeric_string(length=16):
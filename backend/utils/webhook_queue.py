@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+from redis.exceptions import RedisError, ResponseError
+
+from db import session_scope
+from redis_setup import get_redis, get_sync_redis
+from utils.event_routing import event_label, route_event, dispatch_events
+from utils.metrics import WEBHOOK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_STREAM = "webhook_events"
+WEBHOOK_CONSUMER_GROUP = "webhook-routers"
+# Approximate cap on buffered deliveries, oldest are trimmed first
+WEBHOOK_STREAM_MAXLEN = int(os.getenv("WEBHOOK_STREAM_MAXLEN", 100000))
+# GitHub redelivers for up to a few days, so remember delivery ids that long
+WEBHOOK_DEDUPE_TTL = int(os.getenv("WEBHOOK_DEDUPE_TTL", 3 * 24 * 3600))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 100))
+WEBHOOK_BLOCK_MS = 2000
+# Deliveries a crashed consumer left unacknowledged are picked up after this long
+WEBHOOK_CLAIM_IDLE_MS = int(os.getenv("WEBHOOK_CLAIM_IDLE_MS", 60000))
+# Deliveries still failing after this many attempts are moved to the dead
+# letter stream for inspection instead of being claimed again forever
+WEBHOOK_MAX_DELIVERIES = int(os.getenv("WEBHOOK_MAX_DELIVERIES", 5))
+WEBHOOK_DEAD_LETTER_STREAM = "webhook_events:dead"
+
+# Dedupe and append in one round trip, atomically
+ENQUEUE_SCRIPT = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    return redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', 'event', ARGV[3], 'delivery', ARGV[4], 'payload', ARGV[5])
+end
+return false
+"""
+
+
+async def enqueue_webhook(event_type: str, delivery_id: str, body: bytes):
+    """
+    Appends a verified delivery to the webhook stream.
+    Returns the stream entry id, or None if the delivery was already received.
+    """
+    if not delivery_id:
+        delivery_id = hashlib.sha256(body).hexdigest()
+    r = get_redis()
+    entry_id = await r.eval(
+        ENQUEUE_SCRIPT, 2,
+        f"webhook_delivery:{delivery_id}", WEBHOOK_STREAM,
+        WEBHOOK_DEDUPE_TTL, WEBHOOK_STREAM_MAXLEN, event_type or "", delivery_id, body
+    )
+    return entry_id or None
+
+
+def ensure_consumer_group(r):
+    try:
+        r.xgroup_create(WEBHOOK_STREAM, WEBHOOK_CONSUMER_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def webhook_task_id(message_id: str, index: int) -> str:
+    """Celery task id of a delivery's index-th task, the same every time the delivery is processed"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{WEBHOOK_STREAM}/{message_id}/{index}"))
+
+
+def dispatched_key(celery_task_id: str) -> str:
+    return f"webhook_dispatched:{celery_task_id}"
+
+
+def delivery_counts(r, consumer: str, messages) -> dict:
+    """How many times each of the consumer's pending messages has been delivered"""
+    pending = r.xpending_range(
+        WEBHOOK_STREAM, WEBHOOK_CONSUMER_GROUP, min=messages[0][0], max=messages[-1][0],
+        count=len(messages), consumername=consumer
+    )
+    return {entry["message_id"]: entry["times_delivered"] for entry in pending}
+
+
+def dead_letter(r, messages, deliveries: dict):
+    """Moves deliveries off the webhook stream into the dead letter stream, atomically"""
+    pipe = r.pipeline()
+    for message_id, fields in messages:
+        logger.error(f"Dead lettering webhook delivery {fields.get('delivery')} after {deliveries[message_id]} attempts")
+        pipe.xadd(
+            WEBHOOK_DEAD_LETTER_STREAM, {**fields, "message_id": message_id, "deliveries": deliveries[message_id]},
+            maxlen=WEBHOOK_STREAM_MAXLEN, approximate=True
+        )
+    pipe.xack(WEBHOOK_STREAM, WEBHOOK_CONSUMER_GROUP, *[message_id for message_id, _ in messages])
+    pipe.execute()
+
+
+def dispatch_messages(r, messages):
+    """
+    Routes deliveries, records their tasks in a single commit and acknowledges
+    them. Deliveries that cannot be routed are logged and dropped. Task ids are
+    derived from the stream entries, and the tasks Celery already has are
+    remembered, so processing a delivery again only sends what is missing.
+    """
+    routed = []
+    for message_id, fields in messages:
+        started = time.perf_counter()
+        try:
+            events = route_event(fields["event"], json.loads(fields["payload"]))
+        except ValueError as e:
+            logger.warning(f"Dropping webhook delivery {fields.get('delivery')}: {e}")
+            events = []
+        WEBHOOK_SECONDS.labels(stage="route", event=event_label(fields["event"])).observe(time.perf_counter() - started)
+        routed.extend(
+            (task_type, signature, webhook_task_id(message_id, index))
+            for index, (task_type, signature) in enumerate(events or [])
+        )
+    ids = [celery_task_id for _, _, celery_task_id in routed]
+    sent = {celery_task_id for celery_task_id, flag in zip(ids, r.mget([dispatched_key(i) for i in ids])) if flag} if ids else set()
+    with session_scope() as db:
+        dispatch_events(
+            db, routed, sent=sent,
+            mark_sent=lambda celery_task_id: r.set(dispatched_key(celery_task_id), 1, ex=WEBHOOK_DEDUPE_TTL)
+        )
+    r.xack(WEBHOOK_STREAM, WEBHOOK_CONSUMER_GROUP, *[message_id for message_id, _ in messages])
+
+
+def process_batch(r, consumer: str, messages):
+    """
+    Dispatches a batch of deliveries. Deliveries past WEBHOOK_MAX_DELIVERIES
+    are dead lettered first. If the batch fails its deliveries are retried one
+    by one, so a bad delivery only holds back itself; it stays pending and is
+    claimed again once idle.
+    """
+    # Trimmed from the stream before they could be claimed
+    trimmed = [message_id for message_id, fields in messages if not fields]
+    if trimmed:
+        r.xack(WEBHOOK_STREAM, WEBHOOK_CONSUMER_GROUP, *trimmed)
+    messages = [(message_id, fields) for message_id, fields in messages if fields]
+    if not messages:
+        return
+
+    deliveries = delivery_counts(r, consumer, messages)
+    poisoned = [message for message in messages if deliveries.get(message[0], 1) > WEBHOOK_MAX_DELIVERIES]
+    if poisoned:
+        dead_letter(r, poisoned, deliveries)
+        messages = [message for message in messages if message not in poisoned]
+    if not messages:
+        return
+
+    if len(messages) > 1:
+        try:
+            dispatch_messages(r, messages)
+            return
+        except RedisError:
+            raise
+        except Exception as e:
+            logger.warning(f"Webhook batch failed, dispatching its {len(messages)} deliveries one by one: {e}")
+    for message in messages:
+        try:
+            dispatch_messages(r, [message])
+        except RedisError:
+            raise
+        except Exception as e:
+            logger.error(f"Error routing webhook delivery {message[1].get('delivery')}: {e}")
+
+
+def consume_webhook_events():
+    r = get_sync_redis()
+    ensure_consumer_group(r)
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    logger.info(f"Consuming {WEBHOOK_STREAM} as {consumer}")
+    while True:
+        try:
+            _, claimed, _ = r.xautoclaim(
+                WEBHOOK_STREAM, WEBHOOK_CONSUMER_GROUP, consumer,
+                min_idle_time=WEBHOOK_CLAIM_IDLE_MS, count=WEBHOOK_BATCH_SIZE
+            )
+            if claimed:
+                process_batch(r, consumer, claimed)
+            response = r.xreadgroup(
+                WEBHOOK_CONSUMER_GROUP, consumer, {WEBHOOK_STREAM: ">"},
+                count=WEBHOOK_BATCH_SIZE, block=WEBHOOK_BLOCK_MS
+            )
+            for _, messages in response or []:
+                process_batch(r, consumer, messages)
+        except RedisError as e:
+            logger.error(f"Webhook consumer Redis error: {e}")
+            time.sleep(1)
+        except Exception as e:
+            # Left pending, the delivery is claimed again once it goes idle
+            logger.error(f"Error routing webhook delivery: {e}")
+            time.sleep(1)
@@ -0,0 +1,13 @@
+from dotenv import load_dotenv
+load_dotenv()
+from logger import setup_logging
+from utils.webhook_queue import consume_webhook_events
+# Registers the session listeners keeping the task counters current
+import utils.live_counters
+from utils.metrics import WEBHOOK_CONSUMER_METRICS_PORT, start_metrics_server
+
+
+if __name__ == "__main__":
+    setup_logging()
+    start_metrics_server(WEBHOOK_CONSUMER_METRICS_PORT)
+    consume_webhook_events()
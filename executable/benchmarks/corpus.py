@@ -0,0 +1,163 @@
+"""
+Synthetic corpus of conflicted files for the resolver benchmarks.
+
+Files are generated deterministically from a seed, across languages and sizes,
+with a known kind for every conflict hunk so rule hit rates can be measured.
+
+Usage (from executable/):
+    python -m benchmarks.corpus --out /tmp/conflict-corpus
+"""
+import argparse
+import json
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List
+
+# Hunk kinds, and the rule expected to resolve them (None: needs the LLM)
+EXPECTED_RULES = {
+    "identical": "identical",
+    "one_side_empty": "one_side_empty",
+    "diff3_unchanged_side": "diff3_unchanged_side",
+    "version_bump": "version_bump",
+    "import_union": "import_union",
+    "whitespace_only": "whitespace_only",
+    "semantic": None,
+}
+
+# Lines per file for each size, "generated" stands in for lockfiles and bundles
+SIZES = {
+    "small": 60,
+    "medium": 1500,
+    "large": 20000,
+    "generated": 120000,
+}
+
+LANGUAGES = ["python", "javascript", "go", "requirements"]
+
+
+@dataclass
+class CorpusFile:
+    name: str
+    language: str
+    size: str
+    content: str
+    hunk_kinds: List[str] = field(default_factory=list)
+
+
+def _filler(language: str, rng: random.Random, index: int) -> str:
+    n = rng.randint(0, 999)
+    if language == "python":
+        return f"    value_{index} = compute({n})  # step {index}\n"
+    if language == "javascript":
+        return f"  const value{index} = compute({n}); // step {index}\n"
+    if language == "go":
+        return f"\tvalue{index} := compute({n}) // step {index}\n"
+    return f"package-{index}=={n // 100}.{n // 10 % 10}.{n % 10}\n"
+
+
+def _block_header(language: str, index: int) -> str:
+    if language == "python":
+        return f"\ndef function_{index}(value):\n"
+    if language == "javascript":
+        return f"\nfunction function{index}(value) {{\n"
+    if language == "go":
+        return f"\nfunc Function{index}(value int) {{\n"
+    return f"# section {index}\n"
+
+
+def _imports(language: str, names: List[str]) -> str:
+    if language == "python":
+        return "".join(f"import {name}\n" for name in names)
+    if language == "javascript":
+        return "".join(f"const {name} = require('{name}');\n" for name in names)
+    if language == "go":
+        return "".join(f'import "{name}"\n' for name in names)
+    return "".join(f"requirements-{name}\n" for name in names)
+
+
+def _sides(kind: str, language: str, rng: random.Random):
+    """Returns (ours, theirs, base) for a hunk of the given kind, base None outside diff3"""
+    n = rng.randint(1, 99)
+    line = _filler(language, rng, n)
+    if kind == "identical":
+        return line, line.replace("  ", " "), None
+    if kind == "one_side_empty":
+        return (line, "", None) if rng.random() < 0.5 else ("", line, None)
+    if kind == "diff3_unchanged_side":
+        changed = line.replace("compute", "compute_fast")
+        return (line, changed, line) if rng.random() < 0.5 else (changed, line, line)
+    if kind == "version_bump":
+        # The bumped side keeps the old version in a comment, as changelog style bumps do
+        return f'version = "1.{n}.1"  # was 1.{n}.0\n', f'version = "1.{n}.0"\n', None
+    if kind == "import_union":
+        names = ["os", "sys", "json", "re", "time", "math", "random", "logging"]
+        rng.shuffle(names)
+        return _imports(language, names[:3]), _imports(language, names[2:5]), None
+    if kind == "whitespace_only":
+        return line, line.replace(" = ", "=").replace(" := ", ":=").replace("==", " == "), None
+    return line, line.replace("compute", "compute_checked").replace("step", "stage").replace("==", ">="), None
+
+
+def generate_file(name: str, language: str, size: str, hunks: int, seed: int, conflict_style: str = "merge") -> CorpusFile:
+    rng = random.Random(seed)
+    lines = SIZES[size]
+    per_block = max(lines // (hunks + 1), 1)
+    kinds = [kind for kind in EXPECTED_RULES if conflict_style == "diff3" or kind != "diff3_unchanged_side"]
+    parts = []
+    hunk_kinds = []
+    for block in range(hunks + 1):
+        parts.append(_block_header(language, block))
+        parts.extend(_filler(language, rng, i) for i in range(per_block))
+        if block == hunks:
+            break
+        kind = rng.choice(kinds)
+        ours, theirs, base = _sides(kind, language, rng)
+        label = rng.choice(["HEAD", "main", "feature/retries", "a1b2c3d (Add retries)"])
+        parts.append(f"<<<<<<< {label}\n{ours}")
+        if conflict_style == "diff3":
+            # Kinds without a meaningful ancestor get one neither side kept
+            if base is None:
+                base = _filler(language, rng, block).replace("compute", "compute_legacy")
+            parts.append(f"||||||| merged common ancestors\n{base}")
+        parts.append(f"=======\n{theirs}>>>>>>> {label}-other\n")
+        hunk_kinds.append(kind)
+    return CorpusFile(name=name, language=language, size=size, content="".join(parts), hunk_kinds=hunk_kinds)
+
+
+def generate_corpus(seed: int = 0) -> List[CorpusFile]:
+    """The standard corpus, every language in every size and both conflict styles"""
+    rng = random.Random(seed)
+    files = []
+    for size, lines in SIZES.items():
+        languages = LANGUAGES if size != "generated" else ["requirements", "javascript"]
+        for language in languages:
+            for conflict_style in ("merge", "diff3"):
+                hunks = max(min(lines // 40, 400), 3)
+                name = f"{size}-{language}-{conflict_style}"
+                files.append(generate_file(name, language, size, hunks, rng.randint(0, 2 ** 31), conflict_style))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the synthetic conflict corpus to a directory")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for corpus_file in generate_corpus(args.seed):
+        (out / corpus_file.name).write_text(corpus_file.content, encoding="utf-8")
+        manifest[corpus_file.name] = {
+            "language": corpus_file.language,
+            "size": corpus_file.size,
+            "hunk_kinds": corpus_file.hunk_kinds,
+        }
+    (out / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    print(f"Wrote {len(manifest)} files to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark for conflict resolution on large conflicted files.
+
+Compares the block regex + per chunk str.replace path with the single pass
+parser + offset splice, on generated files of a few MB with hundreds of
+conflict hunks.
+
+Usage (from executable/):
+    python -m benchmarks.parser_benchmark [--size-mb 4] [--hunks 500]
+"""
+import argparse
+import random
+import time
+
+from conflict_parser import parse_conflict_hunks
+from utils import extract_semantic_conflict_blocks, resolve_simple_conflicts, try_simple_resolve
+
+HUNK_TEMPLATES = [
+    # (ours, theirs, base) - base only for diff3 style hunks
+    ("import os\nimport sys\n", "import os\nimport json\n", None),
+    ("version = \"1.2.{n}\"\n", "version = \"1.2.{m}\"\n", None),
+    ("    return value  \n", "    return value\n", None),
+    ("    total = compute({n})\n", "    total = compute_fast({n})\n", "    total = compute(0)\n"),
+    ("    retries = {n}\n", "    retries = {m}\n", None),
+]
+
+
+def generate_file(size_mb: float, hunks: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    filler_lines = max(target // (hunks + 1) // 40, 1)
+    parts = []
+    for i in range(hunks + 1):
+        parts.append(f"def function_{i}(value):\n")
+        parts.extend(f"    value = value + {j}  # filler line\n" for j in range(filler_lines))
+        if i == hunks:
+            break
+        ours, theirs, base = rng.choice(HUNK_TEMPLATES)
+        n, m = rng.randint(1, 99), rng.randint(1, 99)
+        label = rng.choice(["HEAD", "main", "feature/x", "a1b2c3d (Add retries)"])
+        parts.append(f"<<<<<<< {label}\n{ours.format(n=n, m=m)}")
+        if base is not None:
+            parts.append(f"||||||| merged common ancestors\n{base}")
+        parts.append(f"=======\n{theirs.format(n=n, m=m)}>>>>>>> {label}-other\n")
+    return "".join(parts)
+
+
+def time_it(fn, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def legacy_resolve(content: str):
+    file = content
+    unresolved = 0
+    for chunk in extract_semantic_conflict_blocks(content):
+        resolution = try_simple_resolve(file, chunk)
+        if resolution:
+            file = resolution
+        else:
+            unresolved += 1
+    return file, unresolved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conflict parsing and resolution")
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--hunks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip the regex + str.replace path")
+    args = parser.parse_args()
+
+    content = generate_file(args.size_mb, args.hunks)
+    print(f"File: {len(content) / 1024 / 1024:.1f} MB, {args.hunks} hunks")
+
+    elapsed, hunks = time_it(lambda: parse_conflict_hunks(content), args.repeat)
+    print(f"parse_conflict_hunks:      {elapsed * 1000:8.1f} ms ({len(hunks)} hunks)")
+
+    elapsed, (_, _, unresolved) = time_it(lambda: resolve_simple_conflicts(content), args.repeat)
+    print(f"resolve_simple_conflicts:  {elapsed * 1000:8.1f} ms ({unresolved} unresolved)")
+
+    if not args.skip_legacy:
+        elapsed, (_, unresolved) = time_it(lambda: legacy_resolve(content), args.repeat)
+        print(f"regex + str.replace:       {elapsed * 1000:8.1f} ms ({unresolved} unresolved chunks)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Offline benchmark suite for the CLI's local conflict resolution.
+
+Runs every case over the synthetic corpus (see benchmarks.corpus) and reports
+throughput, peak memory and, per simple rule, how many of the hunks it is
+meant for it actually resolves. With --check the results are compared with
+baseline.json and the run fails on a regression.
+
+Absolute throughput depends on the machine, so --check compares each case's
+throughput relative to the legacy extract-and-resolve path, timed in turns
+with it in the same run, which a faster or slower machine scales alike.
+
+Usage (from executable/):
+    python -m benchmarks.run_benchmarks [--check] [--update-baseline]
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.corpus import EXPECTED_RULES, generate_corpus, generate_file
+from conflict_parser import parse_conflict_hunks
+from utils import apply_simple_rules, extract_semantic_conflict_blocks, match_rule, resolve_simple_conflicts, try_simple_resolve
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+# Case every throughput is expressed relative to, see the module docstring
+REFERENCE_CASE = "extract_and_try_simple_resolve"
+# Relative throughput may drop this much below the baseline before --check
+# fails, timings on shared machines still swing by about a quarter run to run
+DEFAULT_THROUGHPUT_TOLERANCE = 0.4
+# Peak memory may grow this much over the baseline, plus a fixed allowance so
+# sub-megabyte peaks do not fail on interpreter noise
+PEAK_MEMORY_TOLERANCE = 0.2
+PEAK_MEMORY_SLACK_MB = 0.25
+# Hit rates are deterministic, any drop beyond rounding is a regression
+HIT_RATE_TOLERANCE = 0.001
+# Pathological inputs must finish within this many seconds
+PATHOLOGICAL_BUDGET = 5.0
+
+
+def legacy_resolve(content: str):
+    file = content
+    for chunk in extract_semantic_conflict_blocks(content):
+        resolution = try_simple_resolve(file, chunk)
+        if resolution:
+            file = resolution
+    return file
+
+
+def time_once(fn, inputs) -> float:
+    started = time.perf_counter()
+    for value in inputs:
+        fn(value)
+    return time.perf_counter() - started
+
+
+def measure(fn, inputs, repeat: int):
+    """Best of repeat runs of fn over all inputs, with the peak memory of one run"""
+    best = min(time_once(fn, inputs) for _ in range(repeat))
+
+    tracemalloc.start()
+    for value in inputs:
+        fn(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def relative_throughput(fn, inputs, reference, repeat: int) -> float:
+    """
+    Throughput of fn as a multiple of the reference case's, from the best of
+    repeat runs of each. Their runs alternate so both see the same load.
+    """
+    reference_fn, reference_inputs = reference
+    runs = [(time_once(fn, inputs), time_once(reference_fn, reference_inputs)) for _ in range(repeat)]
+    best = min(elapsed for elapsed, _ in runs)
+    best_reference = min(elapsed for _, elapsed in runs)
+    return (len(inputs) / best) / (len(reference_inputs) / best_reference)
+
+
+def throughput_cases(corpus):
+    contents = [corpus_file.content for corpus_file in corpus]
+    chunks = [chunk for content in contents for chunk in extract_semantic_conflict_blocks(content)]
+    return {
+        "parse_conflict_hunks": (parse_conflict_hunks, contents),
+        "resolve_simple_conflicts": (resolve_simple_conflicts, contents),
+        "extract_semantic_conflict_blocks": (extract_semantic_conflict_blocks, contents),
+        "apply_simple_rules": (apply_simple_rules, chunks),
+        "extract_and_try_simple_resolve": (legacy_resolve, contents),
+    }
+
+
+def pathological_cases():
+    """Inputs that are cheap for a linear scan but expensive for the block regex"""
+    one_huge_block = "def everything(value):\n" + "    value += 1\n" * 400000
+    one_huge_block += "<<<<<<< HEAD\nx = 1\n=======\nx = 2\n>>>>>>> other\n"
+    no_blocks = "value = 1\n" * 400000 + "<<<<<<< HEAD\nx = 1\n=======\nx = 2\n>>>>>>> other\n"
+    many_tiny_blocks = "def f():\n    pass\n" * 100000
+    near_miss_keywords = "\ndef\n" * 200000 + "<<<<<<< HEAD\nx = 1\n=======\nx = 2\n>>>>>>> other\n"
+    many_hunks = generate_file("many-hunks", "python", "large", 2000, seed=1).content
+    return {
+        "one_huge_block": one_huge_block,
+        "no_blocks": no_blocks,
+        "many_tiny_blocks": many_tiny_blocks,
+        "near_miss_keywords": near_miss_keywords,
+        "many_hunks": many_hunks,
+    }
+
+
+def rule_hit_rates(corpus):
+    """For each rule, the share of the hunks meant for it that it resolves"""
+    expected = Counter()
+    hits = Counter()
+    false_hits = Counter()
+    for corpus_file in corpus:
+        hunks = parse_conflict_hunks(corpus_file.content)
+        for hunk, kind in zip(hunks, corpus_file.hunk_kinds):
+            rule = EXPECTED_RULES[kind]
+            match = match_rule(hunk)
+            matched = match[0] if match else None
+            if rule is None:
+                if matched is not None:
+                    false_hits[matched] += 1
+                continue
+            expected[rule] += 1
+            if matched == rule:
+                hits[rule] += 1
+            elif matched is not None:
+                false_hits[matched] += 1
+    return {
+        rule: {
+            "hunks": expected[rule],
+            "hit_rate": round(hits[rule] / expected[rule], 4) if expected[rule] else None,
+            "false_hits": false_hits[rule],
+        }
+        for rule in sorted(set(EXPECTED_RULES.values()) - {None})
+    }
+
+
+def run(repeat: int):
+    corpus = generate_corpus()
+    total_bytes = sum(len(corpus_file.content) for corpus_file in corpus)
+    total_hunks = sum(len(corpus_file.hunk_kinds) for corpus_file in corpus)
+    print(f"Corpus: {len(corpus)} files, {total_bytes / 1024 / 1024:.1f} MB, {total_hunks} hunks\n")
+
+    results = {"throughput": {}, "pathological": {}, "rules": rule_hit_rates(corpus)}
+
+    print(f"{'case':36} {'ops/s':>10} {'MB/s':>8} {'peak MB':>8} {'relative':>9}")
+    cases = throughput_cases(corpus)
+    for name, (fn, inputs) in cases.items():
+        elapsed, peak = measure(fn, inputs, repeat)
+        input_bytes = sum(len(value) for value in inputs)
+        results["throughput"][name] = {
+            "ops_per_sec": round(len(inputs) / elapsed, 2),
+            "mb_per_sec": round(input_bytes / 1024 / 1024 / elapsed, 2),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+            "relative": 1.0 if name == REFERENCE_CASE else
+                round(relative_throughput(fn, inputs, cases[REFERENCE_CASE], repeat), 3),
+        }
+        row = results["throughput"][name]
+        print(f"{name:36} {row['ops_per_sec']:>10} {row['mb_per_sec']:>8} {row['peak_mb']:>8} {row['relative']:>9}")
+
+    print(f"\n{'pathological input':36} {'parser s':>10} {'regex s':>8}")
+    for name, content in pathological_cases().items():
+        parser_elapsed, _ = measure(resolve_simple_conflicts, [content], 1)
+        regex_elapsed, _ = measure(legacy_resolve, [content], 1)
+        results["pathological"][name] = {
+            "parser_seconds": round(parser_elapsed, 4),
+            "regex_seconds": round(regex_elapsed, 4),
+        }
+        print(f"{name:36} {parser_elapsed:>10.4f} {regex_elapsed:>8.4f}")
+
+    print(f"\n{'rule':24} {'hunks':>6} {'hit rate':>9} {'false hits':>11}")
+    for rule, row in results["rules"].items():
+        hit_rate = "-" if row["hit_rate"] is None else f"{row['hit_rate']:.1%}"
+        print(f"{rule:24} {row['hunks']:>6} {hit_rate:>9} {row['false_hits']:>11}")
+    return results
+
+
+def check(results, baseline, tolerance: float):
+    """Returns the regressions of results against the baseline"""
+    failures = []
+    for name, row in baseline["throughput"].items():
+        current = results["throughput"].get(name)
+        if not current:
+            continue
+        if current["relative"] < row["relative"] * (1 - tolerance):
+            failures.append(f"{name}: {current['relative']}x {REFERENCE_CASE}, baseline {row['relative']}x")
+        if current["peak_mb"] > row["peak_mb"] * (1 + PEAK_MEMORY_TOLERANCE) + PEAK_MEMORY_SLACK_MB:
+            failures.append(f"{name}: peak {current['peak_mb']} MB, baseline {row['peak_mb']} MB")
+    for name, row in baseline["rules"].items():
+        current = results["rules"].get(name)
+        if current and row["hit_rate"] is not None and (current["hit_rate"] or 0) < row["hit_rate"] - HIT_RATE_TOLERANCE:
+            failures.append(f"rule {name}: hit rate {current['hit_rate']}, baseline {row['hit_rate']}")
+        if current and current["false_hits"] > row["false_hits"]:
+            failures.append(f"rule {name}: {current['false_hits']} false hits, baseline {row['false_hits']}")
+    for name, row in results["pathological"].items():
+        if row["parser_seconds"] > PATHOLOGICAL_BUDGET:
+            failures.append(f"pathological {name}: parser took {row['parser_seconds']}s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local conflict resolution")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="Fail on regressions against baseline.json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_THROUGHPUT_TOLERANCE,
+                        help="Allowed drop of the relative throughput as a fraction of the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="Write these results to baseline.json")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"\nBaseline written to {BASELINE_PATH}")
+    if args.check:
+        failures = check(results, json.loads(BASELINE_PATH.read_text(encoding="utf-8")), args.tolerance)
+        if failures:
+            print("\nRegressions:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,68 +4,105 @@ import time
 import requests
 import sys
 import sseclient
-from utils import get_conflicted_files, extract_semantic_conflict_blocks, try_simple_resolve
+from utils import get_conflicted_files, resolve_simple_conflicts
 from uuid import uuid4
 
 API_URL = "https://git-sleuth-api.pubali.dev/"
+# The server sends a keepalive comment every 15s, so a silent minute means the stream is dead
+STREAM_READ_TIMEOUT = 60
+
+def stream_task_result(task_id):
+    """Subscribes to the task event stream and returns the result once the backend publishes it."""
+    print("Waiting on task stream for task id", task_id, flush=True)
+    with requests.get(
+        f"{API_URL}/stream-task/{task_id}",
+        headers={"Accept": "text/event-stream"},
+        stream=True,
+        timeout=(10, STREAM_READ_TIMEOUT)
+    ) as response:
+        response.raise_for_status()
+        client = sseclient.SSEClient(response)
+        for event in client.events():
+            if event.event == "result":
+                print("Task resolved", flush=True)
+                return json.loads(event.data)
+            if event.event == "timeout":
+                raise ValueError("Timed out waiting for task result")
+    raise ValueError("Task stream closed before a result was received")
+
+def poll_task_result(task_id):
+    """Polls the backend for the task result. Used when the event stream is unavailable."""
+    print("Polling for task id", task_id, flush=True)
+    while True:
+        result = requests.get(f"{API_URL}/get-task/{task_id}")
+        if result.status_code == 200:
+            result = result.json()
+            if result:
+                print("Task resolved", flush=True)
+                return json.loads(result)
+            else:
+                print("Task is being resolved")
+        else:
+            raise SystemError("Got unexpected response")
+        time.sleep(2)
+
+def wait_for_task_result(task_id):
+    try:
+        return stream_task_result(task_id)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Task stream unavailable ({e}), falling back to polling", flush=True)
+        return poll_task_result(task_id)
+
 def conflict_handler(merge_id):
     conflicted_files = get_conflicted_files()
     if len(conflicted_files) == 0:
         print("No merge conflicts found.")
         return
 
+    resolved_files = {}
+    unresolved_files = []
+    simple_resolved = 0
     for file_path in conflicted_files:
         with open(file_path, 'r', encoding='utf-8') as f:
             file_content = f.read()
-        conflict_blocks = extract_semantic_conflict_blocks(file_content)
-        not_resolved = []
-        file = file_content
-        for chunk in conflict_blocks:
-            resolution = try_simple_resolve(file, chunk)
-            if resolution:
-                file = resolution
-            else:
-                not_resolved.append(chunk)
-            
-        if len(not_resolved) > 0:
-            task_id = str(uuid4())
-            response = requests.post(API_URL+"/resolve_conflicts", json={
-                "file": file,
-                "file_path": file_path,
-                "task_id": task_id,
-                "merge_id": merge_id
-            })
-            if response.status_code != 200:
-                print(f"Error submitting task: {response.text}")
-                sys.exit(1)
+        file, resolved, not_resolved = resolve_simple_conflicts(file_content)
+        simple_resolved += resolved
             
-            result = None
-            # poll for result from backend
-            print("Task is queued", flush=True)
-            task_status = "queued"
-            print("Polling for task id", task_id, flush=True)
-            while True:
-                result = requests.get(f"{API_URL}/get-task/{task_id}")
-                if result.status_code == 200:
-                    result = result.json()
-                    if result:
-                        result = json.loads(result)
-                        print("Task resolved", flush=True)
-                        break
-                    else:
-                        task_status = "resolving"
-                        print("Task is being resolved")
-                else:
-                    raise SystemError("Got unexpected response")
-                time.sleep(2)
+        if not_resolved > 0:
+            unresolved_files.append({"file": file, "file_path": file_path})
+        else:
+            resolved_files[file_path] = file
 
-            
-            file = result['resolved_code']
-            branch = result['branch']
+    if unresolved_files:
+        # One job for the whole merge, the server resolves the files in parallel
+        task_id = str(uuid4())
+        response = requests.post(API_URL+"/resolve_merge", json={
+            "files": unresolved_files,
+            "task_id": task_id,
+            "merge_id": merge_id,
+            "simple_resolved": simple_resolved
+        })
+        if response.status_code != 200:
+            print(f"Error submitting task: {response.text}")
+            sys.exit(1)
+        
+        print(f"Task is queued for {len(unresolved_files)} files", flush=True)
+        result = wait_for_task_result(task_id)
+        if result.get("status") != "resolved":
+            print(f"Error resolving conflicts: {result.get('error')}")
+            sys.exit(1)
+
+        for resolved in result['files']:
+            resolved_files[resolved['file_path']] = resolved['resolved_code']
+        branch = result['branch']
+    else:
+        print("All conflicts resolved locally", flush=True)
+        branch = "auto-fix-" + uuid4().hex[:16]
 
     subprocess.run(["git", "checkout", "-b", branch], check=True)
-    with open(file_path, 'w', encoding='utf-8') as f:
+    for file_path, file in resolved_files.items():
+        with open(file_path, 'w', encoding='utf-8') as f:
             f.write(file)
     subprocess.run(["git", "add", "."], check=True)
     subprocess.run(["git", "commit", "-am", "auto-resolved merge"], check=True)
-    subprocess.run(["git", "push", "--set-upstream", "origin", branch], check=True)
\ No newline at end of file
+    subprocess.run(["git", "push", "--set-upstream", "origin", branch], check=True)
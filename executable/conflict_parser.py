@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+OURS_MARKER = "<<<<<<<"
+BASE_MARKER = "|||||||"
+SEPARATOR_MARKER = "======="
+THEIRS_MARKER = ">>>>>>>"
+
+
+@dataclass
+class ConflictHunk:
+    """
+    A single conflict region. start/end are offsets into the parsed content,
+    end is just past the closing marker's line break.
+    base is the common ancestor section (merge.conflictStyle=diff3/zdiff3),
+    None for the default merge style.
+    """
+    start: int
+    end: int
+    ours: str
+    theirs: str
+    base: Optional[str] = None
+    ours_label: str = ""
+    theirs_label: str = ""
+    base_label: Optional[str] = None
+
+
+def _marker(line: str, marker: str) -> Optional[str]:
+    """Returns the label after a conflict marker, or None if the line is not that marker"""
+    if not line.startswith(marker):
+        return None
+    rest = line[len(marker):]
+    if rest and rest[0] not in " \r\n":
+        return None
+    return rest.strip()
+
+
+def parse_conflict_hunks(content: str) -> List[ConflictHunk]:
+    """
+    Single pass, line oriented parser for git conflict markers. Handles any
+    branch labels and diff3 style base sections. A marker that opens inside
+    an unterminated hunk starts over from that marker.
+    """
+    hunks = []
+    state = None
+    start = 0
+    labels = {}
+    sections = {}
+    pos = 0
+    length = len(content)
+
+    while pos < length:
+        newline = content.find("\n", pos)
+        line_end = length if newline == -1 else newline + 1
+        line = content[pos:line_end]
+
+        label = _marker(line, OURS_MARKER)
+        if label is not None:
+            state = "ours"
+            start = pos
+            labels = {"ours": label, "base": None, "theirs": ""}
+            sections = {"ours": [], "base": None, "theirs": []}
+        elif state is None:
+            pass
+        elif state == "ours" and (label := _marker(line, BASE_MARKER)) is not None:
+            state = "base"
+            labels["base"] = label
+            sections["base"] = []
+        elif state in ("ours", "base") and _marker(line, SEPARATOR_MARKER) == "":
+            state = "theirs"
+        elif state == "theirs" and (label := _marker(line, THEIRS_MARKER)) is not None:
+            labels["theirs"] = label
+            hunks.append(ConflictHunk(
+                start=start,
+                end=line_end,
+                ours="".join(sections["ours"]),
+                theirs="".join(sections["theirs"]),
+                base=None if sections["base"] is None else "".join(sections["base"]),
+                ours_label=labels["ours"],
+                theirs_label=labels["theirs"],
+                base_label=labels["base"],
+            ))
+            state = None
+        else:
+            sections[state].append(line)
+
+        pos = line_end
+
+    return hunks
+
+
+def splice_resolutions(content: str, hunks: List[ConflictHunk], resolutions: Dict[int, str]) -> str:
+    """
+    Rebuilds content once, replacing hunks[i] with resolutions[i].
+    Hunks without a resolution are kept as they are.
+    """
+    parts = []
+    last = 0
+    for index, hunk in enumerate(hunks):
+        if index not in resolutions:
+            continue
+        resolution = resolutions[index]
+        # Keep the line break that followed the closing marker
+        if resolution and not resolution.endswith("\n") and content[hunk.end - 1:hunk.end] == "\n":
+            resolution += "\n"
+        parts.append(content[last:hunk.start])
+        parts.append(resolution)
+        last = hunk.end
+    parts.append(content[last:])
+    return "".join(parts)
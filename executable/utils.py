@@ -1,6 +1,8 @@
 import subprocess
 from typing import Optional, Tuple
 
+from conflict_parser import ConflictHunk, parse_conflict_hunks, splice_resolutions
+
 def get_conflicted_files():
     """Returns a list of file paths that have merge conflicts."""
     try:
@@ -68,66 +70,107 @@ def try_simple_resolve(file_content: str, conflict_chunk: str) -> Optional[str]:
     """
     Attempts to resolve conflicts using simple heuristics.
     Returns resolved file content if successful, None otherwise.
+    Prefer resolve_simple_conflicts, which works on the whole file in one pass.
     """
     
     if resolution := apply_simple_rules(conflict_chunk):
-        file_content = file_content.replace(conflict_chunk, resolution)
+        file_content = file_content.replace(conflict_chunk, resolution, 1)
         return file_content
     
     return None
 
 
+def resolve_simple_conflicts(file_content: str) -> Tuple[str, int, int]:
+    """
+    Applies the simple rules to every conflict hunk in the file and splices
+    the resolutions in with a single rebuild.
+    Returns the new content and the number of hunks resolved and left unresolved.
+    """
+    hunks = parse_conflict_hunks(file_content)
+    resolutions = {}
+    for index, hunk in enumerate(hunks):
+        resolution = resolve_hunk(hunk)
+        if resolution is not None:
+            resolutions[index] = resolution
+    return splice_resolutions(file_content, hunks, resolutions), len(resolutions), len(hunks) - len(resolutions)
+
 
 def apply_simple_rules(conflict_chunk: str) -> Optional[str]:
     """
-    Applies resolution rules to a single conflict chunk.
-    Returns resolved chunk if rule matches, None otherwise.
+    Applies resolution rules to the conflict hunks in a chunk.
+    Returns the resolved chunk if every hunk matched a rule, None otherwise.
     """
-    # Parse the conflict chunk
-    parsed = parse_conflict(conflict_chunk)
-    if not parsed:
+    hunks = parse_conflict_hunks(conflict_chunk)
+    if not hunks:
         return None
-    
-    head, base = parsed
+    resolutions = {}
+    for index, hunk in enumerate(hunks):
+        resolution = resolve_hunk(hunk)
+        if resolution is None:
+            return None
+        resolutions[index] = resolution
+    return splice_resolutions(conflict_chunk, hunks, resolutions)
+
+
+def resolve_hunk(hunk: ConflictHunk) -> Optional[str]:
+    """
+    Applies resolution rules to a single conflict hunk.
+    Returns resolved content if a rule matches, None otherwise.
+    """
+    if match := match_rule(hunk):
+        return match[1]
+    return None
+
+
+def match_rule(hunk: ConflictHunk) -> Optional[Tuple[str, str]]:
+    """
+    Finds the first resolution rule matching the hunk.
+    Returns (rule name, resolved content), or None if no rule matches.
+    """
+    head, base = hunk.ours.strip(), hunk.theirs.strip()
+
+    # Rule 0: With a diff3 base, a side that did not change defers to the other
+    if hunk.base is not None:
+        ancestor = hunk.base.strip()
+        if head == ancestor:
+            return "diff3_unchanged_side", base
+        if base == ancestor:
+            return "diff3_unchanged_side", head
     
     # Rule 1: Identical changes (except maybe whitespace)
     if normalize_code(head) == normalize_code(base):
-        return head  # arbitrary pick
+        return "identical", head  # arbitrary pick
     
     # Rule 2: One side is empty
     if not head.strip():
-        return base
+        return "one_side_empty", base
     if not base.strip():
-        return head
+        return "one_side_empty", head
     
     # Rule 3: Version number increments
     if is_version_bump(head, base):
-        return head  # typically take the higher version
+        return "version_bump", head  # typically take the higher version
     
     # Rule 4: Import/requirement changes (union)
     if is_import_conflict(head, base):
-        return merge_imports(head, base)
+        return "import_union", merge_imports(head, base)
     
     # Rule 5: Whitespace-only differences
     if re.sub(r'\s+', '', head) == re.sub(r'\s+', '', base):
-        return head  # prefer one style
+        return "whitespace_only", head  # prefer one style
     
     return None
 
 # Helper functions
 def parse_conflict(chunk: str) -> Optional[Tuple[str, str]]:
     """
-    Extracts HEAD and BASE parts from conflict marker
+    Extracts HEAD and BASE parts from the first conflict in a chunk
     Returns (head_content, base_content) or None if malformed
     """
-    match = re.match(
-        r'<<<<<<< HEAD\n(.*?)=======\n(.*?)>>>>>>> .+',
-        chunk,
-        re.DOTALL
-    )
-    if not match:
+    hunks = parse_conflict_hunks(chunk)
+    if not hunks:
         return None
-    return match.group(1).strip(), match.group(2).strip()
+    return hunks[0].ours.strip(), hunks[0].theirs.strip()
 
 def normalize_code(code: str) -> str:
     """Standardizes code for comparison"""
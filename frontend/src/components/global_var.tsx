@@ -45,26 +45,19 @@ interface pr {
   id : number;
   repo_id : number;
   pr_number : number;
-  installation_id : number;
   url : string;
-  github_id : number;
-  node_id : string;
   state : string;
   title : string;
   closed_at : Date | null;
   merged_at : Date | null;
   mergeable : boolean | null;
   commits : number;
-  details : string | null;
   created_at : Date;
 }
 
 export interface repository {
   id : number;
-  user_id : number;
-  installation_id : number;
   github_id : number;
-  node_id : string;
   name : string;
   full_name : string;
   private : boolean;
@@ -100,4 +93,5 @@ export type PRResponse = {
   "active_conflicts_suggestions": number,
   "resolved_conflicts_suggestions": number,
   "pr_info": Array<repository>,
+  "next_cursor": string | null,
 };
\ No newline at end of file
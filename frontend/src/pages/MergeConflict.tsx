@@ -14,12 +14,14 @@ export const MergeConflict = ({ activeTab }: ActiveTabProp) => {
   const [searchTerm, setSearchTerm] = useState('');
   const [filterStatus, setFilterStatus] = useState('all');
   const [isRefreshing, setIsRefreshing] = useState(false);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [data, setData] = useState<PRResponse>({
     "total_repos": 0,
     "total_prs": 0,
     "active_conflicts_suggestions": 0,
     "resolved_conflicts_suggestions": 0,
-    "pr_info": []
+    "pr_info": [],
+    "next_cursor": null
   });
 
   // Filter repositories based on search and conflict status
@@ -39,10 +41,10 @@ export const MergeConflict = ({ activeTab }: ActiveTabProp) => {
     return matchesSearch;
   });
 
-  const handleRefresh = () => {
-    setIsRefreshing(true);
-    const url = import.meta.env.VITE_API_URL + "/merge-details";
-    fetch(url, {
+  const fetchPage = (cursor: string | null): Promise<PRResponse> => {
+    const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const url = import.meta.env.VITE_API_URL + "/merge-details" + params;
+    return fetch(url, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
@@ -54,7 +56,12 @@ export const MergeConflict = ({ activeTab }: ActiveTabProp) => {
           throw new Error('Network response was not ok');
         }
         return response.json();
-      })
+      });
+  };
+
+  const handleRefresh = () => {
+    setIsRefreshing(true);
+    fetchPage(null)
       .then(data => {
         setData(data);
       })
@@ -63,6 +70,30 @@ export const MergeConflict = ({ activeTab }: ActiveTabProp) => {
       });
   };
 
+  const handleLoadMore = () => {
+    if (!data.next_cursor) return;
+    setIsLoadingMore(true);
+    fetchPage(data.next_cursor)
+      .then(page => {
+        setData(prev => {
+          // A repository whose PRs span two pages continues on the next one
+          const repos = [...prev.pr_info];
+          const [first, ...rest] = page.pr_info;
+          const last = repos[repos.length - 1];
+          if (first && last && first.id === last.id) {
+            repos[repos.length - 1] = { ...last, pull_requests: [...last.pull_requests, ...first.pull_requests] };
+            repos.push(...rest);
+          } else {
+            repos.push(...page.pr_info);
+          }
+          return { ...page, pr_info: repos };
+        });
+      })
+      .finally(() => {
+        setIsLoadingMore(false);
+      });
+  };
+
   useEffect(() => {
     handleRefresh();
   }, []);
@@ -94,6 +125,24 @@ export const MergeConflict = ({ activeTab }: ActiveTabProp) => {
           ))}
         </div>
 
+        {data.next_cursor && (
+          <div style={{ textAlign: 'center', marginTop: '2rem' }}>
+            <button
+              onClick={handleLoadMore}
+              disabled={isLoadingMore}
+              style={{
+                background: colors.surface,
+                color: colors.primary,
+                border: `1px solid ${colors.border}`,
+                borderRadius: '8px',
+                padding: '0.75rem 1.5rem',
+                cursor: isLoadingMore ? 'wait' : 'pointer'
+              }}>
+              {isLoadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          </div>
+        )}
+
         {filteredRepositories.length === 0 && (
           <div style={{ 
             textAlign: 'center', 